@@ -0,0 +1,224 @@
+import os
+import threading
+
+import numpy as np
+
+from web import render_placeholder
+
+# Daily equity; intraday series pass their own periods_per_year
+TRADING_DAYS = 252
+
+# Rolling volatility window, in periods
+ROLLING_WINDOW = 20
+
+# Annual risk-free rate subtracted for Sharpe/Sortino
+RISK_FREE_RATE = float(os.getenv("RISK_FREE_RATE", "0"))
+
+# Per-point arrays kept for the whole history; everything is a prefix
+# quantity, so a revision at index k only recomputes from k onward
+_FIELDS = (
+    't', 'equity', 'returns',
+    'cum_r', 'cum_r2', 'cum_down2',     # prefix sums for mean, variance, downside deviation
+    'peak', 'peak_t', 'drawdown', 'max_drawdown', 'max_underwater',
+    'rolling_vol',
+)
+
+
+class EquityAnalytics:
+    """Return and drawdown statistics over a growing equity series.
+
+    ``update`` takes (timestamp, equity) points such as a portfolio history
+    response. Points that match what is already stored are skipped; from the
+    first new or revised point on, returns, running peak, drawdown and the
+    prefix sums behind Sharpe/Sortino are extended from the state carried at
+    the point before, so a refresh costs the length of the change rather
+    than of the history. Readers get the last complete state without locking.
+    """
+
+    def __init__(self, window: int = ROLLING_WINDOW, periods_per_year: float = TRADING_DAYS,
+                 risk_free_rate: float = RISK_FREE_RATE):
+        self.window = window
+        self.periods_per_year = periods_per_year
+        self.risk_free_rate = risk_free_rate
+        self._state = {name: np.empty(0) for name in _FIELDS}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._state['t'])
+
+    def update(self, timestamps, equity) -> int:
+        """Merge new points; returns how many points were (re)computed."""
+        t = np.asarray(timestamps, dtype=np.float64)
+        eq = np.array([np.nan if e is None else e for e in equity], dtype=np.float64)
+        # Portfolio history reports null or zero equity for days before funding
+        valid = np.isfinite(eq) & (eq > 0)
+        t, eq = t[valid], eq[valid]
+        order = np.argsort(t, kind='stable')
+        t, eq = t[order], eq[order]
+        if not len(t):
+            return 0
+
+        with self._lock:
+            old = self._state
+            k = np.searchsorted(old['t'], t[0])
+            # Skip the leading stretch that repeats stored points exactly
+            overlap = min(len(old['t']) - k, len(t))
+            same = (old['t'][k:k + overlap] == t[:overlap]) & (old['equity'][k:k + overlap] == eq[:overlap])
+            skip = overlap if same.all() else int(np.argmin(same))
+            if skip == len(t):
+                return 0
+            k += skip
+            t, eq = t[skip:], eq[skip:]
+            # Anything stored after the last new point is kept and recomputed with it
+            tail = old['t'] > t[-1]
+            t = np.concatenate([t, old['t'][tail]])
+            eq = np.concatenate([eq, old['equity'][tail]])
+            self._state = self._extend({name: values[:k] for name, values in old.items()}, t, eq)
+            return len(t)
+
+    def _extend(self, state, t, eq):
+        k = len(state['t'])
+        if k:
+            prev_eq = state['equity'][-1]
+            carry = {name: state[name][-1] for name in
+                     ('cum_r', 'cum_r2', 'cum_down2', 'peak', 'peak_t', 'max_drawdown', 'max_underwater')}
+        else:
+            prev_eq = eq[0]
+            carry = {'cum_r': 0.0, 'cum_r2': 0.0, 'cum_down2': 0.0, 'peak': eq[0], 'peak_t': t[0],
+                     'max_drawdown': 0.0, 'max_underwater': 0.0}
+
+        returns = eq / np.concatenate([[prev_eq], eq[:-1]]) - 1.0
+        if not k:
+            returns[0] = np.nan
+        r = np.nan_to_num(returns)
+        peak = np.maximum(np.maximum.accumulate(eq), carry['peak'])
+        # Time of the latest high at or before each point; t only increases
+        peak_t = np.maximum(np.maximum.accumulate(np.where(eq >= peak, t, -np.inf)), carry['peak_t'])
+        drawdown = eq / peak - 1.0
+
+        new = {
+            't': t,
+            'equity': eq,
+            'returns': returns,
+            'cum_r': carry['cum_r'] + np.cumsum(r),
+            'cum_r2': carry['cum_r2'] + np.cumsum(r * r),
+            'cum_down2': carry['cum_down2'] + np.cumsum(np.minimum(r, 0.0) ** 2),
+            'peak': peak,
+            'peak_t': peak_t,
+            'drawdown': drawdown,
+            'max_drawdown': np.minimum(np.minimum.accumulate(drawdown), carry['max_drawdown']),
+            'max_underwater': np.maximum(np.maximum.accumulate(t - peak_t), carry['max_underwater']),
+        }
+        rolling_vol = state['rolling_vol']
+        state = {name: np.concatenate([state[name], new[name]]) for name in new}
+
+        # Rolling volatility from window differences of the prefix sums;
+        # returns start at index 1, so index i has a full window once i >= window
+        w = self.window
+        idx = np.arange(k, len(state['t']))
+        full = idx >= w
+        vol = np.full(len(idx), np.nan)
+        i = idx[full]
+        s1 = state['cum_r'][i] - state['cum_r'][i - w]
+        s2 = state['cum_r2'][i] - state['cum_r2'][i - w]
+        vol[full] = np.sqrt(np.maximum(s2 - s1 * s1 / w, 0.0) / (w - 1) * self.periods_per_year)
+        state['rolling_vol'] = np.concatenate([rolling_vol, vol])
+        return state
+
+    def summary(self) -> dict:
+        """Headline statistics over the whole stored history."""
+        state = self._state
+        n = len(state['t']) - 1
+        if n < 2:
+            return {'points': n + 1}
+        mean = state['cum_r'][-1] / n
+        std = np.sqrt(max(state['cum_r2'][-1] - n * mean * mean, 0.0) / (n - 1))
+        downside = np.sqrt(state['cum_down2'][-1] / n)
+        excess = mean - self.risk_free_rate / self.periods_per_year
+        annualize = np.sqrt(self.periods_per_year)
+        return {
+            'points': n + 1,
+            'start': float(state['t'][0]),
+            'end': float(state['t'][-1]),
+            'total_return': float(state['equity'][-1] / state['equity'][0] - 1.0),
+            'annualized_return': float(mean * self.periods_per_year),
+            'annualized_volatility': float(std * annualize),
+            'sharpe': float(excess / std * annualize) if std > 0 else None,
+            'sortino': float(excess / downside * annualize) if downside > 0 else None,
+            'max_drawdown': float(state['max_drawdown'][-1]),
+            'max_drawdown_duration_days': float(state['max_underwater'][-1] / 86400),
+            'current_drawdown': float(state['drawdown'][-1]),
+        }
+
+    def series(self, since: float = None) -> dict:
+        """Per-point equity, underwater curve and rolling volatility, optionally from ``since`` on."""
+        state = self._state
+        start = 0 if since is None else int(np.searchsorted(state['t'], since))
+
+        def values(name):
+            column = state[name][start:]
+            return np.where(np.isfinite(column), column, None).tolist()
+
+        return {
+            't': state['t'][start:].tolist(),
+            'equity': values('equity'),
+            'drawdown': values('drawdown'),
+            'rolling_vol': values('rolling_vol'),
+        }
+
+
+ANALYTICS_CSS = """
+                .analytics-stats {
+                    display: grid;
+                    grid-template-columns: repeat(auto-fit, minmax(140px, 1fr));
+                    gap: 10px;
+                    margin: 20px 0 10px;
+                }
+                .analytics-stats .label {
+                    color: #86868b;
+                    font-size: 13px;
+                }
+                .analytics-stats .metric {
+                    font-size: 18px;
+                    font-weight: 600;
+                }
+"""
+
+# Builds the stat row and the underwater / rolling volatility charts from the JSON endpoint
+ANALYTICS_SCRIPT = """
+            <script>
+                document.querySelectorAll('[data-analytics]').forEach(function(el) {
+                    fetch(el.dataset.analytics).then(r => r.json()).then(function(data) {
+                        const s = data.summary, pct = v => v === null || v === undefined ? '-' : (v * 100).toFixed(2) + '%';
+                        const num = v => v === null || v === undefined ? '-' : v.toFixed(2);
+                        const stats = [['Total Return', pct(s.total_return)], ['Volatility', pct(s.annualized_volatility)],
+                            ['Sharpe', num(s.sharpe)], ['Sortino', num(s.sortino)], ['Max Drawdown', pct(s.max_drawdown)],
+                            ['Longest Drawdown', s.max_drawdown_duration_days === undefined ? '-' : s.max_drawdown_duration_days.toFixed(0) + ' days']];
+                        el.innerHTML = '<div class="analytics-stats">' + stats.map(x => '<div><div class="label">' + x[0] +
+                            '</div><div class="metric">' + x[1] + '</div></div>').join('') + '</div><div class="analytics-chart"></div>';
+                        const x = data.series.t.map(t => new Date(t * 1000));
+                        Plotly.newPlot(el.querySelector('.analytics-chart'), [
+                            {x: x, y: data.series.drawdown, name: 'Underwater', fill: 'tozeroy',
+                             line: {color: '#FF3B30', width: 1}, hovertemplate: '%{y:.2%}<extra>Drawdown</extra>'},
+                            {x: x, y: data.series.rolling_vol, name: 'Rolling Volatility', yaxis: 'y2',
+                             line: {color: '#007AFF', width: 1.5}, hovertemplate: '%{y:.2%}<extra>Volatility</extra>'}
+                        ], {
+                            height: 360,
+                            margin: {l: 50, r: 10, t: 10, b: 30},
+                            paper_bgcolor: 'rgba(0,0,0,0)',
+                            plot_bgcolor: 'rgba(0,0,0,0)',
+                            hovermode: 'x unified',
+                            showlegend: true,
+                            legend: {x: 0.01, y: 0.99},
+                            yaxis: {domain: [0.55, 1], tickformat: '.0%', title: 'Drawdown'},
+                            yaxis2: {domain: [0, 0.45], tickformat: '.0%', title: 'Volatility', anchor: 'x'}
+                        });
+                    });
+                });
+            </script>
+"""
+
+
+def render_analytics_panel(endpoint):
+    """Placeholder element picked up by ``ANALYTICS_SCRIPT``."""
+    return render_placeholder('analytics-panel', 'analytics', endpoint)
@@ -0,0 +1,252 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytz
+from alpaca_trade_api.rest import TimeFrame, TimeFrameUnit
+
+from metrics import cache_result
+from tracing import current_span, span
+
+# Root of the on-disk bar store: <root>/<timeframe>/<SYMBOL>/<partition>.npy
+BAR_CACHE_DIR = os.getenv("BAR_CACHE_DIR", "bar_cache")
+
+# Symbols per multi-symbol bars request; keeps the query string within limits
+SYMBOLS_PER_REQUEST = 100
+
+# The current (still growing) partition is refreshed from its last bar once it is this old
+LIVE_TTL_S = 60
+
+# Open memory maps kept around between requests
+MAX_OPEN_PARTITIONS = 4096
+
+MARKET_TZ = pytz.timezone('America/New_York')
+
+BAR_DTYPE = np.dtype([
+    ('t', '<i8'),  # bar start, epoch seconds
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+])
+
+TIMEFRAMES = {
+    '1Min': TimeFrame.Minute,
+    '5Min': TimeFrame(5, TimeFrameUnit.Minute),
+    '1Hour': TimeFrame.Hour,
+    '1Day': TimeFrame.Day,
+}
+
+
+class BarCache:
+    """Columnar on-disk bar store filled by batched multi-symbol requests.
+
+    Bars are stored as memory-mapped ``.npy`` record arrays partitioned by
+    symbol and market day (by month for daily bars, which would otherwise be
+    one row per file). ``ensure`` groups symbols that are missing the same
+    partitions and fetches each contiguous gap for the whole group in one
+    call; partitions already on disk are never fetched again, and the
+    current one is topped up from its last bar. Reads within a partition
+    are zero-copy views of the memory map.
+    """
+
+    def __init__(self, api, timeframe: str = '1Day', root: str = BAR_CACHE_DIR, feed: str = None):
+        self.api = api
+        self.timeframe = timeframe
+        self.root = os.path.join(root, timeframe)
+        self.feed = feed
+        self._daily = timeframe == '1Day'
+        self._open = OrderedDict()
+        self._live = {}
+        self._lock = threading.Lock()
+
+    # -- partitions ----------------------------------------------------------
+
+    def _partition(self, day: date) -> date:
+        return day.replace(day=1) if self._daily else day
+
+    def _partitions(self, start: date, end: date):
+        keys, day = [], self._partition(start)
+        while day <= end:
+            keys.append(day)
+            day = self._partition_end(day)
+        return keys
+
+    def _partition_end(self, key: date) -> date:
+        return (key + timedelta(days=32)).replace(day=1) if self._daily else key + timedelta(days=1)
+
+    def _path(self, symbol: str, key: date) -> str:
+        return os.path.join(self.root, symbol, f"{key.isoformat()}.npy")
+
+    def _is_complete(self, key: date) -> bool:
+        """Only partitions that are entirely in the past are persisted."""
+        return self._partition_end(key) <= datetime.now(MARKET_TZ).date()
+
+    # -- fetching ------------------------------------------------------------
+
+    @span("bar_cache.ensure")
+    def ensure(self, symbols, start: date, end: date) -> int:
+        """Make bars for ``symbols`` between market dates ``start`` and ``end`` available.
+
+        Returns the number of broker requests made.
+        """
+        keys = self._partitions(start, end)
+        missing = {}
+        now = time.time()
+        for symbol in symbols:
+            ranges = []
+            for key in keys:
+                if self._is_complete(key):
+                    if not os.path.exists(self._path(symbol, key)):
+                        ranges.append((key, self._partition_end(key)))
+                    continue
+                with self._lock:
+                    fetched_at, part = self._live.get((symbol, key), (0, None))
+                if now - fetched_at > LIVE_TTL_S:
+                    # Only the days since the last stored bar; that bar itself may still be revised
+                    resume = key
+                    if part is not None and len(part):
+                        resume = max(key, datetime.fromtimestamp(int(part['t'][-1]), MARKET_TZ).date())
+                    ranges.append((resume, self._partition_end(key)))
+            cache_result('bars', not ranges)
+            if ranges:
+                missing.setdefault(tuple(ranges), []).append(symbol)
+
+        requests = 0
+        for ranges, group in missing.items():
+            for run_start, run_end in self._runs(ranges):
+                for i in range(0, len(group), SYMBOLS_PER_REQUEST):
+                    chunk = group[i:i + SYMBOLS_PER_REQUEST]
+                    self._store(chunk, run_start, run_end, self._fetch(chunk, run_start, run_end))
+                    requests += 1
+        current_span().set(**{'bar_cache.requests': requests})
+        return requests
+
+    def _runs(self, ranges):
+        """Collapse [start, end) date ranges into contiguous runs."""
+        runs = []
+        for start, end in ranges:
+            if runs and runs[-1][1] == start:
+                runs[-1][1] = end
+            else:
+                runs.append([start, end])
+        return runs
+
+    def _fetch(self, symbols, start: date, end: date) -> pd.DataFrame:
+        start_dt = MARKET_TZ.localize(datetime.combine(start, datetime.min.time()))
+        end_dt = min(MARKET_TZ.localize(datetime.combine(end, datetime.min.time())), datetime.now(pytz.UTC))
+        bars = self.api.get_bars(
+            list(symbols),
+            TIMEFRAMES[self.timeframe],
+            start=start_dt.isoformat(),
+            end=end_dt.isoformat(),
+            adjustment='raw',
+            feed=self.feed,
+        ).df
+        if len(bars) and 'symbol' not in bars.columns:
+            bars['symbol'] = symbols[0]
+        return bars
+
+    def _store(self, symbols, start: date, end: date, bars: pd.DataFrame):
+        records = np.empty(len(bars), dtype=BAR_DTYPE)
+        keys = np.empty(len(bars), dtype=object)
+        bar_symbols = np.empty(len(bars), dtype=object)
+        if len(bars):
+            records['t'] = bars.index.asi8 // 10**9
+            for name in ('open', 'high', 'low', 'close', 'volume'):
+                records[name] = bars[name].to_numpy(dtype=np.float64)
+            keys[:] = [self._partition(day) for day in bars.index.tz_convert(MARKET_TZ).date]
+            bar_symbols[:] = bars['symbol'].to_numpy()
+        now = time.time()
+        # A refresh of the current partition may start mid-partition; bars before it are kept
+        start_t = int(MARKET_TZ.localize(datetime.combine(start, datetime.min.time())).timestamp())
+        for symbol in symbols:
+            mine = bar_symbols == symbol
+            rows, row_keys = records[mine], keys[mine]
+            for key in self._partitions(start, end - timedelta(days=1)):
+                part = np.sort(rows[row_keys == key], order='t')
+                if self._is_complete(key):
+                    # Empty partitions are written too, so holidays aren't refetched
+                    self._write(symbol, key, part)
+                    continue
+                with self._lock:
+                    previous = self._live.get((symbol, key), (0, None))[1]
+                    if previous is not None:
+                        part = np.concatenate([previous[previous['t'] < start_t], part])
+                    self._live[(symbol, key)] = (now, part)
+
+    def _write(self, symbol, key, records):
+        path = self._path(symbol, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            np.save(f, records)
+        os.replace(tmp, path)
+
+    # -- reading -------------------------------------------------------------
+
+    def _load(self, symbol, key):
+        if not self._is_complete(key):
+            with self._lock:
+                return self._live.get((symbol, key), (0, np.empty(0, dtype=BAR_DTYPE)))[1]
+        path = self._path(symbol, key)
+        with self._lock:
+            records = self._open.get(path)
+            if records is not None:
+                self._open.move_to_end(path)
+                return records
+        if not os.path.exists(path):
+            return np.empty(0, dtype=BAR_DTYPE)
+        records = np.load(path, mmap_mode='r')
+        with self._lock:
+            self._open[path] = records
+            if len(self._open) > MAX_OPEN_PARTITIONS:
+                self._open.popitem(last=False)
+        return records
+
+    def get(self, symbol: str, start: datetime, end: datetime) -> np.ndarray:
+        """Bars with ``start <= t < end``; a view into the memory map when one partition covers it."""
+        lo, hi = int(start.timestamp()), int(end.timestamp())
+        keys = self._partitions(start.astimezone(MARKET_TZ).date(), end.astimezone(MARKET_TZ).date())
+        parts = []
+        for key in keys:
+            records = self._load(symbol, key)
+            if len(records):
+                t = records['t']
+                parts.append(records[np.searchsorted(t, lo):np.searchsorted(t, hi)])
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return np.empty(0, dtype=BAR_DTYPE)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def closes(self, symbols, start: datetime, end: datetime) -> pd.DataFrame:
+        """Close prices aligned on bar time, one column per symbol."""
+        series = {}
+        for symbol in symbols:
+            bars = self.get(symbol, start, end)
+            series[symbol] = pd.Series(bars['close'], index=pd.to_datetime(bars['t'], unit='s', utc=True))
+        return pd.DataFrame(series)
+
+
+def sparkline_stats(cache: BarCache, symbols, days: int = 30):
+    """Daily closes and simple return stats per symbol for position sparklines."""
+    end = datetime.now(pytz.UTC)
+    start = end - timedelta(days=days)
+    cache.ensure(symbols, start.astimezone(MARKET_TZ).date(), end.astimezone(MARKET_TZ).date())
+    stats = {}
+    for symbol in symbols:
+        close = cache.get(symbol, start, end)['close']
+        if len(close) < 2:
+            continue
+        returns = np.diff(close) / close[:-1]
+        stats[symbol] = {
+            'closes': np.round(close, 4).tolist(),
+            'return': float(close[-1] / close[0] - 1),
+            'volatility': float(returns.std(ddof=1) * np.sqrt(252)) if len(returns) > 1 else None,
+        }
+    return stats
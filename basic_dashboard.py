@@ -1,23 +1,36 @@
 from flask import Flask
 import alpaca_trade_api as tradeapi
+import logging
 import os
 from dotenv import load_dotenv
 
+from logs import install_logging
+from metrics import install_metrics, instrument_api
+from profiling import install_profiling
+from replay import tape_api
+from scheduler import schedule_api
+from tracing import install_tracing
+
 app = Flask(__name__)
+install_metrics(app)
+install_profiling(app)
+install_tracing(app, 'basic_dashboard')
 
 # Load environment variables
 load_dotenv()
+install_logging(app)
+logger = logging.getLogger('basic_dashboard')
 
 # Initialize Alpaca API
 api_key = os.getenv("APCA_API_KEY_ID")
 api_secret = os.getenv("APCA_API_SECRET_KEY")
 base_url = os.getenv("APCA_API_BASE_URL", "https://paper-api.alpaca.markets")
 
-api = tradeapi.REST(
+api = schedule_api(instrument_api(tape_api(tradeapi.REST(
     key_id=api_key,
     secret_key=api_secret,
     base_url=base_url
-)
+))))
 
 @app.route('/')
 def home():
@@ -84,6 +97,7 @@ def home():
         </html>
         """
     except Exception as e:
+        logger.exception("Error rendering dashboard")
         return f"""
         <html>
             <body>
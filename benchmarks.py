@@ -0,0 +1,112 @@
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import plotly.graph_objects as go
+import pytz
+
+from analytics import TRADING_DAYS
+
+# Benchmarks separated by ";", each a symbol or a fixed-weight basket:
+# "SPY;QQQ;Mega Tech=AAPL:0.4,MSFT:0.4,NVDA:0.2"
+BENCHMARKS = os.getenv("BENCHMARKS", "SPY;QQQ")
+
+BENCHMARK_COLORS = ('#8E8E93', '#AF52DE', '#FF9500', '#5AC8FA')
+
+
+def parse_benchmarks(spec: str = BENCHMARKS):
+    """``[(name, {symbol: weight})]``; basket weights are normalized to sum to 1."""
+    benchmarks = []
+    for item in filter(None, (part.strip() for part in spec.split(';'))):
+        if '=' not in item:
+            benchmarks.append((item.upper(), {item.upper(): 1.0}))
+            continue
+        name, members = item.split('=', 1)
+        weights = {}
+        for member in members.split(','):
+            symbol, _, weight = member.strip().partition(':')
+            weights[symbol.upper()] = float(weight or 1)
+        total = sum(weights.values())
+        benchmarks.append((name.strip(), {symbol: w / total for symbol, w in weights.items()}))
+    return benchmarks
+
+
+def asof(bar_t, values, t):
+    """Value of the latest bar at or before each time in ``t``; NaN before the first bar."""
+    if not len(bar_t):
+        return np.full(len(t), np.nan)
+    idx = np.searchsorted(bar_t, t, side='right') - 1
+    return np.where(idx >= 0, values[np.clip(idx, 0, None)], np.nan)
+
+
+def benchmark_overlays(bar_cache, timestamps, equity, benchmarks=None):
+    """Benchmarks as buy-and-hold equity curves starting from the account's first equity.
+
+    Bars come from ``bar_cache`` (fetched once per day and kept on disk) and
+    are aligned to the portfolio timestamps with an as-of join. Each overlay
+    carries beta and annualized tracking error of the account against it.
+    """
+    benchmarks = parse_benchmarks() if benchmarks is None else benchmarks
+    t = np.asarray(timestamps, dtype=np.float64)
+    eq = np.array([np.nan if e is None else e for e in equity], dtype=np.float64)
+    valid = np.flatnonzero(np.isfinite(eq) & (eq > 0))
+    if len(valid) < 2 or not benchmarks:
+        return []
+    first = valid[0]
+
+    symbols = sorted({symbol for _, weights in benchmarks for symbol in weights})
+    start = datetime.fromtimestamp(t[first], pytz.UTC) - timedelta(days=7)
+    end = datetime.fromtimestamp(t[-1], pytz.UTC) + timedelta(days=1)
+    bar_cache.ensure(symbols, start.date(), min(end, datetime.now(pytz.UTC)).date())
+    prices = {}
+    for symbol in symbols:
+        bars = bar_cache.get(symbol, start, end)
+        prices[symbol] = asof(bars['t'], bars['close'], t)
+
+    portfolio_returns = np.diff(eq[first:]) / eq[first:-1]
+    overlays = []
+    for name, weights in benchmarks:
+        # Fixed-weight basket: each member's growth since the account's first point
+        with np.errstate(invalid='ignore', divide='ignore'):
+            level = sum(w * prices[symbol] / prices[symbol][first] for symbol, w in weights.items())
+        values = eq[first] * level
+        values[:first] = np.nan
+        benchmark_returns = np.diff(values[first:]) / values[first:-1]
+        both = np.isfinite(portfolio_returns) & np.isfinite(benchmark_returns)
+        rp, rb = portfolio_returns[both], benchmark_returns[both]
+        beta = tracking_error = None
+        if len(rb) > 2 and rb.var() > 0:
+            beta = float(np.cov(rp, rb)[0, 1] / np.var(rb, ddof=1))
+            tracking_error = float(np.std(rp - rb, ddof=1) * np.sqrt(TRADING_DAYS))
+        overlays.append({
+            'name': name,
+            'values': values,
+            'beta': beta,
+            'tracking_error': tracking_error,
+        })
+    return overlays
+
+
+def add_benchmark_traces(fig, dates, overlays):
+    """Dashed benchmark lines plus a beta / tracking error note in the chart's corner."""
+    notes = []
+    for overlay, color in zip(overlays, BENCHMARK_COLORS * len(overlays)):
+        fig.add_trace(go.Scatter(
+            x=dates,
+            y=np.where(np.isfinite(overlay['values']), overlay['values'], None),
+            name=overlay['name'],
+            line=dict(color=color, width=1.5, dash='dash'),
+            hovertemplate=f"$%{{y:,.2f}}<extra>{overlay['name']}</extra>"
+        ))
+        if overlay['beta'] is not None:
+            notes.append(f"{overlay['name']}: β {overlay['beta']:.2f} · TE {overlay['tracking_error']:.1%}")
+    if notes:
+        fig.add_annotation(
+            text="<br>".join(notes),
+            xref='paper', yref='paper', x=1, y=1,
+            xanchor='right', yanchor='top', align='right',
+            showarrow=False,
+            bgcolor='rgba(255,255,255,0.8)',
+            font=dict(size=11)
+        )
+    return fig
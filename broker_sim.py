@@ -0,0 +1,873 @@
+"""Local stand-in for the Alpaca trading and market data REST API.
+
+    python broker_sim.py --port 8765 --cash 100000 --latency 20-80 --reject-rate 0.01
+    APCA_API_BASE_URL=http://localhost:8765 APCA_API_DATA_URL=http://localhost:8765 python live_dashboard.py
+
+Orders rest in a per-symbol book and are matched on every tick against
+synthetic prices (a seeded random walk) or prices replayed from a
+``time,symbol,price`` CSV. Positions, cash and equity follow the fills.
+Request latency, random rejects, read errors and a per-minute request
+limit with Alpaca's X-RateLimit headers are all configurable, so order
+flows can be load-tested offline. Broker timestamps use the wall clock;
+``--speed`` only speeds up the price path.
+"""
+import csv
+import logging
+import math
+import os
+import random
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Starting cash and the symbols quoted before any order mentions them
+SIM_CASH = float(os.getenv("SIM_CASH", "100000"))
+SIM_SYMBOLS = ('AAPL', 'MSFT', 'AMZN', 'GOOGL', 'NVDA', 'TSLA', 'SPY', 'QQQ')
+
+# Matching runs every SIM_TICK_S of wall time; market orders fill on the next tick
+SIM_TICK_S = 0.1
+
+# Synthetic prices: annualized volatility, and how many simulated seconds pass per wall second
+SIM_VOLATILITY = 0.3
+SIM_SPEED = 1.0
+
+# Market orders fill this far through the price, in basis points
+SIM_SLIPPAGE_BPS = 2.0
+
+# Buying power as a multiple of equity (1 = cash account, 2 = Reg T margin)
+SIM_MARGIN = 2.0
+
+# Alpaca's trading API allows 200 requests a minute per account
+SIM_RATE_LIMIT = 200
+
+# Daily history behind bars and portfolio history before the simulator started
+SIM_HISTORY_DAYS = 3650
+
+TERMINAL_STATUSES = ('filled', 'canceled', 'expired', 'rejected', 'replaced', 'done_for_day')
+ORDER_TYPES = ('market', 'limit', 'stop', 'stop_limit')
+TIMEFRAMES = {'Min': 60, 'Hour': 3600, 'Day': 86400, 'Week': 7 * 86400}
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec='microseconds').replace('+00:00', 'Z')
+
+
+def _parse_time(value) -> Optional[float]:
+    """Epoch seconds from an ISO timestamp or date as clients send them, to the nanosecond; None for empty."""
+    if value in (None, ''):
+        return None
+    # A '+' offset that wasn't percent-encoded arrives as a space
+    ts = pd.Timestamp(str(value).strip().replace(' ', '+'))
+    if ts.tzinfo is None:
+        ts = ts.tz_localize('UTC')
+    return ts.value / 1e9
+
+
+def _num(value) -> str:
+    """Alpaca sends numbers as strings."""
+    return None if value is None else f"{value:.10g}" if isinstance(value, float) else str(value)
+
+
+class SimError(Exception):
+    """An API error answered with ``status`` and Alpaca's ``{"code", "message"}`` body."""
+
+    def __init__(self, status: int, message: str, code: int = None):
+        super().__init__(message)
+        self.status = status
+        self.code = code or status * 100000
+
+
+class SyntheticPrices:
+    """Seeded per-symbol random walks: a daily history ending today and a live path from its last close."""
+
+    def __init__(self, volatility: float = SIM_VOLATILITY, speed: float = SIM_SPEED, seed: int = 0,
+                 history_days: int = SIM_HISTORY_DAYS):
+        self.volatility = volatility
+        self.speed = speed
+        self.seed = seed
+        self.history_days = history_days
+        self.started = time.time()
+        self._last = {}
+        self._daily = {}
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+    def _symbol_seed(self, symbol: str) -> int:
+        return zlib.crc32(symbol.encode()) ^ self.seed
+
+    def daily_closes(self, symbol: str) -> np.ndarray:
+        """Closes for ``history_days`` days up to today, oldest first; today's close is the opening live price."""
+        with self._lock:
+            closes = self._daily.get(symbol)
+            if closes is None:
+                rng = np.random.default_rng(self._symbol_seed(symbol))
+                last = rng.uniform(20, 500)
+                steps = rng.normal(0.0003, self.volatility / math.sqrt(252), self.history_days - 1)
+                closes = last * np.exp(np.concatenate([[0.0], np.cumsum(steps[::-1])]))[::-1]
+                self._daily[symbol] = closes
+            return closes
+
+    def day_index(self, day: date) -> int:
+        """Position of ``day`` in ``daily_closes``; negative or past the end outside the history."""
+        return self.history_days - 1 - (date.today() - day).days
+
+    def price(self, symbol: str, now: float) -> float:
+        with self._lock:
+            last = self._last.get(symbol)
+        if last is None:
+            last = (float(self.daily_closes(symbol)[-1]), now)
+        value, updated = last
+        elapsed = max(0.0, now - updated) * self.speed
+        if elapsed:
+            sigma = self.volatility * math.sqrt(elapsed / (252 * 6.5 * 3600))
+            with self._lock:
+                value *= math.exp(sigma * self._rng.standard_normal() - sigma * sigma / 2)
+        with self._lock:
+            self._last[symbol] = (value, now)
+        return value
+
+
+class ReplayPrices(SyntheticPrices):
+    """Prices from a ``time,symbol,price`` CSV, replayed from its first row at ``speed`` x real time.
+
+    Symbols the file doesn't mention fall back to synthetic prices; bars and
+    history before the replay stay synthetic.
+    """
+
+    def __init__(self, path: str, speed: float = SIM_SPEED, **kwargs):
+        super().__init__(speed=speed, **kwargs)
+        ticks = {}
+        with open(path) as f:
+            for row in csv.DictReader(f):
+                ticks.setdefault(row['symbol'].upper(), []).append((_parse_time(row['time']), float(row['price'])))
+        self._ticks = {symbol: (np.array([t for t, _ in rows]), np.array([p for _, p in rows]))
+                       for symbol, rows in ((s, sorted(r)) for s, r in ticks.items())}
+        self.replay_start = min(times[0] for times, _ in self._ticks.values())
+
+    def price(self, symbol: str, now: float) -> float:
+        series = self._ticks.get(symbol)
+        if series is None:
+            return super().price(symbol, now)
+        times, prices = series
+        replay_now = self.replay_start + (now - self.started) * self.speed
+        return float(prices[max(0, np.searchsorted(times, replay_now, side='right') - 1)])
+
+
+@dataclass
+class SimOrder:
+    symbol: str
+    side: str
+    type: str
+    time_in_force: str
+    qty: Optional[float]
+    notional: Optional[float] = None
+    limit_price: Optional[float] = None
+    stop_price: Optional[float] = None
+    client_order_id: str = ''
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    status: str = 'new'
+    filled_qty: float = 0.0
+    filled_avg_price: Optional[float] = None
+    submitted_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    filled_at: Optional[float] = None
+    canceled_at: Optional[float] = None
+    triggered: bool = False
+
+    @property
+    def open(self) -> bool:
+        return self.status not in TERMINAL_STATUSES
+
+    def to_json(self):
+        return {
+            'id': self.id,
+            'client_order_id': self.client_order_id,
+            'created_at': _iso(self.submitted_at),
+            'updated_at': _iso(self.updated_at),
+            'submitted_at': _iso(self.submitted_at),
+            'filled_at': self.filled_at and _iso(self.filled_at),
+            'expired_at': None,
+            'canceled_at': self.canceled_at and _iso(self.canceled_at),
+            'failed_at': None,
+            'replaced_at': None,
+            'replaced_by': None,
+            'replaces': None,
+            'asset_id': str(uuid.uuid5(uuid.NAMESPACE_OID, self.symbol)),
+            'symbol': self.symbol,
+            'asset_class': 'us_equity',
+            'notional': _num(self.notional),
+            'qty': _num(self.qty),
+            'filled_qty': _num(self.filled_qty),
+            'filled_avg_price': _num(self.filled_avg_price),
+            'order_class': '',
+            'order_type': self.type,
+            'type': self.type,
+            'side': self.side,
+            'time_in_force': self.time_in_force,
+            'limit_price': _num(self.limit_price),
+            'stop_price': _num(self.stop_price),
+            'status': self.status,
+            'extended_hours': False,
+            'legs': None,
+        }
+
+
+@dataclass
+class SimConfig:
+    cash: float = SIM_CASH
+    margin: float = SIM_MARGIN
+    slippage_bps: float = SIM_SLIPPAGE_BPS
+    # Largest quantity one order fills per tick; None fills whole orders at once
+    max_fill_qty: Optional[float] = None
+    allow_short: bool = True
+    # Per-request latency range in seconds, and the chance an order or a read fails at random
+    latency: tuple = (0.0, 0.0)
+    reject_rate: float = 0.0
+    error_rate: float = 0.0
+    rate_limit: Optional[int] = SIM_RATE_LIMIT
+    seed: int = 0
+
+
+class SimBroker:
+    """Account, positions, order book and fills; every method is thread-safe."""
+
+    def __init__(self, prices: SyntheticPrices = None, config: SimConfig = None):
+        self.config = config or SimConfig()
+        self.prices = prices or SyntheticPrices(seed=self.config.seed)
+        self.random = random.Random(self.config.seed)
+        self.account_id = str(uuid.uuid5(uuid.NAMESPACE_OID, f"sim-{self.config.seed}"))
+        self.created_at = time.time()
+        self.cash = self.config.cash
+        # symbol -> (qty, cost basis); shorts carry negative both
+        self.positions = {}
+        self.orders = {}
+        self.activities = []
+        # (time, equity) once per minute, behind portfolio history
+        self.equity_log = [(self.created_at, self.config.cash)]
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # -- matching -----------------------------------------------------------
+
+    def start(self, tick: float = SIM_TICK_S):
+        self._thread = threading.Thread(target=self._run, args=(tick,), name="sim-matcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, tick):
+        while not self._stop.wait(tick):
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("Error matching simulated orders")
+
+    def tick(self, now: float = None):
+        """Settle pending cancels, then match every open order against the current price."""
+        now = now or time.time()
+        with self._lock:
+            for order in list(self.orders.values()):
+                if not order.open:
+                    continue
+                if order.status == 'pending_cancel':
+                    self._finish(order, 'canceled', now)
+                    continue
+                price = self.prices.price(order.symbol, now)
+                fill_price = self._fill_price(order, price)
+                if fill_price is None:
+                    if order.time_in_force in ('ioc', 'fok'):
+                        self._finish(order, 'canceled', now)
+                    continue
+                self._fill(order, fill_price, now)
+                if order.open and order.time_in_force == 'ioc':
+                    # Immediate-or-cancel: whatever the first match left unfilled is canceled
+                    self._finish(order, 'canceled', now)
+            if now - self.equity_log[-1][0] >= 60:
+                self.equity_log.append((now, self._equity(now)))
+
+    def _fill_price(self, order: SimOrder, price: float) -> Optional[float]:
+        buy = order.side == 'buy'
+        if order.type in ('stop', 'stop_limit') and not order.triggered:
+            if (buy and price < order.stop_price) or (not buy and price > order.stop_price):
+                return None
+            order.triggered = True
+        if order.type in ('market', 'stop'):
+            slip = price * self.config.slippage_bps / 10_000
+            return price + slip if buy else price - slip
+        if (buy and price <= order.limit_price) or (not buy and price >= order.limit_price):
+            # Marketable limits fill at the better of the market and the limit
+            return min(price, order.limit_price) if buy else max(price, order.limit_price)
+        return None
+
+    def _fill(self, order: SimOrder, price: float, now: float):
+        if order.qty is None:
+            order.qty = round(order.notional / price, 9)
+        qty = order.qty - order.filled_qty
+        if self.config.max_fill_qty and order.time_in_force != 'fok':
+            qty = min(qty, self.config.max_fill_qty)
+        signed = qty if order.side == 'buy' else -qty
+        held, basis = self.positions.get(order.symbol, (0.0, 0.0))
+        if held and (held > 0) != (signed > 0):
+            # Closing part or all of a position releases its basis pro rata; any excess opens the other side
+            closing = min(abs(signed), abs(held))
+            basis -= basis * closing / abs(held)
+            opening = abs(signed) - closing
+            basis += math.copysign(opening * price, signed) if opening else 0.0
+        else:
+            basis += signed * price
+        held = round(held + signed, 9)
+        if held:
+            self.positions[order.symbol] = (held, basis)
+        else:
+            self.positions.pop(order.symbol, None)
+        self.cash -= signed * price
+
+        total = order.filled_qty + qty
+        order.filled_avg_price = ((order.filled_avg_price or 0.0) * order.filled_qty + price * qty) / total
+        order.filled_qty = round(total, 9)
+        order.updated_at = now
+        done = order.filled_qty >= order.qty - 1e-9
+        if done:
+            order.status = 'filled'
+            order.filled_at = now
+        else:
+            order.status = 'partially_filled'
+        self.activities.append({
+            'id': f"{now * 1000:.0f}::{uuid.uuid4()}",
+            'activity_type': 'FILL',
+            'transaction_time': _iso(now),
+            'type': 'fill' if done else 'partial_fill',
+            'price': _num(price),
+            'qty': _num(qty),
+            'side': order.side,
+            'symbol': order.symbol,
+            'leaves_qty': _num(round(order.qty - order.filled_qty, 9)),
+            'order_id': order.id,
+            'cum_qty': _num(order.filled_qty),
+            'order_status': order.status,
+        })
+
+    def _finish(self, order: SimOrder, status: str, now: float):
+        order.status = status
+        order.updated_at = now
+        if status == 'canceled':
+            order.canceled_at = now
+
+    # -- account ------------------------------------------------------------
+
+    def _market_values(self, now: float):
+        return {symbol: qty * self.prices.price(symbol, now) for symbol, (qty, _) in self.positions.items()}
+
+    def _equity(self, now: float) -> float:
+        return self.cash + sum(self._market_values(now).values())
+
+    def _open_buy_notional(self, now: float) -> float:
+        total = 0.0
+        for order in self.orders.values():
+            if order.open and order.side == 'buy':
+                price = order.limit_price or self.prices.price(order.symbol, now)
+                total += order.notional if order.qty is None else (order.qty - order.filled_qty) * price
+        return total
+
+    def _buying_power(self, now: float) -> float:
+        return max(0.0, self._equity(now) * self.config.margin
+                   - sum(abs(v) for v in self._market_values(now).values()) - self._open_buy_notional(now))
+
+    def account(self):
+        now = time.time()
+        with self._lock:
+            values = self._market_values(now)
+            equity = self.cash + sum(values.values())
+            long_value = sum(v for v in values.values() if v > 0)
+            short_value = sum(v for v in values.values() if v < 0)
+            return {
+                'id': self.account_id,
+                'account_number': 'SIM' + self.account_id[:8].upper(),
+                'status': 'ACTIVE',
+                'currency': 'USD',
+                'cash': _num(self.cash),
+                'portfolio_value': _num(equity),
+                'equity': _num(equity),
+                'last_equity': _num(self.equity_log[0][1]),
+                'long_market_value': _num(long_value),
+                'short_market_value': _num(short_value),
+                'buying_power': _num(self._buying_power(now)),
+                'regt_buying_power': _num(self._buying_power(now)),
+                'multiplier': _num(self.config.margin),
+                'initial_margin': _num((long_value - short_value) / self.config.margin),
+                'maintenance_margin': _num((long_value - short_value) * 0.25),
+                'daytrade_count': 0,
+                'pattern_day_trader': False,
+                'trading_blocked': False,
+                'transfers_blocked': False,
+                'account_blocked': False,
+                'shorting_enabled': self.config.allow_short,
+                'created_at': _iso(self.created_at),
+            }
+
+    def _position_json(self, symbol, now):
+        qty, basis = self.positions[symbol]
+        price = self.prices.price(symbol, now)
+        market_value = qty * price
+        entry = basis / qty
+        return {
+            'asset_id': str(uuid.uuid5(uuid.NAMESPACE_OID, symbol)),
+            'symbol': symbol,
+            'exchange': 'SIM',
+            'asset_class': 'us_equity',
+            'qty': _num(qty),
+            'qty_available': _num(qty),
+            'side': 'long' if qty > 0 else 'short',
+            'avg_entry_price': _num(entry),
+            'market_value': _num(market_value),
+            'cost_basis': _num(basis),
+            'unrealized_pl': _num(market_value - basis),
+            'unrealized_plpc': _num((market_value - basis) / abs(basis) if basis else 0.0),
+            'unrealized_intraday_pl': _num(market_value - basis),
+            'unrealized_intraday_plpc': _num((market_value - basis) / abs(basis) if basis else 0.0),
+            'current_price': _num(price),
+            'lastday_price': _num(float(self.prices.daily_closes(symbol)[-1])),
+            'change_today': _num(price / float(self.prices.daily_closes(symbol)[-1]) - 1),
+        }
+
+    def list_positions(self):
+        now = time.time()
+        with self._lock:
+            return [self._position_json(symbol, now) for symbol in sorted(self.positions)]
+
+    def get_position(self, symbol: str):
+        with self._lock:
+            if symbol not in self.positions:
+                raise SimError(404, "position does not exist", 40410000)
+            return self._position_json(symbol, time.time())
+
+    # -- orders -------------------------------------------------------------
+
+    def submit_order(self, body: dict) -> dict:
+        symbol = str(body.get('symbol') or '').upper()
+        side = body.get('side')
+        type_ = body.get('type', 'market')
+        tif = body.get('time_in_force', 'day')
+        qty = float(body['qty']) if body.get('qty') not in (None, '') else None
+        notional = float(body['notional']) if body.get('notional') not in (None, '') else None
+        limit_price = float(body['limit_price']) if body.get('limit_price') not in (None, '') else None
+        stop_price = float(body['stop_price']) if body.get('stop_price') not in (None, '') else None
+        if not symbol:
+            raise SimError(422, "symbol is required", 40010001)
+        if side not in ('buy', 'sell'):
+            raise SimError(422, "side must be buy or sell", 40010001)
+        if type_ not in ORDER_TYPES:
+            raise SimError(422, f"order type {type_} is not supported by the simulator", 40010001)
+        if body.get('order_class') not in (None, '', 'simple'):
+            raise SimError(422, "order_class is not supported by the simulator", 40010001)
+        if (qty is None) == (notional is None) or (qty is not None and qty <= 0) or (notional is not None and notional <= 0):
+            raise SimError(422, "exactly one of qty or notional must be positive", 40010001)
+        if type_ in ('limit', 'stop_limit') and limit_price is None:
+            raise SimError(422, "limit_price is required", 40010001)
+        if type_ in ('stop', 'stop_limit') and stop_price is None:
+            raise SimError(422, "stop_price is required", 40010001)
+        if self.random.random() < self.config.reject_rate:
+            raise SimError(403, "order rejected by simulator", 40310000)
+
+        # Stored at the microsecond precision it is reported in, so time filters agree with clients
+        now = round(time.time(), 6)
+        with self._lock:
+            client_order_id = body.get('client_order_id') or str(uuid.uuid4())
+            if any(o.client_order_id == client_order_id for o in self.orders.values()):
+                raise SimError(422, "client_order_id must be unique", 40010001)
+            price = limit_price or self.prices.price(symbol, now)
+            held = self.positions.get(symbol, (0.0, 0.0))[0]
+            if side == 'buy' and held >= 0:
+                cost = notional if qty is None else qty * price
+                if cost > self._buying_power(now):
+                    raise SimError(403, "insufficient buying power", 40310000)
+            if side == 'sell':
+                pending = sum(o.qty - o.filled_qty for o in self.orders.values()
+                              if o.open and o.symbol == symbol and o.side == 'sell' and o.qty)
+                if not self.config.allow_short and (qty or 0) + pending > max(held, 0) + 1e-9:
+                    raise SimError(403, f"insufficient qty available for order (requested: {qty}, available: {held - pending})",
+                                   40310000)
+            order = SimOrder(symbol=symbol, side=side, type=type_, time_in_force=tif, qty=qty, notional=notional,
+                             limit_price=limit_price, stop_price=stop_price, client_order_id=client_order_id,
+                             submitted_at=now, updated_at=now)
+            self.orders[order.id] = order
+            return order.to_json()
+
+    def get_order(self, order_id: str) -> dict:
+        with self._lock:
+            order = self.orders.get(order_id)
+            if order is None:
+                raise SimError(404, "order not found", 40410000)
+            return order.to_json()
+
+    def cancel_order(self, order_id: str):
+        with self._lock:
+            order = self.orders.get(order_id)
+            if order is None:
+                raise SimError(404, "order not found", 40410000)
+            if not order.open or order.status == 'pending_cancel':
+                raise SimError(422, f"order is not cancelable (status: {order.status})", 42210000)
+            # Like the real broker, the cancel lands on the next tick and a fill can still win
+            self._finish(order, 'pending_cancel', time.time())
+
+    def cancel_all_orders(self):
+        with self._lock:
+            results = []
+            for order in self.orders.values():
+                if order.open and order.status != 'pending_cancel':
+                    self._finish(order, 'pending_cancel', time.time())
+                    results.append({'id': order.id, 'status': 200, 'body': order.to_json()})
+            return results
+
+    def close_position(self, symbol: str, qty: float = None) -> dict:
+        with self._lock:
+            if symbol not in self.positions:
+                raise SimError(404, "position does not exist", 40410000)
+            held = self.positions[symbol][0]
+            qty = min(abs(held), qty) if qty else abs(held)
+        return self.submit_order({'symbol': symbol, 'qty': qty, 'side': 'sell' if held > 0 else 'buy',
+                                  'type': 'market', 'time_in_force': 'day'})
+
+    def close_all_positions(self):
+        self.cancel_all_orders()
+        with self._lock:
+            symbols = sorted(self.positions)
+        results = []
+        for symbol in symbols:
+            try:
+                results.append({'symbol': symbol, 'status': 200, 'body': self.close_position(symbol)})
+            except SimError as e:
+                results.append({'symbol': symbol, 'status': e.status, 'body': {'code': e.code, 'message': str(e)}})
+        return results
+
+    def list_orders(self, status='open', limit=50, after=None, until=None, direction='desc', symbols=None, side=None):
+        with self._lock:
+            orders = [o for o in self.orders.values() if status == 'all' or (o.open if status == 'open' else not o.open)]
+        if after is not None:
+            orders = [o for o in orders if o.submitted_at > after]
+        if until is not None:
+            orders = [o for o in orders if o.submitted_at < until]
+        if symbols:
+            orders = [o for o in orders if o.symbol in symbols]
+        if side:
+            orders = [o for o in orders if o.side == side]
+        orders.sort(key=lambda o: o.submitted_at, reverse=direction != 'asc')
+        return [o.to_json() for o in orders[:limit]]
+
+    def list_activities(self, activity_types=None, after=None, until=None, direction='desc', page_size=100,
+                        page_token=None):
+        with self._lock:
+            activities = list(self.activities)
+        if activity_types and 'FILL' not in activity_types:
+            return []
+        if after is not None:
+            activities = [a for a in activities if _parse_time(a['transaction_time']) > after]
+        if until is not None:
+            activities = [a for a in activities if _parse_time(a['transaction_time']) < until]
+        if direction != 'asc':
+            activities.reverse()
+        if page_token:
+            ids = [a['id'] for a in activities]
+            activities = activities[ids.index(page_token) + 1:] if page_token in ids else []
+        return activities[:page_size]
+
+    # -- history ------------------------------------------------------------
+
+    def portfolio_history(self, period=None, timeframe=None, date_start=None, date_end=None):
+        """Flat starting cash before the simulator started, then the recorded equity."""
+        now = time.time()
+        step = _timeframe_seconds(timeframe or '1D')
+        end = _parse_time(date_end) + 86400 if date_end else now
+        if date_start:
+            start = _parse_time(date_start)
+        else:
+            count, unit = _split_period(period or '1M')
+            start = end - count * {'D': 1, 'W': 7, 'M': 30, 'A': 365}[unit] * 86400
+        with self._lock:
+            log = self.equity_log + [(now, self._equity(now))]
+        times = np.arange(math.floor(start / step) * step, end, step)
+        logged = np.array([t for t, _ in log])
+        values = np.array([v for _, v in log])
+        index = np.searchsorted(logged, times, side='right') - 1
+        equity = np.where(index >= 0, values[np.maximum(index, 0)], self.config.cash)
+        base = self.config.cash
+        return {
+            'timestamp': [int(t) for t in times],
+            'equity': [float(v) for v in equity],
+            'profit_loss': [float(v - base) for v in equity],
+            'profit_loss_pct': [float(v / base - 1) for v in equity],
+            'base_value': base,
+            'timeframe': timeframe or '1D',
+        }
+
+    def bars(self, symbol: str, timeframe: str, start=None, end=None, limit=None):
+        """OHLCV bars from the synthetic daily closes, with seeded intraday paths between them."""
+        step = _timeframe_seconds(timeframe)
+        now = time.time()
+        end = min(_parse_time(end) or now, now)
+        start = _parse_time(start) or end - 30 * 86400
+        closes = self.prices.daily_closes(symbol)
+        bars = []
+        t = math.floor(start / step) * step
+        while t < end and (limit is None or len(bars) < limit):
+            day = datetime.fromtimestamp(t, timezone.utc).date()
+            i = self.prices.day_index(day)
+            if day.weekday() < 5 and 0 < i < len(closes):
+                rng = np.random.default_rng((zlib.crc32(symbol.encode()), int(t)))
+                if step >= 86400:
+                    close, open_ = float(closes[i]), float(closes[i - 1])
+                else:
+                    # Position within the day interpolates between yesterday's and today's close
+                    frac = ((t % 86400) / 86400.0)
+                    mid = closes[i - 1] + (closes[i] - closes[i - 1]) * frac
+                    open_ = float(mid * (1 + rng.normal(0, 0.001)))
+                    close = float(mid * (1 + rng.normal(0, 0.001)))
+                high = max(open_, close) * (1 + abs(rng.normal(0, 0.003)))
+                low = min(open_, close) * (1 - abs(rng.normal(0, 0.003)))
+                bars.append({'t': _iso(t).replace('.000000', ''), 'o': open_, 'h': high, 'l': low, 'c': close,
+                             'v': int(rng.integers(1_000, 1_000_000)), 'n': int(rng.integers(10, 5_000)),
+                             'vw': (open_ + close + high + low) / 4})
+            t += step
+        return bars
+
+    def latest_trade(self, symbol: str) -> dict:
+        now = time.time()
+        return {'t': _iso(now), 'x': 'V', 'p': self.prices.price(symbol, now), 's': 100, 'c': ['@'], 'i': int(now * 1000),
+                'z': 'C'}
+
+
+def _split_period(period: str):
+    return int(period[:-1] or 1), period[-1].upper()
+
+
+def _timeframe_seconds(timeframe: str) -> int:
+    """Seconds in ``1Min``/``15Min``/``1H``/``1Hour``/``1D``/``1Day``/``1Week``."""
+    text = str(timeframe)
+    digits = ''.join(c for c in text if c.isdigit()) or '1'
+    unit = text[len(digits):] if text.startswith(digits) else text
+    unit = {'T': 'Min', 'H': 'Hour', 'D': 'Day', 'W': 'Week'}.get(unit, unit)
+    if unit not in TIMEFRAMES:
+        raise SimError(422, f"invalid timeframe {timeframe}", 40010001)
+    return int(digits) * TIMEFRAMES[unit]
+
+
+class RequestLimiter:
+    """Alpaca-style fixed one-minute request window with X-RateLimit-* headers."""
+
+    def __init__(self, limit: Optional[int]):
+        self.limit = limit
+        self.window_start = time.time()
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def take(self):
+        """``(allowed, headers)`` for one request."""
+        with self._lock:
+            now = time.time()
+            if now - self.window_start >= 60:
+                self.window_start, self.used = now, 0
+            allowed = self.limit is None or self.used < self.limit
+            if allowed:
+                self.used += 1
+            headers = {}
+            if self.limit is not None:
+                headers = {
+                    'X-RateLimit-Limit': str(self.limit),
+                    'X-RateLimit-Remaining': str(max(0, self.limit - self.used)),
+                    'X-RateLimit-Reset': str(int(self.window_start + 60)),
+                }
+            return allowed, headers
+
+
+def create_app(broker: SimBroker):
+    """Flask app serving ``broker`` under Alpaca's /v2 trading and market data paths."""
+    from flask import Flask, g, jsonify, request
+
+    app = Flask(__name__)
+    config = broker.config
+    limiter = RequestLimiter(config.rate_limit)
+
+    def args_time(name):
+        return _parse_time(request.args.get(name))
+
+    @app.before_request
+    def simulate_conditions():
+        low, high = config.latency
+        if high:
+            time.sleep(broker.random.uniform(low, high))
+        g.rate_headers = {}
+        if request.path.startswith('/v2/stocks'):
+            # Market data has its own limit upstream; it isn't counted against trading
+            return None
+        allowed, g.rate_headers = limiter.take()
+        if not allowed:
+            return jsonify({'code': 42910000, 'message': 'too many requests.'}), 429
+        if request.method == 'GET' and broker.random.random() < config.error_rate:
+            return jsonify({'code': 50010000, 'message': 'simulated internal error'}), 500
+        return None
+
+    @app.after_request
+    def add_rate_headers(response):
+        response.headers.update(g.get('rate_headers') or {})
+        return response
+
+    @app.errorhandler(SimError)
+    def sim_error(e):
+        return jsonify({'code': e.code, 'message': str(e)}), e.status
+
+    @app.errorhandler(ValueError)
+    def bad_value(e):
+        return jsonify({'code': 40010001, 'message': str(e)}), 422
+
+    @app.route('/v2/account')
+    def account():
+        return jsonify(broker.account())
+
+    @app.route('/v2/positions')
+    def positions():
+        return jsonify(broker.list_positions())
+
+    @app.route('/v2/positions', methods=['DELETE'])
+    def close_all_positions():
+        return jsonify(broker.close_all_positions()), 207
+
+    @app.route('/v2/positions/<symbol>')
+    def position(symbol):
+        return jsonify(broker.get_position(symbol.upper()))
+
+    @app.route('/v2/positions/<symbol>', methods=['DELETE'])
+    def close_position(symbol):
+        return jsonify(broker.close_position(symbol.upper(), request.args.get('qty', type=float)))
+
+    @app.route('/v2/orders')
+    def orders():
+        symbols = request.args.get('symbols')
+        return jsonify(broker.list_orders(
+            status=request.args.get('status', 'open'),
+            limit=min(500, request.args.get('limit', 50, type=int)),
+            after=args_time('after'),
+            until=args_time('until'),
+            direction=request.args.get('direction', 'desc'),
+            symbols=set(symbols.upper().split(',')) if symbols else None,
+            side=request.args.get('side'),
+        ))
+
+    @app.route('/v2/orders', methods=['POST'])
+    def submit_order():
+        return jsonify(broker.submit_order(request.get_json(force=True) or {}))
+
+    @app.route('/v2/orders', methods=['DELETE'])
+    def cancel_all_orders():
+        return jsonify(broker.cancel_all_orders()), 207
+
+    @app.route('/v2/orders/<order_id>')
+    def order(order_id):
+        return jsonify(broker.get_order(order_id))
+
+    @app.route('/v2/orders/<order_id>', methods=['DELETE'])
+    def cancel_order(order_id):
+        broker.cancel_order(order_id)
+        return '', 204
+
+    @app.route('/v2/account/portfolio/history')
+    def portfolio_history():
+        return jsonify(broker.portfolio_history(
+            period=request.args.get('period'),
+            timeframe=request.args.get('timeframe'),
+            date_start=request.args.get('date_start'),
+            date_end=request.args.get('date_end'),
+        ))
+
+    @app.route('/v2/account/activities')
+    @app.route('/v2/account/activities/<activity_type>')
+    def activities(activity_type=None):
+        types = [activity_type] if activity_type else (request.args.get('activity_types') or '').split(',')
+        return jsonify(broker.list_activities(
+            activity_types=[t for t in types if t] or None,
+            after=args_time('after'),
+            until=args_time('until'),
+            direction=request.args.get('direction', 'desc'),
+            page_size=request.args.get('page_size', 100, type=int),
+            page_token=request.args.get('page_token'),
+        ))
+
+    def bars_for(symbols):
+        limit = request.args.get('limit', type=int)
+        return {symbol: broker.bars(symbol, request.args.get('timeframe', '1Day'), request.args.get('start'),
+                                    request.args.get('end'), limit) for symbol in symbols}
+
+    @app.route('/v2/stocks/bars')
+    def multi_bars():
+        symbols = [s for s in request.args.get('symbols', '').upper().split(',') if s]
+        return jsonify({'bars': bars_for(symbols), 'next_page_token': None})
+
+    @app.route('/v2/stocks/<symbol>/bars')
+    def bars(symbol):
+        return jsonify({'bars': bars_for([symbol.upper()])[symbol.upper()], 'symbol': symbol.upper(),
+                        'next_page_token': None})
+
+    @app.route('/v2/stocks/trades/latest')
+    def latest_trades():
+        symbols = [s for s in request.args.get('symbols', '').upper().split(',') if s]
+        return jsonify({'trades': {symbol: broker.latest_trade(symbol) for symbol in symbols}})
+
+    @app.route('/v2/stocks/<symbol>/trades/latest')
+    def latest_trade(symbol):
+        return jsonify({'symbol': symbol.upper(), 'trade': broker.latest_trade(symbol.upper())})
+
+    return app
+
+
+def _latency(value: str):
+    """``50`` or ``20-80`` milliseconds as a (low, high) range in seconds."""
+    low, _, high = value.partition('-')
+    return float(low) / 1000, float(high or low) / 1000
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a local simulated Alpaca broker.")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--cash', type=float, default=SIM_CASH)
+    parser.add_argument('--margin', type=float, default=SIM_MARGIN, help="buying power as a multiple of equity")
+    parser.add_argument('--no-short', action='store_true', help="reject sells beyond the held quantity")
+    parser.add_argument('--prices', help="replay prices from a time,symbol,price CSV instead of random walks")
+    parser.add_argument('--speed', type=float, default=SIM_SPEED, help="simulated seconds per wall second for prices")
+    parser.add_argument('--volatility', type=float, default=SIM_VOLATILITY, help="annualized, for synthetic prices")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--slippage-bps', type=float, default=SIM_SLIPPAGE_BPS)
+    parser.add_argument('--max-fill-qty', type=float, help="largest fill per order per tick (partial fills)")
+    parser.add_argument('--latency', type=_latency, default=(0.0, 0.0), help="per-request latency in ms, e.g. 20-80")
+    parser.add_argument('--reject-rate', type=float, default=0.0, help="chance an order is rejected")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="chance a read returns HTTP 500")
+    parser.add_argument('--rate-limit', type=int, default=SIM_RATE_LIMIT, help="requests a minute; 0 for none")
+    parser.add_argument('--tick', type=float, default=SIM_TICK_S)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    config = SimConfig(cash=args.cash, margin=args.margin, slippage_bps=args.slippage_bps,
+                       max_fill_qty=args.max_fill_qty, allow_short=not args.no_short, latency=args.latency,
+                       reject_rate=args.reject_rate, error_rate=args.error_rate,
+                       rate_limit=args.rate_limit or None, seed=args.seed)
+    prices = (ReplayPrices(args.prices, speed=args.speed, seed=args.seed) if args.prices
+              else SyntheticPrices(volatility=args.volatility, speed=args.speed, seed=args.seed))
+    broker = SimBroker(prices, config).start(args.tick)
+    for symbol in SIM_SYMBOLS:
+        prices.price(symbol, time.time())
+    logger.info("Simulated broker on http://%s:%d; point APCA_API_BASE_URL and APCA_API_DATA_URL here",
+                args.host, args.port)
+    create_app(broker).run(host=args.host, port=args.port, threaded=True)
@@ -0,0 +1,493 @@
+import html
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+import pandas as pd
+
+from order_sync import TERMINAL_STATUSES, list_all_orders
+from scheduler import RISK, priority
+from tracing import in_current_context, span
+
+# Cancels in flight at once; the account's scheduler paces them against the broker budget
+CANCEL_WORKERS = 8
+
+# How long to poll for canceled orders to reach a terminal state, and how often
+CANCEL_CONFIRM_TIMEOUT_S = 30
+CANCEL_POLL_INTERVAL_S = 0.5
+
+# Background bulk cancels kept for their result pages, oldest dropped first
+CANCEL_JOBS_KEEP = 20
+
+logger = logging.getLogger(__name__)
+
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+
+_AGE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*$')
+_AGE_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_age(value) -> Optional[float]:
+    """Seconds from ``90``, ``90s``, ``30m``, ``2h`` or ``1d``; None for an empty value."""
+    if value in (None, ''):
+        return None
+    match = _AGE.match(str(value))
+    if not match:
+        raise ValueError(f"Unrecognized age '{value}'; use e.g. 90s, 30m, 2h or 1d")
+    return float(match.group(1)) * _AGE_UNITS[match.group(2)]
+
+
+def _ts(value):
+    return pd.Timestamp(value).timestamp()
+
+
+def _iso(ts):
+    return pd.Timestamp(ts, unit='s', tz='UTC').isoformat()
+
+
+@dataclass
+class OrderSelector:
+    """Which open orders a bulk cancel applies to; criteria combine with AND.
+
+    An empty selector matches nothing unless ``all`` is set, so a bare POST
+    can't clear the whole book by accident.
+    """
+    symbols: tuple = ()
+    side: Optional[str] = None
+    type: Optional[str] = None
+    older_than: Optional[float] = None
+    all: bool = False
+
+    @classmethod
+    def from_args(cls, args):
+        """From a request's form/query values or a JSON body: symbol, side, type, older_than, all."""
+        symbols = args.get('symbol') or ''
+        if isinstance(symbols, str):
+            symbols = symbols.split(',')
+        side = args.get('side') or None
+        if side not in (None, 'buy', 'sell'):
+            raise ValueError(f"side must be buy or sell, not '{side}'")
+        selector = cls(
+            symbols=tuple(s.strip().upper() for s in symbols if s.strip()),
+            side=side,
+            type=args.get('type') or None,
+            older_than=parse_age(args.get('older_than')),
+            all=str(args.get('all', '')).lower() in ('1', 'true', 'yes', 'on'),
+        )
+        if not (selector.all or selector.criteria()):
+            raise ValueError("Select orders by symbol, side, type or older_than, or pass all=1")
+        return selector
+
+    def criteria(self) -> dict:
+        return {name: value for name, value in (
+            ('symbol', ",".join(self.symbols)), ('side', self.side), ('type', self.type),
+            ('older_than', f"{self.older_than:g}s" if self.older_than is not None else None),
+        ) if value}
+
+    def describe(self) -> str:
+        criteria = self.criteria()
+        return ", ".join(f"{name} {value}" for name, value in criteria.items()) if criteria else "all open orders"
+
+    def matches(self, order, now: float) -> bool:
+        if not (self.all or self.criteria()):
+            return False
+        if self.symbols and order.symbol not in self.symbols:
+            return False
+        if self.side and order.side != self.side:
+            return False
+        if self.type and order.type != self.type:
+            return False
+        if self.older_than is not None and now - _ts(order.submitted_at) < self.older_than:
+            return False
+        return True
+
+
+@dataclass
+class CancelResult:
+    id: str
+    symbol: str
+    side: str
+    type: str
+    qty: Optional[float]
+    submitted_at: float
+    # The broker's order status once confirmed; 'pending_cancel' until then
+    status: str = 'pending_cancel'
+    error: Optional[str] = None
+    # Milliseconds from the start of the bulk cancel until the request returned / the terminal status was seen
+    cancel_ms: Optional[float] = None
+    confirmed_ms: Optional[float] = None
+
+    @property
+    def confirmed(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def observe(self, order, elapsed_ms: float):
+        self.status = order.status
+        if self.confirmed:
+            self.confirmed_ms = elapsed_ms
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'symbol': self.symbol,
+            'side': self.side,
+            'type': self.type,
+            'qty': self.qty,
+            'submitted_at': _iso(self.submitted_at),
+            'status': self.status,
+            'confirmed': self.confirmed,
+            'error': self.error,
+            'cancel_ms': self.cancel_ms,
+            'confirmed_ms': self.confirmed_ms,
+        }
+
+
+@dataclass
+class BulkCancel:
+    selector: OrderSelector
+    results: list = field(default_factory=list)
+    dry_run: bool = False
+    elapsed: float = 0.0
+    # Background runs are read while in progress; ``done`` is set once confirmation polling ends
+    done: bool = False
+    error: Optional[str] = None
+
+    def summary(self) -> dict:
+        counts = {}
+        for result in self.results:
+            counts[result.status] = counts.get(result.status, 0) + 1
+        return {
+            'selected': len(self.results),
+            'confirmed': sum(r.confirmed for r in self.results),
+            'errors': sum(r.error is not None for r in self.results),
+            'statuses': counts,
+        }
+
+    def to_dict(self):
+        return {
+            'selector': self.selector.criteria() or {'all': True},
+            'dry_run': self.dry_run,
+            'done': self.done,
+            'error': self.error,
+            'elapsed_s': round(self.elapsed, 3),
+            **self.summary(),
+            'orders': [r.to_dict() for r in self.results],
+        }
+
+
+def _number(value):
+    return None if value in (None, '') else float(value)
+
+
+def bulk_cancel(api, selector: OrderSelector, dry_run: bool = False, workers: int = CANCEL_WORKERS, timeout: float = CANCEL_CONFIRM_TIMEOUT_S,
+                poll_interval: float = CANCEL_POLL_INTERVAL_S, run: BulkCancel = None) -> BulkCancel:
+    """Cancel the open orders ``selector`` matches and poll until each reaches a terminal status.
+
+    Cancels go out concurrently at RISK priority, paced by the account's
+    scheduler (see ``schedule_api``) rather than a budget of their own. When
+    the selection is every open order a single cancel-all request is sent
+    instead. Orders still not terminal ``timeout`` seconds after the last
+    cancel returned keep their last seen status in the results. Pass
+    ``run`` to fill in a BulkCancel others are watching.
+    """
+    run = run or BulkCancel(selector, dry_run=dry_run)
+    started = time.monotonic()
+    now = time.time()
+    # Listing and confirming run at cancel priority too, ahead of dashboard reads
+    with priority(RISK), \
+            span("orders.bulk_cancel", **{'orders.selector': selector.describe(), 'orders.dry_run': dry_run}) as active:
+        open_orders = list_all_orders(api)
+        selected = [o for o in open_orders if selector.matches(o, now)]
+        run.results = [CancelResult(
+            id=o.id, symbol=o.symbol, side=o.side, type=o.type, qty=_number(o.qty),
+            submitted_at=_ts(o.submitted_at), status=o.status,
+        ) for o in selected]
+        active.set(**{'orders.open': len(open_orders), 'orders.selected': len(selected)})
+        if dry_run or not selected:
+            run.elapsed = time.monotonic() - started
+            run.done = True
+            return run
+
+        if len(selected) == len(open_orders) and selector.all:
+            _cancel_everything(api, run.results, started)
+        else:
+            def cancel(result):
+                try:
+                    api.cancel_order(result.id)
+                    result.status = 'pending_cancel'
+                except Exception as e:
+                    # Usually 422: filled or already canceled; polling finds out which
+                    result.error = str(e)
+                result.cancel_ms = round((time.monotonic() - started) * 1000, 1)
+
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cancel") as executor:
+                futures = [executor.submit(in_current_context(cancel), result) for result in run.results]
+                for future in futures:
+                    future.result()
+
+        wait_for_terminal(api, run.results, started, timeout, poll_interval)
+        run.elapsed = time.monotonic() - started
+        run.done = True
+        active.set(**{'orders.confirmed': run.summary()['confirmed']})
+    return run
+
+
+def start_bulk_cancel(api, selector: OrderSelector, **kwargs) -> str:
+    """Run ``bulk_cancel`` on a background thread; returns the job ID ``bulk_cancel_job`` looks up.
+
+    Confirming hundreds of cancels takes minutes under the broker's rate
+    limit, far longer than a page request should be held open.
+    """
+    job_id = uuid.uuid4().hex[:12]
+    run = BulkCancel(selector)
+
+    def work():
+        try:
+            bulk_cancel(api, selector, run=run, **kwargs)
+        except Exception as e:
+            logger.exception("Error cancelling orders", extra={'selector': selector.describe()})
+            run.error = str(e)
+            run.done = True
+
+    with _jobs_lock:
+        _jobs[job_id] = run
+        while len(_jobs) > CANCEL_JOBS_KEEP:
+            _jobs.popitem(last=False)
+    threading.Thread(target=in_current_context(work), name=f"bulk-cancel-{job_id}", daemon=True).start()
+    return job_id
+
+
+def bulk_cancel_job(job_id) -> Optional[BulkCancel]:
+    """The BulkCancel of a ``start_bulk_cancel`` job, in progress or done; None once dropped."""
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def _cancel_everything(api, results, started):
+    try:
+        api.cancel_all_orders()
+        for result in results:
+            result.status = 'pending_cancel'
+    except Exception as e:
+        for result in results:
+            result.error = str(e)
+    elapsed = round((time.monotonic() - started) * 1000, 1)
+    for result in results:
+        result.cancel_ms = elapsed
+
+
+def wait_for_terminal(api, results, started: float, timeout: float = CANCEL_CONFIRM_TIMEOUT_S,
+                      poll_interval: float = CANCEL_POLL_INTERVAL_S):
+    """Poll until every result's order is terminal or ``timeout`` passes from the first poll.
+
+    ``results`` need ``id``, ``submitted_at`` (epoch seconds, None if never
+    submitted), ``confirmed`` and an ``observe(order, elapsed_ms)`` method,
+    which gets milliseconds since the monotonic ``started``.
+    One listing covers every order between the oldest and newest submission
+    time, so 500 orders are confirmed in a page or two per poll rather than
+    one request per order.
+    """
+    pending = [r for r in results if r.submitted_at is not None]
+    if not pending:
+        return
+    after = _iso(min(r.submitted_at for r in pending) - 1e-6)
+    until = _iso(max(r.submitted_at for r in pending) + 1e-6)
+    by_id = {r.id: r for r in pending}
+    # Counted from now: however long the cancels or submissions took, polling gets its full window
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            orders = list_all_orders(api, status='all', after=after, until=until)
+        except Exception:
+            orders = []
+        elapsed = round((time.monotonic() - started) * 1000, 1)
+        for order in orders:
+            result = by_id.get(order.id)
+            if result is not None and not result.confirmed:
+                result.observe(order, elapsed)
+        if all(r.confirmed for r in pending) or time.monotonic() + poll_interval > deadline:
+            return
+        time.sleep(poll_interval)
+
+
+def parse_cancel_args(args):
+    """``(selector, dry_run)`` from a request's values; raises ValueError on a bad selection."""
+    return OrderSelector.from_args(args), str(args.get('dry_run', '')).lower() in ('1', 'true', 'yes', 'on')
+
+
+BULK_CANCEL_CSS = """
+                .bulk-cancel {
+                    display: flex;
+                    flex-wrap: wrap;
+                    gap: 8px;
+                    align-items: center;
+                    margin: 10px 0 20px;
+                    font-size: 14px;
+                }
+                .bulk-cancel input, .bulk-cancel select {
+                    padding: 6px;
+                    border: 1px solid #ddd;
+                    border-radius: 5px;
+                }
+"""
+
+
+def render_bulk_cancel_form(action):
+    """Selection form posting to the bulk cancel route ``action``."""
+    return f"""
+        <form class="bulk-cancel" action="{action}" method="post">
+            <input name="symbol" placeholder="Symbols, e.g. AAPL,MSFT" size="18">
+            <select name="side"><option value="">Any side</option><option>buy</option><option>sell</option></select>
+            <select name="type">
+                <option value="">Any type</option><option>limit</option><option>market</option>
+                <option>stop</option><option>stop_limit</option><option>trailing_stop</option>
+            </select>
+            <input name="older_than" placeholder="Older than, e.g. 30m" size="14">
+            <label><input type="checkbox" name="dry_run" value="1" checked> Preview</label>
+            <button type="submit" class="cancel-button">Cancel Matching Orders</button>
+        </form>
+    """
+
+
+def render_bulk_cancel_page(title, run: BulkCancel, back: str = "/"):
+    """Per-order result table for a bulk cancel, styled like the liquidation results page."""
+    summary = run.summary()
+    rows = "".join(f"""
+                    <tr>
+                        <td>{r.symbol}</td><td>{r.side}</td><td>{r.type}</td>
+                        <td class="num">{'' if r.qty is None else f'{r.qty:g}'}</td>
+                        <td>{_iso(r.submitted_at)[:19].replace('T', ' ')}</td>
+                        <td>{r.status}</td>
+                        <td class="num">{'' if r.confirmed_ms is None else f'{r.confirmed_ms:,.0f}'}</td>
+                        <td>{html.escape(r.error or '')}</td>
+                        <td class="id">{r.id}</td>
+                    </tr>""" for r in run.results)
+    verb = "would be cancelled" if run.dry_run else "selected"
+    if run.error:
+        outcome = f"<span class='error'>{html.escape(run.error)}</span>"
+    elif run.dry_run:
+        outcome = ""
+    elif not run.done:
+        outcome = f"Cancelling: {summary['confirmed']} confirmed terminal so far, {summary['errors']} errors."
+    else:
+        outcome = f"{summary['confirmed']} confirmed terminal, {summary['errors']} errors, in {run.elapsed:.1f}s."
+    # A background run's page reloads itself until confirmation polling ends
+    refresh = "" if run.done else '<meta http-equiv="refresh" content="2">'
+    return f"""
+        <html>
+        <head>
+            <title>{title}</title>
+            {refresh}
+            <style>
+                body {{
+                    font-family: -apple-system, BlinkMacSystemFont, sans-serif;
+                    margin: 40px;
+                    background: #f5f5f7;
+                }}
+                .card {{
+                    background: white;
+                    padding: 20px;
+                    border-radius: 10px;
+                    box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+                    margin-bottom: 20px;
+                }}
+                table {{
+                    width: 100%;
+                    border-collapse: collapse;
+                    font-size: 14px;
+                }}
+                th, td {{
+                    text-align: left;
+                    padding: 6px 8px;
+                    border-bottom: 1px solid #eee;
+                }}
+                .num {{
+                    text-align: right;
+                }}
+                .id {{
+                    font-family: monospace;
+                    color: #666;
+                }}
+                .error {{
+                    color: #FF5000;
+                }}
+                .back-button {{
+                    display: inline-block;
+                    padding: 10px 20px;
+                    background: #007AFF;
+                    color: white;
+                    text-decoration: none;
+                    border-radius: 5px;
+                    margin-top: 20px;
+                }}
+            </style>
+        </head>
+        <body>
+            <div class="card">
+                <h1>{title}</h1>
+                <p>{summary['selected']} orders {verb} ({html.escape(run.selector.describe())}).
+                   {outcome}</p>
+                <table>
+                    <tr>
+                        <th>Symbol</th><th>Side</th><th>Type</th><th class="num">Qty</th><th>Submitted (UTC)</th>
+                        <th>Status</th><th class="num">Confirmed (ms)</th><th>Error</th><th>Order ID</th>
+                    </tr>{rows}
+                </table>
+                <a href="{back}" class="back-button">Back to Dashboard</a>
+            </div>
+        </body>
+        </html>
+        """
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    import alpaca_trade_api as tradeapi
+    from dotenv import load_dotenv
+
+    from check_positions import ACCOUNTS
+    from scheduler import schedule_api
+
+    parser = argparse.ArgumentParser(description="Cancel open orders matching a selection.")
+    parser.add_argument('-a', '--account', choices=sorted(ACCOUNTS), default='paper')
+    parser.add_argument('--symbol', action='append', default=[], help="symbol to match; repeat or comma-separate")
+    parser.add_argument('--side', choices=('buy', 'sell'))
+    parser.add_argument('--type', help="order type, e.g. limit")
+    parser.add_argument('--older-than', help="minimum age, e.g. 90s, 30m, 2h, 1d")
+    parser.add_argument('--all', action='store_true', help="every open order")
+    parser.add_argument('--dry-run', action='store_true', help="list the selection without cancelling")
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    try:
+        selector = OrderSelector.from_args({
+            'symbol': ",".join(args.symbol), 'side': args.side, 'type': args.type,
+            'older_than': args.older_than, 'all': args.all,
+        })
+    except ValueError as e:
+        parser.error(str(e))
+
+    load_dotenv()
+    key_var, secret_var, url_var, default_url = ACCOUNTS[args.account]
+    api = schedule_api(tradeapi.REST(key_id=os.getenv(key_var), secret_key=os.getenv(secret_var),
+                                     base_url=os.getenv(url_var, default_url)), account=args.account)
+    run = bulk_cancel(api, selector, dry_run=args.dry_run)
+    if args.json:
+        print(json.dumps(run.to_dict(), indent=2))
+    else:
+        for r in run.results:
+            print(f"{r.id}  {r.symbol:<6} {r.side:<4} {r.type:<13} {r.status:<15} "
+                  f"{'' if r.confirmed_ms is None else f'{r.confirmed_ms:>7,.0f}ms'}  {r.error or ''}")
+        summary = run.summary()
+        print(f"{summary['selected']} selected ({selector.describe()}), {summary['confirmed']} confirmed, "
+              f"{summary['errors']} errors in {run.elapsed:.1f}s" + (" [dry run]" if args.dry_run else ""))
@@ -1,52 +1,298 @@
+"""Account, positions and open orders for one or more Alpaca accounts.
+
+    python check_positions.py                        # paper account as tables
+    python check_positions.py -a paper -a live -f json
+    python check_positions.py -a all -f csv > book.csv
+    python check_positions.py --watch 5              # then print only what changed, every 5s
+
+Talks to the REST API with plain ``requests`` instead of alpaca_trade_api,
+whose pandas import alone takes longer than the whole check should.
+"""
+import argparse
+import csv
+import json
 import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import requests
 from dotenv import load_dotenv
-import alpaca_trade_api as tradeapi
 
-# Load environment variables
-load_dotenv()
+from models import AccountRecord, OrderRecord, PositionRecord, format_qty
+
+# name: (key ID env var, secret env var, base URL env var, default base URL)
+ACCOUNTS = {
+    'paper': ("APCA_API_KEY_ID", "APCA_API_SECRET_KEY", "APCA_API_BASE_URL", "https://paper-api.alpaca.markets"),
+    'live': ("LIVE_APCA_API_KEY_ID", "LIVE_APCA_API_SECRET_KEY", "LIVE_APCA_API_BASE_URL", "https://api.alpaca.markets"),
+}
+
+# Alpaca caps list_orders at 500 per page (same as order_sync, which needs pandas to import)
+ORDER_PAGE_SIZE = 500
+
+REQUEST_TIMEOUT_S = 10
+
+# Fields whose change makes a row "changed" in --watch; prices move every tick and are ignored
+POSITION_DIFF_FIELDS = ('side', 'qty')
+ORDER_DIFF_FIELDS = ('status', 'qty', 'filled_qty', 'limit_price')
+
+POSITION_FIELDS = PositionRecord.__slots__
+ORDER_FIELDS = OrderRecord.__slots__
+ACCOUNT_FIELDS = AccountRecord.__slots__
+
+_FRACTION = re.compile(r'(\.\d{6})\d+')
+
+
+class AlpacaClient:
+    """The three read endpoints this CLI needs, over one keep-alive session per account."""
+
+    def __init__(self, name: str, key_id: str, secret_key: str, base_url: str):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        if not self.base_url.endswith('/v2'):
+            self.base_url += '/v2'
+        self.session = requests.Session()
+        self.session.headers.update({'APCA-API-KEY-ID': key_id or '', 'APCA-API-SECRET-KEY': secret_key or ''})
+
+    @classmethod
+    def from_env(cls, name: str):
+        key_var, secret_var, url_var, default_url = ACCOUNTS[name]
+        return cls(name, os.getenv(key_var), os.getenv(secret_var), os.getenv(url_var, default_url))
+
+    def _get(self, path, **params):
+        response = self.session.get(self.base_url + path, params=params, timeout=REQUEST_TIMEOUT_S)
+        if response.status_code >= 400:
+            try:
+                message = response.json().get('message', response.text)
+            except ValueError:
+                message = response.text
+            raise RuntimeError(f"{response.status_code} {message}")
+        return response.json()
+
+    def get_account(self):
+        return AccountRecord.from_entity(SimpleNamespace(**self._get('/account')))
+
+    def list_positions(self):
+        return [PositionRecord.from_entity(SimpleNamespace(**p)) for p in self._get('/positions')]
+
+    def list_open_orders(self):
+        """Every open order, following ``until`` cursors past the first page like ``order_sync.list_all_orders``."""
+        orders, seen, until = [], set(), None
+        while True:
+            page = self._get('/orders', status='open', limit=ORDER_PAGE_SIZE, direction='desc',
+                             **({'until': until} if until else {}))
+            fresh = [o for o in page if o['id'] not in seen]
+            orders.extend(OrderRecord.from_entity(SimpleNamespace(**o)) for o in fresh)
+            seen.update(o['id'] for o in fresh)
+            if len(page) < ORDER_PAGE_SIZE or not fresh:
+                return orders
+            # ``until`` is exclusive; step 1us past the boundary and let ``seen`` drop repeats
+            boundary = datetime.fromisoformat(_FRACTION.sub(r'\1', page[-1]['submitted_at']).replace('Z', '+00:00'))
+            until = (boundary + timedelta(microseconds=1)).isoformat()
+
+
+def _row(record, fields):
+    return {name: getattr(record, name) for name in fields}
+
+
+def fetch(clients, executor):
+    """Account, positions and open orders of every client, all requested at once."""
+    calls = ('get_account', 'list_positions', 'list_open_orders')
+    futures = {(client.name, call): executor.submit(getattr(client, call)) for client in clients for call in calls}
+    books = []
+    for client in clients:
+        book = {'account': client.name, 'summary': None, 'positions': [], 'orders': [], 'errors': {}}
+        for call, key in zip(calls, ('summary', 'positions', 'orders')):
+            try:
+                value = futures[(client.name, call)].result()
+            except Exception as e:
+                book['errors'][key] = str(e)
+                continue
+            if key == 'summary':
+                book[key] = _row(value, ACCOUNT_FIELDS)
+            else:
+                book[key] = [_row(r, POSITION_FIELDS if key == 'positions' else ORDER_FIELDS) for r in value]
+        books.append(book)
+    return books
+
+
+def _money(value):
+    return "-" if value is None else f"${value:,.2f}"
+
 
-# Initialize Alpaca API
-api_key = os.getenv("APCA_API_KEY_ID")
-api_secret = os.getenv("APCA_API_SECRET_KEY")
-base_url = os.getenv("APCA_API_BASE_URL", "https://paper-api.alpaca.markets")
+def _table(rows, columns, out):
+    """Text columns; ``columns`` are (label, format, right-aligned) triples."""
+    cells = [[label for label, _, _ in columns]] + [[fmt(row) for _, fmt, _ in columns] for row in rows]
+    widths = [max(len(line[i]) for line in cells) for i in range(len(columns))]
+    for line in cells:
+        out.write("  ".join(cell.rjust(w) if right else cell.ljust(w)
+                            for cell, w, (_, _, right) in zip(line, widths, columns)).rstrip() + "\n")
 
-api = tradeapi.REST(
-    key_id=api_key,
-    secret_key=api_secret,
-    base_url=base_url
+
+POSITION_COLUMNS = (
+    ('SYMBOL', lambda r: r['symbol'], False),
+    ('SIDE', lambda r: r['side'], False),
+    ('QTY', lambda r: format_qty(r['qty']), True),
+    ('MARKET VALUE', lambda r: _money(r['market_value']), True),
+    ('UNREALIZED P&L', lambda r: _money(r['unrealized_pl']), True),
+)
+
+ORDER_COLUMNS = (
+    ('ID', lambda r: r['id'], False),
+    ('SYMBOL', lambda r: r['symbol'], False),
+    ('SIDE', lambda r: r['side'], False),
+    ('TYPE', lambda r: r['type'], False),
+    ('QTY', lambda r: format_qty(r['qty']), True),
+    ('FILLED', lambda r: format_qty(r['filled_qty']), True),
+    ('LIMIT', lambda r: _money(r['limit_price']), True),
+    ('STATUS', lambda r: r['status'], False),
+    ('SUBMITTED', lambda r: str(r['submitted_at']), False),
 )
 
-print("Checking account...")
-account = api.get_account()
-print(f"Account ID: {account.id}")
-print(f"Account Status: {account.status}")
-print(f"Portfolio Value: ${float(account.portfolio_value):,.2f}")
-print(f"Cash: ${float(account.cash):,.2f}")
-print("\nChecking positions...")
-
-try:
-    positions = api.list_positions()
-    print(f"Found {len(positions)} positions:")
-    for pos in positions:
-        print(f"\nPosition for {pos.symbol}:")
-        print(f"  Quantity: {pos.qty}")
-        print(f"  Side: {pos.side}")
-        print(f"  Market Value: ${float(pos.market_value):,.2f}")
-        print(f"  Cost Basis: ${float(pos.cost_basis):,.2f}")
-        print(f"  Unrealized P&L: ${float(pos.unrealized_pl):,.2f}")
-except Exception as e:
-    print(f"Error getting positions: {str(e)}")
-
-print("\nChecking open orders...")
-try:
-    orders = api.list_orders(status='open')
-    print(f"Found {len(orders)} open orders:")
-    for order in orders:
-        print(f"\nOrder for {order.symbol}:")
-        print(f"  ID: {order.id}")
-        print(f"  Type: {order.type}")
-        print(f"  Side: {order.side}")
-        print(f"  Qty: {order.qty}")
-        print(f"  Status: {order.status}")
-except Exception as e:
-    print(f"Error getting orders: {str(e)}")
+
+def write_table(books, out):
+    for book in books:
+        summary = book['summary']
+        if summary:
+            out.write(f"{book['account']}  {summary['status']}  equity {_money(summary['equity'])}  "
+                      f"cash {_money(summary['cash'])}  buying power {_money(summary['buying_power'])}\n")
+        else:
+            out.write(f"{book['account']}\n")
+        for key, error in book['errors'].items():
+            out.write(f"  error fetching {key}: {error}\n")
+        out.write(f"\n{len(book['positions'])} positions\n")
+        if book['positions']:
+            _table(book['positions'], POSITION_COLUMNS, out)
+        out.write(f"\n{len(book['orders'])} open orders\n")
+        if book['orders']:
+            _table(book['orders'], ORDER_COLUMNS, out)
+        out.write("\n")
+
+
+def write_json(books, out):
+    json.dump(books, out, indent=2, default=str)
+    out.write("\n")
+
+
+def write_csv(books, out):
+    """One row per account summary, position and order, told apart by ``kind``."""
+    fields = ['account', 'kind'] + list(dict.fromkeys(ACCOUNT_FIELDS + POSITION_FIELDS + ORDER_FIELDS))
+    writer = csv.DictWriter(out, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    for book in books:
+        if book['summary']:
+            writer.writerow({'account': book['account'], 'kind': 'account', **book['summary']})
+        for row in book['positions']:
+            writer.writerow({'account': book['account'], 'kind': 'position', **row})
+        for row in book['orders']:
+            writer.writerow({'account': book['account'], 'kind': 'order', **row})
+
+
+WRITERS = {'table': write_table, 'json': write_json, 'csv': write_csv}
+
+
+def _keyed(books):
+    rows = {}
+    for book in books:
+        # An account whose fetch failed is left out, so a blip doesn't read as everything closing
+        if 'positions' not in book['errors']:
+            rows.update({('position', book['account'], r['symbol']): r for r in book['positions']})
+        if 'orders' not in book['errors']:
+            rows.update({('order', book['account'], r['id']): r for r in book['orders']})
+    return rows
+
+
+def diff(before, after, failed=()):
+    """New, closed and changed positions/orders between two ``fetch`` results."""
+    old, new = _keyed(before), _keyed(after)
+    changes = []
+    for key in new.keys() - old.keys():
+        changes.append({'change': 'new', 'kind': key[0], 'account': key[1], 'key': key[2], 'record': new[key]})
+    for key in old.keys() - new.keys():
+        if (key[1], key[0] + 's') in failed:
+            continue
+        changes.append({'change': 'closed', 'kind': key[0], 'account': key[1], 'key': key[2], 'record': old[key]})
+    for key in old.keys() & new.keys():
+        fields = POSITION_DIFF_FIELDS if key[0] == 'position' else ORDER_DIFF_FIELDS
+        changed = {f: [old[key][f], new[key][f]] for f in fields if old[key][f] != new[key][f]}
+        if changed:
+            changes.append({'change': 'changed', 'kind': key[0], 'account': key[1], 'key': key[2],
+                            'record': new[key], 'fields': changed})
+    return sorted(changes, key=lambda c: (c['account'], c['kind'], c['key']))
+
+
+def write_changes(changes, fmt, out, csv_writer=None):
+    stamp = datetime.now().astimezone().isoformat(timespec='seconds')
+    for change in changes:
+        if fmt == 'json':
+            out.write(json.dumps({'time': stamp, **change}, default=str) + "\n")
+        elif fmt == 'csv':
+            csv_writer.writerow({'time': stamp, 'change': change['change'], 'kind': change['kind'],
+                                 'account': change['account'], 'key': change['key'],
+                                 'fields': json.dumps(change.get('fields', {}), default=str),
+                                 **change['record']})
+        else:
+            mark = {'new': '+', 'closed': '-', 'changed': '~'}[change['change']]
+            detail = ", ".join(f"{f} {a} -> {b}" for f, (a, b) in change.get('fields', {}).items())
+            record = change['record']
+            summary = detail or f"{record['side']} {format_qty(record['qty'])}" + (
+                f" {record['status']}" if change['kind'] == 'order' else "")
+            out.write(f"{stamp} {change['account']:<6} {mark} {change['kind']:<8} {change['key']}  {summary}\n")
+    out.flush()
+
+
+def watch(clients, executor, interval: float, fmt: str, out):
+    books = fetch(clients, executor)
+    WRITERS[fmt](books, out)
+    out.flush()
+    csv_writer = None
+    if fmt == 'csv':
+        fields = ['time', 'change', 'kind', 'account', 'key', 'fields'] + list(dict.fromkeys(POSITION_FIELDS + ORDER_FIELDS))
+        csv_writer = csv.DictWriter(out, fieldnames=fields, extrasaction='ignore')
+        out.write("\n")
+        csv_writer.writeheader()
+    while True:
+        time.sleep(interval)
+        latest = fetch(clients, executor)
+        failed = {(book['account'], key) for book in latest for key in book['errors']}
+        for book in latest:
+            for key, error in book['errors'].items():
+                print(f"{book['account']}: error fetching {key}: {error}", file=sys.stderr)
+        write_changes(diff(books, latest, failed), fmt, out, csv_writer)
+        # Keep the last good rows of a failed fetch as the baseline for the next diff
+        for old, new in zip(books, latest):
+            for key in new['errors']:
+                new[key] = old[key]
+            new['errors'] = {}
+        books = latest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show account, positions and open orders.")
+    parser.add_argument('-a', '--account', action='append', choices=sorted(ACCOUNTS) + ['all'],
+                        help="account to check; repeat for several (default: paper)")
+    parser.add_argument('-f', '--format', choices=sorted(WRITERS), default='table')
+    parser.add_argument('-w', '--watch', type=float, metavar='SECONDS', nargs='?', const=5.0,
+                        help="keep polling every SECONDS (default 5) and print only changes")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    names = args.account or ['paper']
+    names = list(ACCOUNTS) if 'all' in names else list(dict.fromkeys(names))
+    clients = [AlpacaClient.from_env(name) for name in names]
+    with ThreadPoolExecutor(max_workers=3 * len(clients)) as executor:
+        if args.watch:
+            try:
+                watch(clients, executor, args.watch, args.format, sys.stdout)
+            except KeyboardInterrupt:
+                return 0
+        books = fetch(clients, executor)
+    WRITERS[args.format](books, sys.stdout)
+    return 1 if any(book['errors'] for book in books) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,258 @@
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytz
+
+from tracing import span
+from web import render_placeholder
+
+# Rolling window in trading days
+CORRELATION_WINDOW = 60
+
+# Symbols whose average-linkage correlation is at least this end up in one cluster
+CLUSTER_CORRELATION = 0.6
+
+TOP_N = 10
+
+# Incremental sums drift; they are rebuilt from the window buffer this often
+REBUILD_EVERY = 250
+
+
+class RollingCorrelation:
+    """Correlation matrix over the last ``window`` daily returns, updated per new day.
+
+    Keeps the window's returns plus running sums of ``x`` and ``x x^T``, so a
+    new day costs one rank-k update of an N x N matrix instead of a pass
+    over the whole window. A change in the symbol set starts over.
+    """
+
+    def __init__(self, window: int = CORRELATION_WINDOW):
+        self.window = window
+        self.symbols = ()
+        self.last_time = None
+        self._rows = np.empty((0, 0))
+        self._sum = np.empty(0)
+        self._outer = np.empty((0, 0))
+        self._updates = 0
+        self._matrix = None
+        self._clusters = {}
+
+    def update(self, symbols, times, returns) -> int:
+        """Add return rows (T x N, oldest first) newer than the last one seen; returns rows changed.
+
+        A row at the last time seen replaces the last row, since the
+        current day's bar keeps moving until the close.
+        """
+        symbols = tuple(symbols)
+        if symbols != self.symbols:
+            self.symbols, self.last_time = symbols, None
+            self._rows = np.empty((0, len(symbols)))
+            self._sum = np.zeros(len(symbols))
+            self._outer = np.zeros((len(symbols), len(symbols)))
+        times = np.asarray(times)
+        returns = np.asarray(returns, dtype=np.float64)
+        revised = 0
+        if self.last_time is not None and len(self._rows):
+            same = np.flatnonzero(times == self.last_time)
+            if len(same) and not np.array_equal(returns[same[-1]], self._rows[-1]):
+                old, row = self._rows[-1].copy(), returns[same[-1]]
+                self._rows[-1] = row
+                self._sum += row - old
+                self._outer += np.outer(row, row) - np.outer(old, old)
+                self._matrix = None
+                self._clusters = {}
+                revised = 1
+        fresh = slice(None) if self.last_time is None else times > self.last_time
+        new = returns[fresh][-self.window:]
+        if not len(new):
+            return revised
+
+        rows = np.concatenate([self._rows, new])
+        dropped, self._rows = rows[:-self.window], rows[-self.window:]
+        self._updates += len(new)
+        if self._updates >= REBUILD_EVERY:
+            self._sum = self._rows.sum(axis=0)
+            self._outer = self._rows.T @ self._rows
+            self._updates = 0
+        else:
+            self._sum += new.sum(axis=0) - dropped.sum(axis=0)
+            self._outer += new.T @ new - dropped.T @ dropped
+        self.last_time = times[-1]
+        self._matrix = None
+        self._clusters = {}
+        return revised + len(new)
+
+    def matrix(self) -> np.ndarray:
+        """Correlation matrix; symbols with no variance in the window correlate 0 with everything."""
+        if self._matrix is None:
+            n = len(self._rows)
+            if n < 2:
+                return np.eye(len(self.symbols))
+            cov = (self._outer - np.outer(self._sum, self._sum) / n) / (n - 1)
+            std = np.sqrt(np.clip(np.diag(cov), 0.0, None))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                corr = cov / np.outer(std, std)
+            corr = np.clip(np.nan_to_num(corr), -1.0, 1.0)
+            np.fill_diagonal(corr, 1.0)
+            self._matrix = corr
+        return self._matrix
+
+    def clusters(self, threshold: float = CLUSTER_CORRELATION):
+        """``cluster`` of the current matrix, reused until the next update."""
+        if threshold not in self._clusters:
+            self._clusters[threshold] = cluster(self.matrix(), threshold)
+        return self._clusters[threshold]
+
+
+def cluster(corr, threshold: float = CLUSTER_CORRELATION):
+    """Average-linkage clusters of a correlation matrix, stopping below ``threshold``.
+
+    Returns ``(labels, order)``; ``order`` lists symbols cluster by cluster in
+    merge order, which puts correlated blocks on the heatmap's diagonal.
+    """
+    n = len(corr)
+    similarity = corr.astype(np.float64, copy=True)
+    np.fill_diagonal(similarity, -np.inf)
+    sizes = np.ones(n)
+    members = [[i] for i in range(n)]
+    active = np.ones(n, dtype=bool)
+    while active.sum() > 1:
+        flat = np.argmax(similarity)
+        i, j = divmod(flat, n)
+        if similarity[i, j] < threshold:
+            break
+        # Lance-Williams update for average linkage: size-weighted mean of the two rows
+        merged = (sizes[i] * similarity[i] + sizes[j] * similarity[j]) / (sizes[i] + sizes[j])
+        similarity[i], similarity[:, i] = merged, merged
+        similarity[i, i] = -np.inf
+        similarity[j], similarity[:, j] = -np.inf, -np.inf
+        sizes[i] += sizes[j]
+        members[i].extend(members[j])
+        active[j] = False
+    labels = np.empty(n, dtype=int)
+    clusters = [members[i] for i in np.flatnonzero(active)]
+    for label, group in enumerate(clusters):
+        labels[group] = label
+    return labels, [i for group in clusters for i in group]
+
+
+def concentration(exposures, top: int = TOP_N):
+    """Share of gross exposure in the largest positions, plus HHI and effective position count."""
+    gross = np.abs(exposures)
+    total = gross.sum()
+    if total == 0:
+        return {'gross': 0.0, 'hhi': None, 'effective_positions': None, 'top_share': None}
+    weights = np.sort(gross / total)[::-1]
+    hhi = float(np.sum(weights ** 2))
+    return {
+        'gross': float(total),
+        'hhi': hhi,
+        'effective_positions': 1.0 / hhi,
+        'top_share': float(weights[:top].sum()),
+        'top': top,
+    }
+
+
+class CorrelationCache:
+    """One RollingCorrelation per (account, window), refreshed from the bar cache."""
+
+    def __init__(self, bar_cache):
+        self.bar_cache = bar_cache
+        self._states = {}
+        self._lock = threading.Lock()
+
+    @span("correlation.report")
+    def report(self, key, book, window: int = CORRELATION_WINDOW, top: int = TOP_N,
+               threshold: float = CLUSTER_CORRELATION):
+        symbols = [p.symbol for p in book]
+        exposures = np.asarray(book.market_value, dtype=np.float64)
+        if not symbols:
+            return {'symbols': [], 'matrix': [], 'clusters': [], 'concentration': concentration(exposures, top)}
+
+        # Books are kept in broker order; sort so a reshuffle doesn't count as a new symbol set
+        ordered = sorted(symbols)
+        end = datetime.now(pytz.UTC)
+        # Calendar days covering the window's trading days plus weekends and holidays
+        start = end - timedelta(days=int(window * 1.5) + 10)
+        # Broker requests happen outside the lock so one slow fetch doesn't hold up other accounts
+        self.bar_cache.ensure(ordered, start.date(), end.date())
+        # Always re-read: other panels share the bar cache and may have refreshed today's bar
+        # already. update() skips rows it has seen, so the matrix only changes with the data.
+        closes = self.bar_cache.closes(ordered, start, end).reindex(columns=ordered).sort_index()
+        returns = closes.pct_change(fill_method=None).iloc[1:].fillna(0.0)
+        with self._lock:
+            state = self._states.setdefault((key, window), RollingCorrelation(window))
+            state.update(ordered, returns.index.asi8, returns.to_numpy())
+            corr = state.matrix()
+            labels, order = state.clusters(threshold)
+
+        exposure = dict(zip(symbols, exposures))
+        ordered_exposure = np.array([exposure[s] for s in ordered])
+        clusters = []
+        for label in np.unique(labels):
+            idx = np.flatnonzero(labels == label)
+            block = corr[np.ix_(idx, idx)]
+            clusters.append({
+                'symbols': [ordered[i] for i in idx],
+                'net': float(ordered_exposure[idx].sum()),
+                'gross': float(np.abs(ordered_exposure[idx]).sum()),
+                'avg_correlation': float((block.sum() - len(idx)) / (len(idx) * (len(idx) - 1))) if len(idx) > 1 else None,
+            })
+        clusters.sort(key=lambda c: c['gross'], reverse=True)
+        return {
+            'window': window,
+            'as_of': None if state.last_time is None else int(state.last_time // 10**9),
+            'symbols': [ordered[i] for i in order],
+            'matrix': np.round(corr[np.ix_(order, order)], 3).tolist(),
+            'clusters': clusters,
+            'concentration': concentration(exposures, top),
+        }
+
+
+def parse_correlation_args(args):
+    return {
+        'window': min(500, max(5, args.get('window', CORRELATION_WINDOW, type=int))),
+        'top': max(1, args.get('top', TOP_N, type=int)),
+    }
+
+
+# Heatmap plus the largest clusters; placeholders already filled are skipped, so
+# loadCorrelationPanels() is safe to call again after a deferred panel swap.
+CORRELATION_SCRIPT = """
+            <script>
+                function loadCorrelationPanels() {
+                    document.querySelectorAll('[data-correlation]:not([data-correlation-loaded])').forEach(function(el) {
+                        el.dataset.correlationLoaded = '1';
+                        const money = new Intl.NumberFormat(undefined, {style: 'currency', currency: 'USD', maximumFractionDigits: 0});
+                        fetch(el.dataset.correlation).then(r => r.json()).then(function(data) {
+                            if (data.error) { el.textContent = 'Correlation unavailable: ' + data.error; return; }
+                            if (data.symbols.length < 2) { el.remove(); return; }
+                            const c = data.concentration;
+                            el.innerHTML = '<h3>Concentration</h3><p>Top ' + c.top + ' positions hold ' +
+                                (c.top_share * 100).toFixed(1) + '% of gross exposure &middot; effective positions ' +
+                                c.effective_positions.toFixed(1) + '</p><div class="correlation-heatmap"></div><table>' +
+                                data.clusters.filter(k => k.symbols.length > 1).slice(0, 10).map(k => '<tr><td>' +
+                                k.symbols.slice(0, 8).join(', ') + (k.symbols.length > 8 ? ' +' + (k.symbols.length - 8) : '') +
+                                '</td><td class="num">' + money.format(k.net) + '</td><td class="num">&rho; ' +
+                                k.avg_correlation.toFixed(2) + '</td></tr>').join('') + '</table>';
+                            Plotly.newPlot(el.querySelector('.correlation-heatmap'), [{
+                                type: 'heatmap', x: data.symbols, y: data.symbols, z: data.matrix,
+                                zmin: -1, zmax: 1, colorscale: 'RdBu', reversescale: true
+                            }], {
+                                height: Math.min(800, 200 + 12 * data.symbols.length),
+                                margin: {l: 60, r: 10, t: 10, b: 60},
+                                paper_bgcolor: 'rgba(0,0,0,0)',
+                                yaxis: {autorange: 'reversed'}
+                            });
+                        });
+                    });
+                }
+                loadCorrelationPanels();
+            </script>
+"""
+
+
+def render_correlation_panel(endpoint):
+    """Placeholder element picked up by ``CORRELATION_SCRIPT``; styled like the risk panel."""
+    return render_placeholder('risk-panel', 'correlation', endpoint)
@@ -0,0 +1,163 @@
+import threading
+from collections import OrderedDict
+
+from models import OrderRecord, PositionRecord, format_qty
+
+# Upper bound on cached cards across all accounts and pages
+FRAGMENT_CACHE_SIZE = 10000
+
+
+class FragmentCache:
+    """Bounded LRU of rendered HTML fragments.
+
+    Keys are ``(kind, symbol, content)`` where ``content`` is the tuple of the
+    record's fields, so a card is rendered again only when something it shows
+    has changed and an unchanged book costs one dict lookup per card.
+    """
+
+    def __init__(self, max_entries: int = FRAGMENT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_render(self, key, render):
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return html
+            self.misses += 1
+        html = render()
+        with self._lock:
+            self._entries[key] = html
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+fragment_cache = FragmentCache()
+
+
+def _content(record):
+    return tuple(getattr(record, name) for name in record.__slots__)
+
+
+def _position_card(position: PositionRecord):
+    pl_color = "green" if position.unrealized_pl >= 0 else "red"
+    return f"""
+            <div class="position-card">
+                <div class="position-header">
+                    <h3>{position.symbol}</h3>
+                    <span class="quantity">{format_qty(position.qty)} shares</span>
+                </div>
+                <svg class="sparkline" data-symbol="{position.symbol}" viewBox="0 0 100 30" preserveAspectRatio="none"></svg>
+                <div class="position-details">
+                    <div class="detail">
+                        <span class="label">Market Value:</span>
+                        <span class="value">${position.market_value:,.2f}</span>
+                    </div>
+                    <div class="detail">
+                        <span class="label">Average Cost:</span>
+                        <span class="value">${position.avg_entry_price:,.2f}</span>
+                    </div>
+                    <div class="detail">
+                        <span class="label">P&L:</span>
+                        <span class="value" style="color: {pl_color}">${position.unrealized_pl:,.2f}</span>
+                    </div>
+                </div>
+            </div>
+            """
+
+
+def _order_card(order: OrderRecord, cancel_prefix: str):
+    return f"""
+            <div class="order-card">
+                <div class="order-header">
+                    <h4>{order.symbol}</h4>
+                    <span class="order-status">{order.status}</span>
+                </div>
+                <div class="order-details">
+                    <div class="detail">
+                        <span class="label">Type:</span>
+                        <span class="value">{order.type} {order.side}</span>
+                    </div>
+                    <div class="detail">
+                        <span class="label">Quantity:</span>
+                        <span class="value">{format_qty(order.qty)}</span>
+                    </div>
+                    <div class="detail">
+                        <span class="label">Submitted:</span>
+                        <span class="value">{order.submitted_at}</span>
+                    </div>
+                </div>
+                <form action="{cancel_prefix}/{order.id}" method="post" style="margin-top: 10px;">
+                    <button type="submit" class="cancel-button">Cancel Order</button>
+                </form>
+            </div>
+            """
+
+
+def render_position_card(position: PositionRecord):
+    key = ('position', position.symbol, _content(position))
+    return fragment_cache.get_or_render(key, lambda: _position_card(position))
+
+
+def render_order_card(order: OrderRecord, cancel_prefix: str):
+    """``cancel_prefix`` is the cancel route without the order ID, e.g. ``/cancel_order``."""
+    key = ('order', order.symbol, cancel_prefix, _content(order))
+    return fragment_cache.get_or_render(key, lambda: _order_card(order, cancel_prefix))
+
+
+def render_position_cards(positions, sparklines: str = None):
+    """``sparklines`` is the endpoint ``SPARKLINE_SCRIPT`` fills the cards' sparklines from."""
+    cards = "".join([render_position_card(position) for position in positions])
+    if sparklines is None:
+        return cards
+    return f'<div class="position-cards" data-sparklines="{sparklines}">{cards}</div>'
+
+SPARKLINE_CSS = """
+                .sparkline {
+                    width: 100%;
+                    height: 30px;
+                    margin-bottom: 10px;
+                }
+"""
+
+# One request per card container; symbols without bars keep an empty sparkline.
+# loadSparklines() only picks up containers not yet filled, so it can run
+# again after cards are swapped in later (deferred panels).
+SPARKLINE_SCRIPT = """
+            <script>
+                function loadSparklines() {
+                    document.querySelectorAll('[data-sparklines]:not([data-sparklines-loaded])').forEach(function(el) {
+                        el.dataset.sparklinesLoaded = '1';
+                        fetch(el.dataset.sparklines).then(r => r.json()).then(function(stats) {
+                            el.querySelectorAll('.sparkline').forEach(function(svg) {
+                                const s = stats[svg.dataset.symbol];
+                                if (!s) return;
+                                const lo = Math.min(...s.closes), hi = Math.max(...s.closes);
+                                const points = s.closes.map((c, i) => (i * 100 / (s.closes.length - 1)).toFixed(1) + ',' +
+                                    (28 - (hi > lo ? (c - lo) / (hi - lo) : 0.5) * 26).toFixed(1)).join(' ');
+                                const color = s['return'] >= 0 ? '#00C805' : '#FF5000';
+                                svg.innerHTML = '<title>30d ' + (s['return'] * 100).toFixed(2) + '%' +
+                                    (s.volatility === null ? '' : ', vol ' + (s.volatility * 100).toFixed(1) + '%') +
+                                    '</title><polyline fill="none" stroke="' + color + '" stroke-width="1.5" ' +
+                                    'vector-effect="non-scaling-stroke" points="' + points + '"/>';
+                            });
+                        });
+                    });
+                }
+                loadSparklines();
+            </script>
+"""
+
+
+def render_order_cards(orders, cancel_prefix: str):
+    return "".join([render_order_card(order, cancel_prefix) for order in orders])
@@ -1,4 +1,4 @@
-from flask import Flask, request, redirect
+from flask import Flask, Response, jsonify, request, redirect, stream_with_context
 import alpaca_trade_api as tradeapi
 import os
 from dotenv import load_dotenv
@@ -7,28 +7,61 @@ from plotly.utils import PlotlyJSONEncoder
 import json
 from datetime import datetime, timedelta
 import pytz
-import traceback
+import logging
+import time
+
+from analytics import ANALYTICS_CSS, ANALYTICS_SCRIPT, EquityAnalytics, render_analytics_panel
+from bar_cache import BarCache, sparkline_stats
+from benchmarks import add_benchmark_traces, benchmark_overlays
+from bulk_cancel import (BULK_CANCEL_CSS, bulk_cancel, bulk_cancel_job, parse_cancel_args, render_bulk_cancel_form,
+                         render_bulk_cancel_page, start_bulk_cancel)
+from correlation import CORRELATION_SCRIPT, CorrelationCache, parse_correlation_args, render_correlation_panel
+from fragments import SPARKLINE_CSS, SPARKLINE_SCRIPT, render_order_cards, render_position_cards
+from logs import install_logging
+from metrics import CHART_BUILD, cache_result, install_metrics, instrument_api
+from models import AccountRecord, OrderRecord, PortfolioSnapshot, PositionBook, SnapshotRef
+from order_sync import list_all_orders
+from profiling import install_profiling
+from rebalance import rebalance_request, render_rebalance_page
+from replay import tape_api
+from recorder import RECORDED_CHART_SCRIPT, EquityRecorder, parse_recorded_args, recorded_json, render_recorded_chart
+from risk import RISK_CSS, RISK_SCRIPT, parse_risk_args, render_risk_panel, risk_report
+from rollups import EQUITY_ZOOM_SCRIPT, EquityPyramid, equity_json, parse_range_args, render_equity_zoom
+from resilience import PanelFetcher, PanelResult, deadline_from_now
+from scheduler import RISK, priority, schedule_api
+from tables import (CARD_LIMIT, ORDER_COLUMNS, POSITION_COLUMNS, VIRTUAL_TABLE_CSS, VIRTUAL_TABLE_SCRIPT,
+                    parse_table_args, query_records, render_virtual_table)
+from tracing import install_tracing, span
+from web import json_errors
 
 app = Flask(__name__)
 
+# Request latency histograms plus broker and cache counters on /metrics
+install_metrics(app)
+
+# Admin-only per-request profiles (?profile=<PROFILE_TOKEN>) and optional continuous sampling
+install_profiling(app)
+
+# Request, broker call and render spans, exported when TRACE_FILE or TRACE_ENDPOINT is set
+install_tracing(app, 'live_dashboard')
+
 # Load environment variables
 load_dotenv(verbose=True)
 
-# Print environment variables for debugging (without showing actual values)
-print("\nEnvironment variables loaded from:", os.path.abspath('.env'))
-print("Current working directory:", os.getcwd())
-print("\nEnvironment variables:")
-print(f"APCA_API_KEY_ID: {os.getenv('APCA_API_KEY_ID')}")
-print(f"APCA_API_SECRET_KEY exists: {bool(os.getenv('APCA_API_SECRET_KEY'))}")
-print(f"APCA_API_BASE_URL: {os.getenv('APCA_API_BASE_URL')}")
+# JSON logs written from a background thread; request threads only enqueue
+install_logging(app)
+logger = logging.getLogger('live_dashboard')
 
-print("\nChecking file contents:")
-try:
-    with open(os.path.abspath('.env'), 'r') as f:
-        env_contents = f.read()
-        print("Found .env file with", len(env_contents.splitlines()), "lines")
-except Exception as e:
-    print("Error reading .env:", str(e))
+# Log the environment for debugging (without showing secret values)
+env_path = os.path.abspath('.env')
+logger.info("Environment loaded", extra={
+    'env_file': env_path,
+    'env_file_found': os.path.exists(env_path),
+    'cwd': os.getcwd(),
+    'api_key_id_length': len(os.getenv('APCA_API_KEY_ID') or ''),
+    'api_secret_set': bool(os.getenv('APCA_API_SECRET_KEY')),
+    'base_url': os.getenv('APCA_API_BASE_URL'),
+})
 
 # Initialize Alpaca API for live trading
 try:
@@ -36,34 +69,43 @@ try:
     api_secret = os.getenv("APCA_API_SECRET_KEY")
     base_url = os.getenv("APCA_API_BASE_URL", "https://paper-api.alpaca.markets")
     
-    print(f"\nAPI Configuration:")
-    print(f"Key ID length: {len(api_key) if api_key else 'None'}")
-    print(f"Secret length: {len(api_secret) if api_secret else 'None'}")
-    print(f"Base URL: {base_url}")
-    
-    api = tradeapi.REST(
+    api = schedule_api(instrument_api(tape_api(tradeapi.REST(
         key_id=api_key,
         secret_key=api_secret,
         base_url=base_url
+    ), account='live_trading'), account='live_trading'), account='live_trading')
+    logger.info("API initialized", extra={'base_url': base_url})
+except Exception:
+    logger.exception("Error initializing API")
+
+def get_portfolio_history():
+    # Get account history for the last 30 days
+    end = datetime.now(pytz.UTC)
+    start = end - timedelta(days=30)
+    
+    return api.get_portfolio_history(
+        date_start=start.date(),
+        date_end=end.date(),
+        timeframe='1D'
     )
-    print("\nAPI initialized successfully")
-except Exception as e:
-    print(f"\nError initializing API: {str(e)}")
-    traceback.print_exc()
 
-def get_performance_chart():
+def record_equity(portfolio_history):
+    """Feed a history response to the analytics engine; the first call backfills a year."""
+    if not len(analytics):
+        year = api.get_portfolio_history(period='1A', timeframe='1D')
+        analytics.update(year.timestamp, year.equity)
+    analytics.update(portfolio_history.timestamp, portfolio_history.equity)
+    # Intraday equity for zooming; at most one 1-minute history call per minute
+    try:
+        equity_pyramid.refresh(api)
+    except Exception:
+        logger.exception("Error refreshing intraday equity")
+    return portfolio_history
+
+@span("chart.build")
+def get_performance_chart(portfolio_history):
+    started = time.perf_counter()
     try:
-        # Get account history for the last 30 days
-        end = datetime.now(pytz.UTC)
-        start = end - timedelta(days=30)
-        
-        # Get portfolio history
-        portfolio_history = api.get_portfolio_history(
-            date_start=start.date(),
-            date_end=end.date(),
-            timeframe='1D'
-        )
-        
         # Create time series
         dates = [datetime.fromtimestamp(t, pytz.UTC) for t in portfolio_history.timestamp]
         equity = portfolio_history.equity
@@ -90,6 +132,12 @@ def get_performance_chart():
             hovertemplate='$%{y:,.2f}<extra>P&L</extra>'
         ))
         
+        # Benchmarks start at the same equity; a failed bar fetch only drops the overlay
+        try:
+            add_benchmark_traces(fig, dates, benchmark_overlays(bar_cache, portfolio_history.timestamp, equity))
+        except Exception:
+            logger.exception("Error adding benchmarks")
+        
         # Update layout
         fig.update_layout(
             title='Live Trading Performance (30 Days)',
@@ -119,231 +167,276 @@ def get_performance_chart():
             )
         )
         
-        return json.dumps(fig, cls=PlotlyJSONEncoder)
-    except Exception as e:
-        print(f"Error creating performance chart: {str(e)}")
-        traceback.print_exc()
+        chart_json = json.dumps(fig, cls=PlotlyJSONEncoder)
+        CHART_BUILD.observe(time.perf_counter() - started, account='live_trading')
+        return chart_json
+    except Exception:
+        logger.exception("Error creating performance chart")
         return None
 
-@app.route('/')
-def dashboard():
-    try:
-        # Test API connection first
-        try:
-            print("Attempting to connect to Alpaca API...")
-            account = api.get_account()
-            print("Successfully connected to API")
-        except Exception as api_error:
-            print(f"API Connection Error: {str(api_error)}")
-            traceback.print_exc()
-            return f"""
-            <html>
-                <body style="font-family: system-ui; padding: 20px;">
-                    <h1>API Connection Error</h1>
-                    <p>Failed to connect to Alpaca Live Trading API:</p>
-                    <pre style="background: #f8f8f8; padding: 15px; border-radius: 5px;">{str(api_error)}\n\n{traceback.format_exc()}</pre>
-                    <h2>Debug Information:</h2>
-                    <ul>
-                        <li>API Key ID exists: {"Yes" if os.getenv("APCA_API_KEY_ID") else "No"}</li>
-                        <li>API Secret exists: {"Yes" if os.getenv("APCA_API_SECRET_KEY") else "No"}</li>
-                        <li>API Base URL: {os.getenv("APCA_API_BASE_URL", "https://paper-api.alpaca.markets")}</li>
-                    </ul>
-                    <p>Please verify your live trading credentials in the .env file.</p>
-                    <p>Make sure you're using credentials from the Live Trading section, not Paper Trading.</p>
-                </body>
-            </html>
-            """, 500
-            
-        # Get account information
-        account = api.get_account()
-        
-        # Get positions
-        positions = api.list_positions()
-        
-        # Get open orders
-        orders = api.list_orders(status='open')
-        
-        # Get performance chart
-        chart_json = get_performance_chart()
-        
-        # Format positions HTML
-        positions_html = ""
-        if positions:
-            for position in positions:
-                pl_color = "green" if float(position.unrealized_pl) >= 0 else "red"
-                positions_html += f"""
-                <div class="position-card">
-                    <div class="position-header">
-                        <h3>{position.symbol}</h3>
-                        <span class="quantity">{position.qty} shares</span>
-                    </div>
-                    <div class="position-details">
-                        <div class="detail">
-                            <span class="label">Market Value:</span>
-                            <span class="value">${float(position.market_value):,.2f}</span>
-                        </div>
-                        <div class="detail">
-                            <span class="label">Average Cost:</span>
-                            <span class="value">${float(position.avg_entry_price):,.2f}</span>
-                        </div>
-                        <div class="detail">
-                            <span class="label">P&L:</span>
-                            <span class="value" style="color: {pl_color}">${float(position.unrealized_pl):,.2f}</span>
-                        </div>
-                    </div>
-                </div>
-                """
-            
-            positions_html += """
-            <form action="/liquidate" method="post" class="liquidate-form">
-                <button type="submit" class="liquidate-button">🚨 Liquidate All Positions</button>
-            </form>
-            """
-        else:
-            positions_html = "<p class='no-positions'>No open positions</p>"
+# Upstream calls behind each dashboard panel, keyed by broker endpoint
+fetcher = PanelFetcher()
+
+# Latest complete PortfolioSnapshot, swapped in whole after a fully fresh page load;
+# the table, risk and correlation endpoints read it while it is fresh
+snapshots = SnapshotRef()
+
+# Matches the page's auto-refresh interval
+SNAPSHOT_MAX_AGE = 10
+
+# Daily bars for held symbols, filled in one batched request per missing range
+bar_cache = BarCache(api)
+
+# Return/drawdown statistics, extended with each portfolio history refresh
+analytics = EquityAnalytics()
+
+# Rolling correlation per window, updated as new daily bars land
+correlations = CorrelationCache(bar_cache)
+
+# Equity at 1Min/5Min/1H/1D so chart zoom and pan never call the broker
+equity_pyramid = EquityPyramid()
+
+# Every account snapshot this dashboard polls, kept on disk for the intraday chart
+recorder = EquityRecorder("Live Trading")
+PANEL_SOURCES = {
+    'get_account': lambda: AccountRecord.from_entity(api.get_account()),
+    'list_positions': lambda: PositionBook.from_entities(api.list_positions()),
+    'list_orders': lambda: tuple(OrderRecord.from_entity(o) for o in list_all_orders(api)),
+    'get_portfolio_history': lambda: get_performance_chart(record_equity(get_portfolio_history())),
+}
+
+def panel_placeholder(panel, label):
+    return f"""
+    <div class="panel-placeholder" data-panel="{panel}">Loading {label}...</div>
+    """
+
+def stale_note(result):
+    if result.source != 'cache' or result.age is None:
+        return ""
+    return f"""
+    <p class="stale-note">Showing cached data from {result.age:.0f}s ago{f" ({result.error})" if result.error else ""}</p>
+    """
+
+@span("render.metrics")
+def render_metrics_html(result):
+    if result.source == 'pending':
+        return panel_placeholder('metrics', 'account')
+    if result.source == 'error':
+        return f"""
+        <div class="error-card">
+            <p>Failed to connect to Alpaca Live Trading API: {result.error}</p>
+            <ul>
+                <li>API Key ID exists: {"Yes" if os.getenv("APCA_API_KEY_ID") else "No"}</li>
+                <li>API Secret exists: {"Yes" if os.getenv("APCA_API_SECRET_KEY") else "No"}</li>
+                <li>API Base URL: {os.getenv("APCA_API_BASE_URL", "https://paper-api.alpaca.markets")}</li>
+            </ul>
+            <p>Make sure you're using credentials from the Live Trading section, not Paper Trading.</p>
+        </div>
+        """
+    
+    account = result.value
+    return f"""
+    {stale_note(result)}
+    <div class="metrics-grid">
+        <div class="metric-card">
+            <div class="label">Portfolio Value</div>
+            <div class="metric">${account.portfolio_value:,.2f}</div>
+        </div>
         
-        # Format orders HTML
-        orders_html = ""
-        if orders:
-            orders_html = "<h2>Pending Orders</h2>"
-            for order in orders:
-                orders_html += f"""
-                <div class="order-card">
-                    <div class="order-header">
-                        <h4>{order.symbol}</h4>
-                        <span class="order-status">{order.status}</span>
-                    </div>
-                    <div class="order-details">
-                        <div class="detail">
-                            <span class="label">Type:</span>
-                            <span class="value">{order.type} {order.side}</span>
-                        </div>
-                        <div class="detail">
-                            <span class="label">Quantity:</span>
-                            <span class="value">{order.qty}</span>
-                        </div>
-                        <div class="detail">
-                            <span class="label">Submitted:</span>
-                            <span class="value">{order.submitted_at}</span>
-                        </div>
-                    </div>
-                    <form action="/cancel_order/{order.id}" method="post" style="margin-top: 10px;">
-                        <button type="submit" class="cancel-button">Cancel Order</button>
-                    </form>
-                </div>
-                """
+        <div class="metric-card">
+            <div class="label">Cash Balance</div>
+            <div class="metric">${account.cash:,.2f}</div>
+        </div>
         
-        return f"""
+        <div class="metric-card">
+            <div class="label">Buying Power</div>
+            <div class="metric">${account.buying_power:,.2f}</div>
+        </div>
+    </div>
+    """
+
+REBALANCE_LINK = '<p class="rebalance-link"><a href="/rebalance">Rebalance to target weights</a></p>'
+
+@span("render.positions")
+def render_positions_html(result):
+    if result.source == 'pending':
+        return panel_placeholder('positions', 'positions')
+    if result.source == 'error':
+        return f"<div class='error-card'>Positions unavailable: {result.error}</div>"
+    
+    positions = result.value
+    if not positions:
+        return stale_note(result) + "<p class='no-positions'>No open positions</p>" + REBALANCE_LINK
+    return "".join([
+        stale_note(result),
+        f"""
+        <p class="book-totals">
+            Gross exposure ${positions.gross_exposure:,.2f} &middot;
+            Net exposure ${positions.net_exposure:,.2f} &middot;
+            Unrealized P&L ${positions.total_unrealized_pl:,.2f}
+        </p>
+        """,
+        render_position_cards(positions, sparklines="/api/sparklines") if len(positions) <= CARD_LIMIT else render_virtual_table("/api/positions"),
+        render_risk_panel("/api/risk"),
+        render_correlation_panel("/api/correlation"),
+        """
+        <form action="/liquidate" method="post" class="liquidate-form">
+            <button type="submit" class="liquidate-button">🚨 Liquidate All Positions</button>
+        </form>
+        """,
+        REBALANCE_LINK,
+    ])
+
+@span("render.orders")
+def render_orders_html(result):
+    if result.source == 'pending':
+        return panel_placeholder('orders', 'orders')
+    if result.source == 'error':
+        return f"<div class='error-card'>Orders unavailable: {result.error}</div>"
+    
+    orders = result.value
+    if not orders:
+        return ""
+    return "".join([
+        stale_note(result),
+        "<h2>Pending Orders</h2>",
+        render_bulk_cancel_form("/cancel_orders"),
+        render_order_cards(orders, "/cancel_order") if len(orders) <= CARD_LIMIT else render_virtual_table("/api/orders", "/cancel_order"),
+    ])
+
+# Deferred panels: name -> (upstream endpoint, renderer)
+PANELS = {
+    'metrics': ('get_account', render_metrics_html),
+    'positions': ('list_positions', render_positions_html),
+    'orders': ('list_orders', render_orders_html),
+}
+
+@app.route('/panel/<name>')
+def panel(name):
+    """Fill in a panel that missed the page deadline."""
+    if name == 'chart':
+        result = fetcher.fetch('get_portfolio_history', PANEL_SOURCES['get_portfolio_history'])
+        return app.response_class(result.value or 'null', mimetype='application/json')
+    if name not in PANELS:
+        return "Unknown panel", 404
+    endpoint, render = PANELS[name]
+    result = fetcher.fetch(endpoint, PANEL_SOURCES[endpoint])
+    if result.source == 'pending':
+        # Still not ready; the client keeps the placeholder and retries with backoff
+        return "", 204
+    return render(result)
+
+PAGE_HEAD = """
         <html>
         <head>
             <title>QuantLogix Live Trading</title>
             <script src="https://cdn.plot.ly/plotly-latest.min.js"></script>
             <style>
-                body {{
+                body {
                     font-family: -apple-system, BlinkMacSystemFont, sans-serif;
                     margin: 0;
                     padding: 40px;
                     background: #f5f5f7;
                     color: #1d1d1f;
-                }}
-                .container {{
+                }
+                .container {
                     max-width: 1200px;
                     margin: 0 auto;
-                }}
-                .header {{
+                }
+                .header {
                     background: #1a1a1a;
                     color: white;
                     padding: 20px;
                     border-radius: 10px;
                     box-shadow: 0 2px 4px rgba(0,0,0,0.1);
                     margin-bottom: 20px;
-                }}
-                .nav-links {{
+                }
+                .nav-links {
                     display: flex;
                     gap: 20px;
                     margin-top: 10px;
-                }}
-                .nav-links a {{
+                }
+                .nav-links a {
                     color: #FFA500;
                     text-decoration: none;
                     padding: 5px 10px;
                     border-radius: 4px;
                     transition: all 0.3s ease;
-                }}
-                .nav-links a:hover {{
+                }
+                .nav-links a:hover {
                     background: rgba(255, 165, 0, 0.2);
-                }}
-                .nav-links a.active {{
+                }
+                .nav-links a.active {
                     color: #FF0000;
                     font-weight: bold;
-                }}
-                h1 {{
+                }
+                h1 {
                     margin: 0;
                     font-size: 24px;
                     color: white;
-                }}
-                .metrics-grid {{
+                }
+                .metrics-grid {
                     display: grid;
                     grid-template-columns: repeat(auto-fit, minmax(250px, 1fr));
                     gap: 20px;
                     margin-bottom: 30px;
-                }}
-                .metric-card {{
+                }
+                .metric-card {
                     background: white;
                     padding: 20px;
                     border-radius: 10px;
                     box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                }}
-                .metric {{
+                }
+                .metric {
                     font-size: 24px;
                     font-weight: bold;
                     color: #333;
-                }}
-                .label {{
+                }
+                .label {
                     color: #666;
                     font-size: 14px;
                     margin-bottom: 5px;
-                }}
-                .chart-section, .positions-section, .orders-section {{
+                }
+                .chart-section, .positions-section, .orders-section {
                     background: white;
                     padding: 20px;
                     border-radius: 10px;
                     box-shadow: 0 2px 4px rgba(0,0,0,0.1);
                     margin-bottom: 20px;
-                }}
-                .position-card, .order-card {{
+                }
+                .position-card, .order-card {
                     border: 1px solid #e5e5e5;
                     border-radius: 8px;
                     padding: 15px;
                     margin-bottom: 15px;
-                }}
-                .position-header, .order-header {{
+                }
+                .position-header, .order-header {
                     display: flex;
                     justify-content: space-between;
                     align-items: center;
                     margin-bottom: 10px;
-                }}
-                .position-header h3, .order-header h4 {{
+                }
+                .position-header h3, .order-header h4 {
                     margin: 0;
                     color: #1d1d1f;
-                }}
-                .quantity {{
+                }
+                .quantity {
                     background: #f5f5f7;
                     padding: 4px 8px;
                     border-radius: 4px;
                     font-size: 14px;
-                }}
-                .position-details, .order-details {{
+                }
+                .position-details, .order-details {
                     display: grid;
                     grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
                     gap: 10px;
-                }}
-                .detail {{
+                }
+                .detail {
                     display: flex;
                     justify-content: space-between;
                     align-items: center;
-                }}
-                .liquidate-button {{
+                }
+                .liquidate-button {
                     background: #ff3b30;
                     color: white;
                     border: none;
@@ -354,11 +447,11 @@ def dashboard():
                     width: 100%;
                     margin-top: 20px;
                     transition: background-color 0.2s;
-                }}
-                .liquidate-button:hover {{
+                }
+                .liquidate-button:hover {
                     background: #ff2d55;
-                }}
-                .cancel-button {{
+                }
+                .cancel-button {
                     background: #8e8e93;
                     color: white;
                     border: none;
@@ -368,50 +461,73 @@ def dashboard():
                     cursor: pointer;
                     width: 100%;
                     transition: background-color 0.2s;
-                }}
-                .cancel-button:hover {{
+                }
+                .cancel-button:hover {
                     background: #636366;
-                }}
-                .no-positions {{
+                }
+                .no-positions {
                     text-align: center;
                     color: #666;
                     padding: 20px;
-                }}
-                .status {{
+                }
+                .status {
                     display: inline-block;
                     padding: 4px 8px;
                     border-radius: 4px;
                     background: #34c759;
                     color: white;
                     font-size: 14px;
-                }}
-                .order-status {{
+                }
+                .order-status {
                     background: #007aff;
                     color: white;
                     padding: 4px 8px;
                     border-radius: 4px;
                     font-size: 14px;
-                }}
-                .nav-links {{
+                }
+                .error-card {
+                    background: #fff2f2;
+                    border: 1px solid #ffcfcf;
+                    padding: 15px;
+                    border-radius: 8px;
+                    color: #d70000;
+                    margin-bottom: 20px;
+                }
+                .book-totals {
+                    color: #666;
+                    font-size: 14px;
+                    margin: 0 0 15px;
+                }
+                .panel-placeholder {
+                    text-align: center;
+                    color: #8e8e93;
+                    padding: 20px;
+                }
+                .stale-note {
+                    color: #8e8e93;
+                    font-size: 13px;
+                    margin: 0 0 10px;
+                }
+                .nav-links {
                     display: flex;
                     gap: 20px;
                     margin-top: 10px;
-                }}
-                .nav-links a {{
+                }
+                .nav-links a {
                     color: #FFA500;
                     text-decoration: none;
                     padding: 5px 10px;
                     border-radius: 4px;
                     transition: all 0.3s ease;
-                }}
-                .nav-links a:hover {{
+                }
+                .nav-links a:hover {
                     background: rgba(255, 165, 0, 0.2);
-                }}
-                .nav-links a.active {{
+                }
+                .nav-links a.active {
                     color: #FF0000;
                     font-weight: bold;
-                }}
-            </style>
+                }
+""" + VIRTUAL_TABLE_CSS + SPARKLINE_CSS + ANALYTICS_CSS + RISK_CSS + BULK_CANCEL_CSS + """            </style>
         </head>
         <body>
             <div class="container">
@@ -422,66 +538,231 @@ def dashboard():
                         <a href="http://localhost:8001" class="active">Live Trading</a>
                     </div>
                 </div>
-                
-                <div class="metrics-grid">
-                    <div class="metric-card">
-                        <div class="label">Portfolio Value</div>
-                        <div class="metric">${float(account.portfolio_value):,.2f}</div>
-                    </div>
-                    
-                    <div class="metric-card">
-                        <div class="label">Cash Balance</div>
-                        <div class="metric">${float(account.cash):,.2f}</div>
-                    </div>
-                    
-                    <div class="metric-card">
-                        <div class="label">Buying Power</div>
-                        <div class="metric">${float(account.buying_power):,.2f}</div>
-                    </div>
-                </div>
+"""
 
-                <div class="chart-section">
-                    <h2>Performance</h2>
-                    <div id="performance-chart"></div>
-                </div>
+PAGE_TAIL = """
+            </div>
+""" + VIRTUAL_TABLE_SCRIPT + SPARKLINE_SCRIPT + ANALYTICS_SCRIPT + RISK_SCRIPT + CORRELATION_SCRIPT + EQUITY_ZOOM_SCRIPT + RECORDED_CHART_SCRIPT + """
 
-                <div class="positions-section">
-                    <h2>Current Positions</h2>
-                    {positions_html}
-                </div>
+            <script>
+                // Fill in panels that missed the page deadline, retrying with backoff while still pending
+                function fillPanel(el, attempt) {
+                    function retry() {
+                        if (attempt < 5) {
+                            setTimeout(function() { fillPanel(el, attempt + 1); }, 500 * Math.pow(2, attempt));
+                        } else {
+                            el.textContent = 'Unavailable; refresh to retry.';
+                        }
+                    }
+                    fetch('/panel/' + el.dataset.panel).then(function(r) {
+                        return r.status === 200 ? r.text() : null;
+                    }).then(function(html) {
+                        if (html === null) {
+                            retry();
+                        } else {
+                            el.outerHTML = html;
+                            // Scripts ran at load; set up whatever the late panel brought in
+                            loadSparklines();
+                            loadVirtualTables();
+                            loadRiskPanels();
+                            loadCorrelationPanels();
+                        }
+                    }).catch(retry);
+                }
+                document.querySelectorAll('[data-panel]').forEach(function(el) { fillPanel(el, 0); });
 
-                <div class="orders-section">
-                    {orders_html}
-                </div>
-            </div>
+                // Auto-refresh every 10 seconds
+                setTimeout(function() {
+                    window.location.reload();
+                }, 10000);
+            </script>
+        </body>
+        </html>
+"""
 
+@span("render.chart")
+def render_chart_script(result):
+    # Chart JSON is only inlined if it made the deadline; otherwise the client fetches it
+    chart_json = result.value if result.ready else None
+    chart_pending = 'true' if result.source == 'pending' else 'false'
+    return f"""
             <script>
                 // Initialize performance chart
                 const chartData = {chart_json or 'null'};
                 if (chartData) {{
                     Plotly.newPlot('performance-chart', chartData.data, chartData.layout);
+                }} else if ({chart_pending}) {{
+                    fetch('/panel/chart').then(r => r.json()).then(data => {{
+                        if (data) {{
+                            Plotly.newPlot('performance-chart', data.data, data.layout);
+                        }}
+                    }});
                 }}
-
-                // Auto-refresh every 10 seconds
-                setTimeout(function() {{
-                    window.location.reload();
-                }}, 10000);
             </script>
-        </body>
-        </html>
-        """
-    except Exception as e:
-        print(f"Error rendering dashboard: {str(e)}")
-        traceback.print_exc()
-        return f"""
-        <html>
-            <body style="font-family: system-ui; padding: 20px;">
-                <h1>Error</h1>
-                <p>An error occurred: {str(e)}</p>
-                <p>Please check your live trading API credentials in the .env file.</p>
-            </body>
-        </html>
-        """, 500
+    """
+
+@span("snapshot.publish")
+def publish_snapshot(results, started_at):
+    """Swap in a new snapshot, but only when every panel came back fresh in this request."""
+    # The recorder only needs the account and positions to be fresh
+    if results['get_account'].source == 'live' and results['list_positions'].source == 'live':
+        try:
+            recorder.record(results['get_account'].value, results['list_positions'].value,
+                            results['get_account'].fetched_at)
+        except Exception:
+            logger.exception("Error recording snapshot")
+    if any(result.source != 'live' for result in results.values()):
+        return
+    snapshots.publish(PortfolioSnapshot(
+        name="Live Trading",
+        account=results['get_account'].value,
+        positions=results['list_positions'].value,
+        orders=results['list_orders'].value,
+        chart_json=results['get_portfolio_history'].value,
+        fetched_at=started_at,
+    ))
+
+def book_result(endpoint):
+    """Positions or orders from the latest published snapshot while fresh, else from the fetcher.
+
+    Table pages, risk and correlation then all read one consistent book
+    instead of each racing its own upstream refresh.
+    """
+    snapshot = snapshots.get()
+    fresh = snapshot is not None and snapshot.age <= SNAPSHOT_MAX_AGE
+    cache_result('snapshot', fresh)
+    if fresh:
+        value = snapshot.positions if endpoint == 'list_positions' else snapshot.orders
+        return PanelResult(value=value, source="cache", fetched_at=snapshot.fetched_at)
+    return fetcher.fetch(endpoint, PANEL_SOURCES[endpoint])
+
+def api_table(endpoint, columns):
+    result = book_result(endpoint)
+    if not result.ready:
+        return jsonify({'error': result.error or 'Data not available yet'}), 503
+    args = parse_table_args(request.args, columns)
+    # A PositionBook lets numeric position columns sort vectorized
+    book = result.value if endpoint == 'list_positions' else None
+    return jsonify(query_records(result.value, columns, book=book, **args))
+
+@app.route('/api/positions')
+def api_positions():
+    """Sorted, filtered page of positions; numbers stay numeric and are formatted client-side."""
+    return api_table('list_positions', POSITION_COLUMNS)
+
+@app.route('/api/orders')
+def api_orders():
+    return api_table('list_orders', ORDER_COLUMNS)
+
+@app.route('/api/equity')
+def api_equity():
+    """Equity OHLC for ``?start=&end=&width=`` from the coarsest rollup level dense enough for the width."""
+    if not len(equity_pyramid):
+        try:
+            equity_pyramid.refresh(api, force=True)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 503
+    return jsonify(equity_json(equity_pyramid, **parse_range_args(request.args)))
+
+@app.route('/api/recorded')
+def api_recorded():
+    """Recorded snapshots for ``?start=&end=`` (epoch seconds), thinned to ``max_points``."""
+    return jsonify(recorded_json(recorder, **parse_recorded_args(request.args)))
+
+@app.route('/api/analytics')
+def api_analytics():
+    """Precomputed return and drawdown statistics plus the per-point series behind the charts."""
+    if not len(analytics):
+        result = fetcher.fetch('get_portfolio_history', PANEL_SOURCES['get_portfolio_history'])
+        if result.source == 'error':
+            return jsonify({'error': result.error}), 503
+    return jsonify({
+        'summary': analytics.summary(),
+        'series': analytics.series(since=request.args.get('since', type=float)),
+    })
+
+@app.route('/api/risk')
+@json_errors
+def api_risk():
+    """One-day VaR/ES and shock scenarios for the current book, e.g. ``?scenario=-10%25 tech``."""
+    result = book_result('list_positions')
+    if not result.ready:
+        return jsonify({'error': result.error or 'Data not available yet'}), 503
+    try:
+        return jsonify(risk_report(result.value, bar_cache, key='live', **parse_risk_args(request.args)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/correlation')
+@json_errors
+def api_correlation():
+    """Clustered rolling correlation matrix and concentration of the current book, e.g. ``?window=60``."""
+    result = book_result('list_positions')
+    if not result.ready:
+        return jsonify({'error': result.error or 'Data not available yet'}), 503
+    return jsonify(correlations.report('live', result.value, **parse_correlation_args(request.args)))
+
+@app.route('/api/sparklines')
+@json_errors
+def api_sparklines():
+    """30-day daily closes and return stats for every held symbol."""
+    result = book_result('list_positions')
+    if not result.ready:
+        return jsonify({'error': result.error or 'Data not available yet'}), 503
+    return jsonify(sparkline_stats(bar_cache, [p.symbol for p in result.value]))
+
+@app.route('/')
+def dashboard():
+    # Kick off every upstream call at once and wait at most for the page deadline
+    deadline_ms = request.args.get('deadline_ms', type=int)
+    deadline = deadline_from_now(deadline_ms)
+    started_at = time.time()
+    futures = {endpoint: fetcher.submit(endpoint, source) for endpoint, source in PANEL_SOURCES.items()}
+    results = {}
+    
+    def panel_result(endpoint):
+        results[endpoint] = fetcher.result(endpoint, futures[endpoint], deadline)
+        return results[endpoint]
+    
+    def generate():
+        # Header and CSS flush before any upstream call has returned
+        yield PAGE_HEAD
+        try:
+            yield render_metrics_html(panel_result('get_account'))
+            yield f"""
+                <div class="chart-section">
+                    <h2>Performance</h2>
+                    <div id="performance-chart"></div>
+                    {render_equity_zoom("performance-chart", "/api/equity")}
+                    {render_recorded_chart("/api/recorded")}
+                    {render_analytics_panel("/api/analytics")}
+                </div>
+            """
+            yield f"""
+                <div class="positions-section">
+                    <h2>Current Positions</h2>
+                    {render_positions_html(panel_result('list_positions'))}
+                </div>
+            """
+            yield f"""
+                <div class="orders-section">
+                    {render_orders_html(panel_result('list_orders'))}
+                </div>
+            """
+            # Chart serialization is usually the slowest, so it streams last
+            yield render_chart_script(panel_result('get_portfolio_history'))
+            publish_snapshot(results, started_at)
+        except Exception as e:
+            logger.exception("Error rendering dashboard")
+            yield f"""
+                <div class="error-card">
+                    <p>An error occurred: {str(e)}</p>
+                    <p>Please check your live trading API credentials in the .env file.</p>
+                </div>
+            """
+        yield PAGE_TAIL
+    
+    return Response(stream_with_context(generate()), mimetype='text/html')
 
 @app.route('/cancel_order/<order_id>', methods=['POST'])
 def cancel_order(order_id):
@@ -489,8 +770,7 @@ def cancel_order(order_id):
         api.cancel_order(order_id)
         return redirect('/')
     except Exception as e:
-        print(f"Error cancelling order: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error cancelling order", extra={'order_id': order_id})
         return f"""
         <html>
             <body style="font-family: system-ui; padding: 20px;">
@@ -501,7 +781,52 @@ def cancel_order(order_id):
         </html>
         """, 500
 
+@app.route('/cancel_orders', methods=['POST'])
+def cancel_orders():
+    """Cancel open orders by symbol, side, type or age; JSON in, JSON out, or the form's result page.
+
+    Previews answer at once. Real cancels run in the background: the form
+    is redirected to the job's page and JSON callers get 202 with its URL.
+    """
+    values = request.get_json(silent=True) or request.values
+    try:
+        selector, dry_run = parse_cancel_args(values)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not dry_run:
+        status_url = f"/cancel_orders/job/{start_bulk_cancel(api, selector)}"
+        if request.is_json or request.args.get('format') == 'json':
+            return jsonify({'status_url': status_url}), 202, {'Location': status_url}
+        return redirect(status_url, code=303)
+    try:
+        run = bulk_cancel(api, selector, dry_run=True)
+    except Exception as e:
+        logger.exception("Error cancelling orders", extra={'selector': selector.describe()})
+        return jsonify({'error': str(e)}), 500
+    if request.is_json or request.args.get('format') == 'json':
+        return jsonify(run.to_dict())
+    return render_bulk_cancel_page("Live Trading Bulk Cancel", run)
+
+@app.route('/cancel_orders/job/<job_id>')
+def cancel_orders_job(job_id):
+    """Progress of a background bulk cancel; ``?format=json`` for the same data as JSON."""
+    run = bulk_cancel_job(job_id)
+    if run is None:
+        return jsonify({'error': f"No bulk cancel {job_id}"}), 404
+    if request.args.get('format') == 'json':
+        return jsonify(run.to_dict())
+    return render_bulk_cancel_page("Live Trading Bulk Cancel", run)
+
+@app.route('/rebalance', methods=['GET', 'POST'])
+def rebalance():
+    """Preview orders moving the book to target weights; POST with ``dry_run=0`` submits them."""
+    run = rebalance_request(api, request.get_json(silent=True) or request.values, submit=request.method == 'POST')
+    if request.is_json:
+        return jsonify(run.to_dict()), run.status_code
+    return render_rebalance_page("Live Trading Rebalance", "/rebalance", run), run.status_code
+
 @app.route('/liquidate', methods=['POST'])
+@priority(RISK)
 def liquidate():
     try:
         results = []
@@ -512,8 +837,7 @@ def liquidate():
             api.cancel_all_orders()
             results.append("Successfully cancelled all existing orders")
         except Exception as e:
-            print(f"Error cancelling orders: {str(e)}")
-            traceback.print_exc()
+            logger.exception("Error cancelling orders")
             results.append(f"Error cancelling orders: {str(e)}")
         
         # Wait a moment for orders to be cancelled
@@ -544,8 +868,7 @@ def liquidate():
                     )
                     results.append(f"  Order submitted: {order.id}")
             except Exception as e:
-                print(f"Error liquidating position: {str(e)}")
-                traceback.print_exc()
+                logger.exception("Error liquidating position", extra={'symbol': position.symbol})
                 results.append(f"  Error: {str(e)}")
         
         return f"""
@@ -599,8 +922,7 @@ def liquidate():
         </html>
         """
     except Exception as e:
-        print(f"Error liquidating positions: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error liquidating positions")
         return f"""
         <html>
             <body style="font-family: system-ui; padding: 20px;">
@@ -0,0 +1,189 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from tracing import current_ids
+from web import flask_globals
+
+# Records waiting for the writer thread; when it falls behind new records are dropped, never awaited
+LOG_QUEUE_SIZE = 10_000
+
+# Warnings and errors with the same logger and message template are written at most
+# LOG_RATE_LIMIT times per LOG_RATE_WINDOW_S, so a broker outage can't flood stdout
+LOG_RATE_LIMIT = 5
+LOG_RATE_WINDOW_S = 60
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+
+_listener = None
+_listener_lock = threading.Lock()
+
+# LogRecord attributes that aren't user-supplied ``extra`` fields
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+_CONTEXT_FIELDS = ('request_id', 'trace_id', 'span_id')
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+class ContextFilter(logging.Filter):
+    """Stamps the request ID and active trace/span IDs on a record in the thread that logged it."""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        record.trace_id, record.span_id = current_ids()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Drops repeats of a warning or error beyond ``limit`` per ``window`` seconds.
+
+    Repeats are keyed by logger and unformatted message, so "Error X for %s"
+    counts as one message whatever the argument. The first record after a
+    suppressed stretch carries ``suppressed`` with the number dropped.
+    """
+
+    def __init__(self, limit: int = LOG_RATE_LIMIT, window: float = LOG_RATE_WINDOW_S):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            started, count, suppressed = self._seen.get(key, (now, 0, 0))
+            if now - started >= self.window:
+                started, count = now, 0
+            if count >= self.limit:
+                self._seen[key] = (started, count, suppressed + 1)
+                return False
+            self._seen[key] = (started, count + 1, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request/trace IDs and any ``extra`` fields."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        for name in _CONTEXT_FIELDS:
+            if getattr(record, name, None):
+                entry[name] = getattr(record, name)
+        for name, value in vars(record).items():
+            if name not in _RECORD_FIELDS and name not in _CONTEXT_FIELDS:
+                entry[name] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread and drops records when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Same process, so the record (args, exc_info) can cross threads as is
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(level: str = None, stream=None):
+    """Route the root logger through a queue to a JSON writer thread; idempotent.
+
+    ``level`` defaults to the LOG_LEVEL env var (INFO), read here so a .env
+    loaded beforehand applies.
+    """
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return _listener
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        handler = NonBlockingQueueHandler(log_queue)
+        handler.addFilter(ContextFilter())
+        handler.addFilter(RateLimitFilter())
+        writer = logging.StreamHandler(stream or sys.stdout)
+        writer.setFormatter(JsonFormatter())
+        root = logging.getLogger()
+        root.handlers = [handler]
+        root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+        _listener = QueueListener(log_queue, writer, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        return _listener
+
+
+def install_logging(app):
+    """Configure logging and give every request of a Flask ``app`` an ID and one access log line.
+
+    The ID comes from an incoming ``X-Request-Id`` header or is generated,
+    is echoed back in the response, and is stamped on every record logged
+    while the request is handled.
+    """
+    request, g = flask_globals()
+
+    configure_logging()
+    access = logging.getLogger('access')
+    # The access line below replaces the dev server's own unstructured one
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    @app.before_request
+    def start_request_log():
+        g.request_id = request.headers.get('X-Request-Id') or uuid.uuid4().hex[:16]
+        g.request_started = time.perf_counter()
+        _request_id.set(g.request_id)
+
+    @app.after_request
+    def finish_request_log(response):
+        request_id = g.get('request_id')
+        if request_id is None:
+            return response
+        response.headers['X-Request-Id'] = request_id
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'route': request.url_rule.rule if request.url_rule else None,
+            'status': response.status_code,
+        }
+        started = g.request_started
+
+        def finish():
+            # Streamed pages are timed to their last byte
+            fields['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            access.info("%s %s %s", fields['method'], fields['path'], fields['status'], extra=fields)
+            if _request_id.get() == request_id:
+                _request_id.set(None)
+        response.call_on_close(finish)
+        return response
+
+    return app
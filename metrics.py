@@ -0,0 +1,236 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from tracing import SPAN_KIND_CLIENT, current_span, span
+from web import flask_globals
+
+# Histogram upper bounds in seconds; broker calls sit between ~50ms and a few seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Broker methods timed by ``instrument_api``
+BROKER_CALLS = (
+    'get_account',
+    'list_positions',
+    'list_orders',
+    'get_portfolio_history',
+    'submit_order',
+    'cancel_order',
+    'cancel_all_orders',
+    'get_activities',
+    'get_bars',
+    'get_latest_trades',
+)
+
+_registry = []
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    """Monotonic count per label set."""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labels, key)} {value:g}" for key, value in values]
+
+
+class Gauge(Counter):
+    """Last value set per label set."""
+
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set, as Prometheus expects them."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+BROKER_LATENCY = Histogram(
+    'broker_request_duration_seconds', 'Alpaca REST call latency, including the client\'s own retries.',
+    ('account', 'call'))
+BROKER_ERRORS = Counter(
+    'broker_errors_total', 'Alpaca REST calls that raised, by HTTP status or exception type.',
+    ('account', 'call', 'status'))
+BROKER_RATE_LIMITED = Counter(
+    'broker_rate_limited_total', 'HTTP 429 responses from Alpaca, counted before the client retries them.',
+    ('account',))
+CHART_BUILD = Histogram(
+    'chart_build_duration_seconds', 'Building and serializing the performance chart.',
+    ('account',))
+PAGE_RENDER = Histogram(
+    'http_request_duration_seconds', 'Time to produce a response, until the last streamed byte.',
+    ('method', 'route', 'status'))
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Cache lookups by cache and hit or miss.',
+    ('cache', 'result'))
+BROKER_BUDGET = Gauge(
+    'broker_rate_budget_remaining', 'Requests left in the broker\'s per-minute budget, as the scheduler estimates it.',
+    ('account',))
+SCHEDULER_WAIT = Histogram(
+    'broker_scheduler_wait_seconds', 'Time broker calls spent queued for rate-limit budget.',
+    ('account', 'priority'))
+SCHEDULER_SHED = Counter(
+    'broker_scheduler_shed_total', 'Broker calls refused because no budget was left for their priority.',
+    ('account', 'priority'))
+
+
+def cache_result(cache: str, hit: bool):
+    result = 'hit' if hit else 'miss'
+    CACHE_REQUESTS.inc(cache=cache, result=result)
+    # Lookups are tallied on the enclosing span rather than spanned one by one
+    active = current_span()
+    if active is not None:
+        active.count(f"cache.{cache}.{result}")
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+def _error_status(error):
+    status = getattr(error, 'status_code', None)
+    return str(status) if status else type(error).__name__
+
+
+def _timed(account, call, method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            with span(f"broker.{call}", SPAN_KIND_CLIENT, **{'broker.account': account}):
+                return method(*args, **kwargs)
+        except Exception as e:
+            BROKER_ERRORS.inc(account=account, call=call, status=_error_status(e))
+            raise
+        finally:
+            BROKER_LATENCY.observe(time.perf_counter() - started, account=account, call=call)
+    return wrapper
+
+
+def instrument_api(api, account: str = 'default'):
+    """Time ``BROKER_CALLS`` on an Alpaca REST client in place and count its 429 responses.
+
+    Returns the same client, so it can wrap the constructor call directly.
+    """
+    for call in BROKER_CALLS:
+        method = getattr(api, call, None)
+        if method is not None:
+            setattr(api, call, _timed(account, call, method))
+
+    # The client retries 429s itself; a session hook sees each one before it does
+    def count_rate_limit(response, *args, **kwargs):
+        if response.status_code == 429:
+            BROKER_RATE_LIMITED.inc(account=account)
+
+    session = getattr(api, '_session', None)
+    if session is not None:
+        session.hooks['response'].append(count_rate_limit)
+    return api
+
+
+def install_metrics(app):
+    """Time every request of a Flask ``app`` and serve all metrics on ``/metrics``."""
+    request, g = flask_globals()
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started = g.get('metrics_started')
+        if started is None or request.path == '/metrics':
+            return response
+        labels = {
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule else 'unmatched',
+            'status': response.status_code,
+        }
+        # Streamed pages finish when the body is closed, not when the view returns
+        response.call_on_close(lambda: PAGE_RENDER.observe(time.perf_counter() - started, **labels))
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return app.response_class(render(), mimetype='text/plain; version=0.0.4')
+
+    return app
@@ -1,6 +1,9 @@
 from flask import Flask
 
+from metrics import install_metrics
+
 app = Flask(__name__)
+install_metrics(app)
 
 @app.route('/')
 def home():
@@ -0,0 +1,255 @@
+import sys
+import threading
+import time
+from typing import Iterable, Optional
+
+import numpy as np
+
+
+def _float(value) -> Optional[float]:
+    """Broker payloads carry numbers as strings and leave unused fields empty."""
+    if value is None or value == '':
+        return None
+    return float(value)
+
+
+def format_qty(qty: Optional[float]) -> str:
+    """Share quantity without a trailing ``.0`` but keeping fractional shares."""
+    if qty is None:
+        return "-"
+    return f"{qty:,.9f}".rstrip('0').rstrip('.')
+
+
+class AccountRecord:
+    __slots__ = ('id', 'status', 'portfolio_value', 'equity', 'cash', 'buying_power')
+
+    def __init__(self, id, status, portfolio_value, equity, cash, buying_power):
+        self.id = id
+        self.status = status
+        self.portfolio_value = portfolio_value
+        self.equity = equity
+        self.cash = cash
+        self.buying_power = buying_power
+
+    @classmethod
+    def from_entity(cls, account):
+        return cls(
+            id=account.id,
+            status=account.status,
+            portfolio_value=_float(account.portfolio_value),
+            equity=_float(getattr(account, 'equity', None)),
+            cash=_float(account.cash),
+            buying_power=_float(account.buying_power),
+        )
+
+
+class PositionRecord:
+    __slots__ = ('symbol', 'side', 'qty', 'market_value', 'avg_entry_price', 'current_price',
+                 'cost_basis', 'unrealized_pl', 'unrealized_plpc')
+
+    def __init__(self, symbol, side, qty, market_value, avg_entry_price, current_price,
+                 cost_basis, unrealized_pl, unrealized_plpc):
+        self.symbol = symbol
+        self.side = side
+        self.qty = qty
+        self.market_value = market_value
+        self.avg_entry_price = avg_entry_price
+        self.current_price = current_price
+        self.cost_basis = cost_basis
+        self.unrealized_pl = unrealized_pl
+        self.unrealized_plpc = unrealized_plpc
+
+    @classmethod
+    def from_entity(cls, position):
+        return cls(
+            symbol=position.symbol,
+            side=position.side,
+            qty=_float(position.qty),
+            market_value=_float(position.market_value),
+            avg_entry_price=_float(position.avg_entry_price),
+            current_price=_float(getattr(position, 'current_price', None)),
+            cost_basis=_float(getattr(position, 'cost_basis', None)),
+            unrealized_pl=_float(position.unrealized_pl),
+            unrealized_plpc=_float(getattr(position, 'unrealized_plpc', None)),
+        )
+
+
+class OrderRecord:
+    __slots__ = ('id', 'symbol', 'status', 'type', 'side', 'qty', 'filled_qty',
+                 'limit_price', 'submitted_at')
+
+    def __init__(self, id, symbol, status, type, side, qty, filled_qty, limit_price, submitted_at):
+        self.id = id
+        self.symbol = symbol
+        self.status = status
+        self.type = type
+        self.side = side
+        self.qty = qty
+        self.filled_qty = filled_qty
+        self.limit_price = limit_price
+        self.submitted_at = submitted_at
+
+    @classmethod
+    def from_entity(cls, order):
+        return cls(
+            id=order.id,
+            symbol=order.symbol,
+            status=order.status,
+            type=order.type,
+            side=order.side,
+            qty=_float(order.qty),
+            filled_qty=_float(getattr(order, 'filled_qty', None)),
+            limit_price=_float(getattr(order, 'limit_price', None)),
+            submitted_at=order.submitted_at,
+        )
+
+
+class PositionBook:
+    """Positions parsed once into records plus float64 columns for totals.
+
+    Rendering reads the records; exposure and P&L totals are vectorized sums
+    over the columns, so nothing re-parses broker strings after construction.
+    Shorts carry negative ``qty`` and ``market_value`` as the broker reports them.
+    """
+    __slots__ = ('records', 'qty', 'market_value', 'cost_basis', 'unrealized_pl')
+
+    def __init__(self, records: Iterable[PositionRecord]):
+        self.records = tuple(records)
+        n = len(self.records)
+        self.qty = np.fromiter((r.qty for r in self.records), dtype=np.float64, count=n)
+        self.market_value = np.fromiter((r.market_value for r in self.records), dtype=np.float64, count=n)
+        self.cost_basis = np.fromiter((r.cost_basis or 0.0 for r in self.records), dtype=np.float64, count=n)
+        self.unrealized_pl = np.fromiter((r.unrealized_pl for r in self.records), dtype=np.float64, count=n)
+
+    @classmethod
+    def from_entities(cls, positions):
+        return cls(PositionRecord.from_entity(p) for p in positions or ())
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __bool__(self):
+        return bool(self.records)
+
+    def frozen(self) -> 'PositionBook':
+        """A read-only copy of the columns over the same records; this book stays writable."""
+        copy = object.__new__(PositionBook)
+        copy.records = self.records
+        for name in ('qty', 'market_value', 'cost_basis', 'unrealized_pl'):
+            column = getattr(self, name).copy()
+            column.flags.writeable = False
+            setattr(copy, name, column)
+        return copy
+
+    @property
+    def symbols(self):
+        return [r.symbol for r in self.records]
+
+    @property
+    def gross_exposure(self) -> float:
+        return float(np.abs(self.market_value).sum())
+
+    @property
+    def net_exposure(self) -> float:
+        return float(self.market_value.sum())
+
+    @property
+    def long_exposure(self) -> float:
+        return float(self.market_value[self.market_value > 0].sum())
+
+    @property
+    def short_exposure(self) -> float:
+        return float(self.market_value[self.market_value < 0].sum())
+
+    @property
+    def total_unrealized_pl(self) -> float:
+        return float(self.unrealized_pl.sum())
+
+    @property
+    def total_cost_basis(self) -> float:
+        return float(self.cost_basis.sum())
+
+
+def footprint_bytes(obj) -> int:
+    """Approximate resident size of a model object, following slots, tuples and arrays."""
+    seen = set()
+
+    def size(o):
+        if id(o) in seen:
+            return 0
+        seen.add(id(o))
+        if isinstance(o, np.ndarray):
+            return sys.getsizeof(o) if o.base is None else sys.getsizeof(o) + o.nbytes
+        total = sys.getsizeof(o)
+        if isinstance(o, (tuple, list)):
+            total += sum(size(item) for item in o)
+        elif isinstance(o, dict):
+            total += sum(size(k) + size(v) for k, v in o.items())
+        for cls in type(o).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if hasattr(o, name):
+                    total += size(getattr(o, name))
+        return total
+
+    return size(obj)
+
+
+class PortfolioSnapshot:
+    """One consistent view of an account: built whole, published once, never mutated.
+
+    Refreshes build a new snapshot and publish it through a ``SnapshotRef``;
+    readers hold on to whichever snapshot they picked up, so a concurrent
+    refresh can never show them half-updated positions or a stale error.
+    """
+    __slots__ = ('name', 'account', 'positions', 'orders', 'chart_json', 'error', 'fetched_at')
+
+    def __init__(self, name: str, account: Optional[AccountRecord] = None,
+                 positions: Optional[PositionBook] = None, orders: Iterable[OrderRecord] = (),
+                 chart_json: Optional[str] = None, error: Optional[str] = None,
+                 fetched_at: Optional[float] = None):
+        # Frozen copies, so the caller's book (often a shared cache entry) stays as it was
+        positions = PositionBook(()).frozen() if positions is None else positions.frozen()
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'account', account)
+        object.__setattr__(self, 'positions', positions)
+        object.__setattr__(self, 'orders', tuple(orders))
+        object.__setattr__(self, 'chart_json', chart_json)
+        object.__setattr__(self, 'error', error)
+        object.__setattr__(self, 'fetched_at', time.time() if fetched_at is None else fetched_at)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+
+class SnapshotRef:
+    """Holds the latest snapshot; publishing is a single reference swap.
+
+    ``get`` is a plain attribute read, so readers never lock and scale with
+    the number of threads. Only publishers serialize, and only to keep an
+    older refresh that finishes late from replacing a newer one.
+    """
+
+    def __init__(self, snapshot: Optional[PortfolioSnapshot] = None):
+        self._snapshot = snapshot
+        self._publish_lock = threading.Lock()
+
+    def get(self) -> Optional[PortfolioSnapshot]:
+        return self._snapshot
+
+    def publish(self, snapshot: PortfolioSnapshot) -> bool:
+        with self._publish_lock:
+            current = self._snapshot
+            if current is not None and current.fetched_at > snapshot.fetched_at:
+                return False
+            self._snapshot = snapshot
+            return True
@@ -0,0 +1,316 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Local order/activity history of a single account; give each account its own path
+ORDER_STORE_PATH = os.getenv("ORDER_STORE_PATH", "orders.db")
+
+# Alpaca caps list_orders at 500 per page and activities at 100
+ORDER_PAGE_SIZE = 500
+ACTIVITY_PAGE_SIZE = 100
+
+# Backfills are split into windows of this many days and paged in parallel
+SYNC_WINDOW_DAYS = 30
+SYNC_WORKERS = 4
+
+# Delta syncs re-read this much before the cursor to catch late-reported rows
+SYNC_OVERLAP_S = 300
+
+# Background syncs (the Streamlit app) start at most this often
+SYNC_MIN_INTERVAL_S = 60
+
+TERMINAL_STATUSES = ('filled', 'canceled', 'expired', 'rejected', 'replaced', 'done_for_day')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id TEXT PRIMARY KEY,
+    client_order_id TEXT,
+    symbol TEXT,
+    side TEXT,
+    type TEXT,
+    status TEXT,
+    qty REAL,
+    filled_qty REAL,
+    filled_avg_price REAL,
+    limit_price REAL,
+    submitted_at REAL,
+    filled_at REAL,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS orders_symbol ON orders (symbol, submitted_at);
+CREATE INDEX IF NOT EXISTS orders_status ON orders (status, submitted_at);
+CREATE INDEX IF NOT EXISTS orders_submitted ON orders (submitted_at);
+
+CREATE TABLE IF NOT EXISTS activities (
+    id TEXT PRIMARY KEY,
+    activity_type TEXT,
+    symbol TEXT,
+    side TEXT,
+    qty REAL,
+    price REAL,
+    net_amount REAL,
+    order_id TEXT,
+    time REAL
+);
+CREATE INDEX IF NOT EXISTS activities_symbol ON activities (symbol, time);
+CREATE INDEX IF NOT EXISTS activities_type ON activities (activity_type, time);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    name TEXT PRIMARY KEY,
+    value REAL
+);
+"""
+
+
+def _ts(value):
+    """Broker timestamps (strings or pandas Timestamps) as UTC epoch seconds."""
+    if value is None or value == '':
+        return None
+    return pd.Timestamp(value).timestamp()
+
+
+def _iso(ts):
+    return pd.Timestamp(ts, unit='s', tz='UTC').isoformat()
+
+
+def _num(value):
+    if value is None or value == '':
+        return None
+    return float(value)
+
+
+def list_all_orders(api, status='open', after=None, until=None, **kwargs):
+    """Every order matching ``status``, following ``until`` cursors past the first page."""
+    orders, seen = [], set()
+    while True:
+        page = api.list_orders(status=status, limit=ORDER_PAGE_SIZE, after=after, until=until,
+                               direction='desc', **kwargs)
+        fresh = [o for o in page if o.id not in seen]
+        orders.extend(fresh)
+        seen.update(o.id for o in fresh)
+        if len(page) < ORDER_PAGE_SIZE or not fresh:
+            return orders
+        # Pages overlap by the boundary timestamp; the seen set drops the repeats
+        until = _iso(_ts(page[-1].submitted_at) + 1e-6)
+
+
+class OrderStore:
+    """SQLite-backed order and activity history with incremental sync.
+
+    The first sync backfills from the account's creation date in parallel
+    windows; later syncs fetch only what was submitted since the cursor,
+    plus a by-ID refresh of older orders that were still open last time.
+    """
+
+    def __init__(self, path: str = ORDER_STORE_PATH):
+        self.path = path
+        self._write_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._sync_thread = None
+        self._last_sync = None
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _get_state(self, conn, name):
+        row = conn.execute("SELECT value FROM sync_state WHERE name = ?", (name,)).fetchone()
+        return row['value'] if row else None
+
+    def _set_state(self, conn, name, value):
+        conn.execute("INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)", (name, value))
+
+    # -- syncing ------------------------------------------------------------
+
+    def sync(self, api):
+        """Bring orders and activities up to date; returns how many rows were written."""
+        start = self._backfill_start(api)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            orders = pool.submit(self.sync_orders, api, start)
+            activities = pool.submit(self.sync_activities, api, start)
+            return {'orders': orders.result(), 'activities': activities.result()}
+
+    def sync_in_background(self, api, min_interval: float = SYNC_MIN_INTERVAL_S) -> bool:
+        """Start ``sync`` on a background thread unless one is running or ended within ``min_interval``.
+
+        Returns whether a sync is running, so a UI can say the history is
+        still filling in instead of blocking on the first backfill.
+        """
+        with self._sync_lock:
+            if self._sync_thread is not None and self._sync_thread.is_alive():
+                return True
+            if self._last_sync is not None and time.monotonic() - self._last_sync < min_interval:
+                return False
+            self._sync_thread = threading.Thread(target=self._background_sync, args=(api,), name="order-sync",
+                                                 daemon=True)
+            self._sync_thread.start()
+            return True
+
+    def _background_sync(self, api):
+        try:
+            self.sync(api)
+        except Exception:
+            logger.exception("Error syncing order history", extra={'path': self.path})
+        finally:
+            self._last_sync = time.monotonic()
+
+    def _backfill_start(self, api):
+        with closing(self._connect()) as conn:
+            start = self._get_state(conn, 'backfill_start')
+        if start is None:
+            start = _ts(api.get_account().created_at)
+            with self._write_lock, closing(self._connect()) as conn, conn:
+                self._set_state(conn, 'backfill_start', start)
+        return start
+
+    def _windows(self, start, end):
+        step = SYNC_WINDOW_DAYS * 86400
+        edges = list(range(int(start), int(end), step)) + [end]
+        return list(zip(edges[:-1], edges[1:]))
+
+    def sync_orders(self, api, backfill_start):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cursor = self._get_state(conn, 'orders_cursor')
+            start = backfill_start if cursor is None else cursor - SYNC_OVERLAP_S
+            # Orders that were live at the last sync may have filled or been canceled since
+            stale_ids = [row['id'] for row in conn.execute(
+                f"SELECT id FROM orders WHERE submitted_at < ? AND status NOT IN ({','.join('?' * len(TERMINAL_STATUSES))})",
+                (start,) + TERMINAL_STATUSES
+            )]
+        # Start a hair early: the broker's ``after`` is exclusive and pages may share a timestamp
+        windows = self._windows(start - 1e-6, now)
+        with ThreadPoolExecutor(max_workers=SYNC_WORKERS) as pool:
+            pages = pool.map(lambda w: list_all_orders(api, status='all', after=_iso(w[0]), until=_iso(w[1])), windows)
+            written = sum(self._write_orders(orders) for orders in pages)
+            refreshed = [order for order in pool.map(lambda i: self._get_order(api, i), stale_ids) if order is not None]
+            written += self._write_orders(refreshed)
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            self._set_state(conn, 'orders_cursor', now)
+        return written
+
+    @staticmethod
+    def _get_order(api, order_id):
+        # One order failing to refresh mustn't lose the rest; it stays stale and is retried next sync
+        try:
+            return api.get_order(order_id)
+        except Exception:
+            logger.warning("Error refreshing order", extra={'order_id': order_id}, exc_info=True)
+            return None
+
+    def _write_orders(self, orders):
+        rows = [(
+            o.id, o.client_order_id, o.symbol, o.side, o.type, o.status,
+            _num(o.qty), _num(o.filled_qty), _num(o.filled_avg_price), _num(o.limit_price),
+            _ts(o.submitted_at), _ts(o.filled_at), _ts(o.updated_at),
+        ) for o in orders]
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            conn.executemany("INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def sync_activities(self, api, backfill_start):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cursor = self._get_state(conn, 'activities_cursor')
+        start = backfill_start if cursor is None else cursor - SYNC_OVERLAP_S
+        windows = self._windows(start - 1e-6, now)
+        with ThreadPoolExecutor(max_workers=SYNC_WORKERS) as pool:
+            pages = pool.map(lambda w: self._fetch_activities(api, w[0], w[1]), windows)
+            written = sum(self._write_activities(activities) for activities in pages)
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            self._set_state(conn, 'activities_cursor', now)
+        return written
+
+    def _fetch_activities(self, api, after, until):
+        activities, page_token = [], None
+        while True:
+            page = api.get_activities(after=_iso(after), until=_iso(until), direction='asc',
+                                      page_size=ACTIVITY_PAGE_SIZE, page_token=page_token)
+            activities.extend(page)
+            if len(page) < ACTIVITY_PAGE_SIZE:
+                return activities
+            page_token = page[-1].id
+
+    def _write_activities(self, activities):
+        rows = []
+        for a in activities:
+            raw = a._raw
+            rows.append((
+                a.id, raw.get('activity_type'), raw.get('symbol'), raw.get('side'),
+                _num(raw.get('qty')), _num(raw.get('price')), _num(raw.get('net_amount')),
+                raw.get('order_id'), _ts(raw.get('transaction_time') or raw.get('date')),
+            ))
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            conn.executemany("INSERT OR REPLACE INTO activities VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    # -- queries ------------------------------------------------------------
+
+    def query_orders(self, symbol=None, status=None, since=None, until=None, limit=100, offset=0):
+        """Most recent orders first; every filter is served by an index."""
+        clauses, params = [], []
+        if symbol:
+            clauses.append("symbol = ?")
+            params.append(symbol.upper())
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if since is not None:
+            clauses.append("submitted_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("submitted_at < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with closing(self._connect()) as conn:
+            return [dict(row) for row in conn.execute(
+                f"SELECT * FROM orders {where} ORDER BY submitted_at DESC LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            )]
+
+    def query_activities(self, activity_type=None, symbol=None, since=None, limit=None):
+        """Activities in time order, e.g. every FILL for the P&L engine."""
+        clauses, params = [], []
+        if activity_type:
+            clauses.append("activity_type = ?")
+            params.append(activity_type)
+        if symbol:
+            clauses.append("symbol = ?")
+            params.append(symbol.upper())
+        if since is not None:
+            clauses.append("time >= ?")
+            params.append(since)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"SELECT * FROM activities {where} ORDER BY time, id"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with closing(self._connect()) as conn:
+            return [dict(row) for row in conn.execute(sql, params)]
+
+
+if __name__ == '__main__':
+    import alpaca_trade_api as tradeapi
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    api = tradeapi.REST(
+        key_id=os.getenv("APCA_API_KEY_ID"),
+        secret_key=os.getenv("APCA_API_SECRET_KEY"),
+        base_url=os.getenv("APCA_API_BASE_URL", "https://paper-api.alpaca.markets")
+    )
+    started = time.time()
+    written = OrderStore().sync(api)
+    print(f"Synced {written['orders']} orders and {written['activities']} activities "
+          f"into {ORDER_STORE_PATH} in {time.time() - started:.1f}s")
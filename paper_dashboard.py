@@ -1,61 +1,139 @@
-from flask import Flask, request, redirect
+from flask import Flask, Response, jsonify, request, redirect, stream_with_context
 import alpaca_trade_api as tradeapi
+import html
 import os
 from dotenv import load_dotenv
 import plotly.graph_objects as go
 from plotly.utils import PlotlyJSONEncoder
 import json
+import logging
 from datetime import datetime, timedelta
 import pytz
-from dataclasses import dataclass
-from typing import List, Optional
+import time
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+
+from analytics import ANALYTICS_CSS, ANALYTICS_SCRIPT, EquityAnalytics, render_analytics_panel
+from bar_cache import BarCache, sparkline_stats
+from benchmarks import add_benchmark_traces, benchmark_overlays
+from bulk_cancel import (BULK_CANCEL_CSS, bulk_cancel, bulk_cancel_job, parse_cancel_args, render_bulk_cancel_form,
+                         render_bulk_cancel_page, start_bulk_cancel)
+from correlation import CORRELATION_SCRIPT, CorrelationCache, parse_correlation_args, render_correlation_panel
+from fragments import SPARKLINE_CSS, SPARKLINE_SCRIPT, render_order_cards, render_position_cards
+from logs import install_logging
+from metrics import CHART_BUILD, cache_result, install_metrics, instrument_api
+from models import AccountRecord, OrderRecord, PortfolioSnapshot, PositionBook, SnapshotRef
+from order_sync import list_all_orders
+from profiling import install_profiling
+from rebalance import rebalance_request, render_rebalance_page
+from replay import tape_api
+from recorder import RECORDED_CHART_SCRIPT, EquityRecorder, parse_recorded_args, recorded_json, render_recorded_chart
+from risk import RISK_CSS, RISK_SCRIPT, parse_risk_args, render_risk_panel, risk_report
+from rollups import EQUITY_ZOOM_SCRIPT, EquityPyramid, equity_json, parse_range_args, render_equity_zoom
+from scheduler import RISK, priority, schedule_api
+from tables import (CARD_LIMIT, ORDER_COLUMNS, POSITION_COLUMNS, VIRTUAL_TABLE_CSS, VIRTUAL_TABLE_SCRIPT,
+                    parse_table_args, query_records, render_virtual_table)
+from tracing import in_current_context, install_tracing, span
+from web import json_errors
 
 app = Flask(__name__)
 
+# Request latency histograms plus broker and cache counters on /metrics
+install_metrics(app)
+
+# Admin-only per-request profiles (?profile=<PROFILE_TOKEN>) and optional continuous sampling
+install_profiling(app)
+
+# Request, broker call and render spans, exported when TRACE_FILE or TRACE_ENDPOINT is set
+install_tracing(app, 'paper_dashboard')
+
 # Load environment variables
 load_dotenv()
 
+# JSON logs written from a background thread; request threads only enqueue
+install_logging(app)
+logger = logging.getLogger('paper_dashboard')
+
 @dataclass
 class TradingAccount:
     name: str
     api: tradeapi.REST
-    account: Optional[object] = None
-    positions: List[object] = None
-    orders: List[object] = None
-    chart_json: Optional[str] = None
-    error: Optional[str] = None
+    # Latest complete PortfolioSnapshot; refreshes swap it, requests never mutate it
+    snapshot: SnapshotRef = field(default_factory=SnapshotRef)
+    # Return/drawdown statistics, extended with each portfolio history refresh
+    analytics: EquityAnalytics = field(default_factory=EquityAnalytics)
+    # Equity at 1Min/5Min/1H/1D so chart zoom and pan never call the broker
+    equity: EquityPyramid = field(default_factory=EquityPyramid)
+    # Every snapshot this dashboard polls, kept on disk for the intraday chart
+    recorder: EquityRecorder = field(init=False)
+
+    def __post_init__(self):
+        self.recorder = EquityRecorder(self.name)
+
+    @property
+    def slug(self):
+        return self.name.lower().replace(' ', '_')
+
+# Upstream calls for a page load run concurrently on this pool
+executor = ThreadPoolExecutor(max_workers=8)
+
+# Matches the page's auto-refresh interval
+SNAPSHOT_MAX_AGE = 10
 
 # Initialize trading accounts
 paper_account = TradingAccount(
     name="Paper Trading",
-    api=tradeapi.REST(
+    api=schedule_api(instrument_api(tape_api(tradeapi.REST(
         key_id=os.getenv("APCA_API_KEY_ID"),
         secret_key=os.getenv("APCA_API_SECRET_KEY"),
-        base_url="https://paper-api.alpaca.markets"
-    )
+        base_url=os.getenv("APCA_API_BASE_URL", "https://paper-api.alpaca.markets")
+    ), account='paper_trading'), account='paper_trading'), account='paper_trading')
 )
 
 live_account = TradingAccount(
     name="Live Trading",
-    api=tradeapi.REST(
+    api=schedule_api(instrument_api(tape_api(tradeapi.REST(
         key_id=os.getenv("LIVE_APCA_API_KEY_ID"),
         secret_key=os.getenv("LIVE_APCA_API_SECRET_KEY"),
-        base_url="https://api.alpaca.markets"
-    )
+        base_url=os.getenv("LIVE_APCA_API_BASE_URL", "https://api.alpaca.markets")
+    ), account='live_trading'), account='live_trading'), account='live_trading')
 )
 
-def get_performance_chart(api, account_name):
+# Bars are market data, so both accounts share one cache through the paper credentials
+bar_cache = BarCache(paper_account.api)
+
+# Rolling correlation per account and window, updated as new daily bars land
+correlations = CorrelationCache(bar_cache)
+
+def get_portfolio_history(account: TradingAccount):
+    """Last 30 days of daily equity, also fed to the account's analytics engine."""
+    if not len(account.analytics):
+        year = account.api.get_portfolio_history(period='1A', timeframe='1D')
+        account.analytics.update(year.timestamp, year.equity)
+    
+    # Get account history for the last 30 days
+    end = datetime.now(pytz.UTC)
+    start = end - timedelta(days=30)
+    
+    portfolio_history = account.api.get_portfolio_history(
+        date_start=start.date(),
+        date_end=end.date(),
+        timeframe='1D'
+    )
+    account.analytics.update(portfolio_history.timestamp, portfolio_history.equity)
+    # Intraday equity for zooming; at most one 1-minute history call per minute
     try:
-        # Get account history for the last 30 days
-        end = datetime.now(pytz.UTC)
-        start = end - timedelta(days=30)
-        
-        # Get portfolio history
-        portfolio_history = api.get_portfolio_history(
-            date_start=start.date(),
-            date_end=end.date(),
-            timeframe='1D'
-        )
+        account.equity.refresh(account.api)
+    except Exception:
+        logger.exception("Error refreshing intraday equity", extra={'account': account.slug})
+    return portfolio_history
+
+@span("chart.build")
+def get_performance_chart(account: TradingAccount):
+    try:
+        portfolio_history = get_portfolio_history(account)
+        # Chart build time excludes the history calls, which are timed as broker calls
+        started = time.perf_counter()
         
         # Create time series
         dates = [datetime.fromtimestamp(t, pytz.UTC) for t in portfolio_history.timestamp]
@@ -83,9 +161,15 @@ def get_performance_chart(api, account_name):
             hovertemplate='$%{y:,.2f}<extra>P&L</extra>'
         ))
         
+        # Benchmarks start at the same equity; a failed bar fetch only drops the overlay
+        try:
+            add_benchmark_traces(fig, dates, benchmark_overlays(bar_cache, portfolio_history.timestamp, equity))
+        except Exception:
+            logger.exception("Error adding benchmarks", extra={'account': account.slug})
+        
         # Update layout
         fig.update_layout(
-            title=f'{account_name} Performance (30 Days)',
+            title=f'{account.name} Performance (30 Days)',
             paper_bgcolor='rgba(0,0,0,0)',
             plot_bgcolor='rgba(0,0,0,0)',
             hovermode='x unified',
@@ -112,268 +196,283 @@ def get_performance_chart(api, account_name):
             )
         )
         
-        return json.dumps(fig, cls=PlotlyJSONEncoder)
-    except Exception as e:
-        print(f"Error creating performance chart for {account_name}: {str(e)}")
+        chart_json = json.dumps(fig, cls=PlotlyJSONEncoder)
+        CHART_BUILD.observe(time.perf_counter() - started, account=account.slug)
+        return chart_json
+    except Exception:
+        logger.exception("Error creating performance chart", extra={'account': account.slug})
         return None
 
-def get_account_data(account: TradingAccount):
+def start_account_fetch(account: TradingAccount):
+    """Start every upstream call for ``account`` at once; returns futures keyed by snapshot field."""
+    # Broker payloads are parsed into compact records on the worker threads, inside the caller's trace
+    return {
+        'account': executor.submit(in_current_context(lambda: AccountRecord.from_entity(account.api.get_account()))),
+        'positions': executor.submit(in_current_context(lambda: PositionBook.from_entities(account.api.list_positions()))),
+        'orders': executor.submit(in_current_context(
+            lambda: tuple(OrderRecord.from_entity(o) for o in list_all_orders(account.api)))),
+        'chart_json': executor.submit(in_current_context(get_performance_chart), account),
+    }
+
+@span("snapshot.build")
+def build_snapshot(account: TradingAccount, futures, started_at):
+    """Wait for every fetch and publish the result as the account's new snapshot."""
+    snapshot = PortfolioSnapshot(
+        name=account.name,
+        fetched_at=started_at,
+        **{name: future.result() for name, future in futures.items()}
+    )
+    account.snapshot.publish(snapshot)
     try:
-        account.account = account.api.get_account()
-        account.positions = account.api.list_positions()
-        account.orders = account.api.list_orders(status='open')
-        account.chart_json = get_performance_chart(account.api, account.name)
-    except Exception as e:
-        account.error = str(e)
+        account.recorder.record(snapshot.account, snapshot.positions, snapshot.fetched_at)
+    except Exception:
+        logger.exception("Error recording snapshot", extra={'account': account.slug})
+    return snapshot
 
-def format_account_html(account: TradingAccount):
-    if account.error:
-        return f"""
-        <div class="account-section">
-            <h2>{account.name}</h2>
-            <div class="error-card">
-                <p>Error accessing account: {account.error}</p>
-                <p>Please check your API credentials.</p>
-            </div>
-        </div>
-        """
-    
-    # Format metrics
-    metrics_html = f"""
-    <div class="metrics-grid">
-        <div class="metric-card">
-            <div class="label">Portfolio Value</div>
-            <div class="metric">${float(account.account.portfolio_value):,.2f}</div>
-        </div>
-        
-        <div class="metric-card">
-            <div class="label">Cash Balance</div>
-            <div class="metric">${float(account.account.cash):,.2f}</div>
-        </div>
-        
-        <div class="metric-card">
-            <div class="label">Buying Power</div>
-            <div class="metric">${float(account.account.buying_power):,.2f}</div>
+def refresh_snapshot(account: TradingAccount):
+    return build_snapshot(account, start_account_fetch(account), time.time())
+
+@span("snapshot.current")
+def current_snapshot(account: TradingAccount):
+    """Latest published snapshot, refreshed inline if missing or older than the page refresh."""
+    snapshot = account.snapshot.get()
+    fresh = snapshot is not None and snapshot.age <= SNAPSHOT_MAX_AGE
+    cache_result('snapshot', fresh)
+    if not fresh:
+        snapshot = refresh_snapshot(account)
+    return snapshot
+
+def format_error_html(account: TradingAccount, error, section_open: bool = False):
+    """The error card, closing an account section already streamed or wrapping it in a new one."""
+    card = f"""
+        <div class="error-card">
+            <p>Error accessing account: {html.escape(str(error))}</p>
+            <p>Please check your API credentials.</p>
         </div>
     </div>
     """
-    
-    # Format positions
-    positions_html = ""
-    if account.positions:
-        for position in account.positions:
-            pl_color = "green" if float(position.unrealized_pl) >= 0 else "red"
-            positions_html += f"""
-            <div class="position-card">
-                <div class="position-header">
-                    <h3>{position.symbol}</h3>
-                    <span class="quantity">{position.qty} shares</span>
-                </div>
-                <div class="position-details">
-                    <div class="detail">
-                        <span class="label">Market Value:</span>
-                        <span class="value">${float(position.market_value):,.2f}</span>
-                    </div>
-                    <div class="detail">
-                        <span class="label">Average Cost:</span>
-                        <span class="value">${float(position.avg_entry_price):,.2f}</span>
-                    </div>
-                    <div class="detail">
-                        <span class="label">P&L:</span>
-                        <span class="value" style="color: {pl_color}">${float(position.unrealized_pl):,.2f}</span>
-                    </div>
-                </div>
-            </div>
-            """
-        
-        positions_html += f"""
-        <form action="/liquidate/{account.name.lower().replace(' ', '_')}" method="post" class="liquidate-form">
-            <button type="submit" class="liquidate-button">🚨 Liquidate All Positions</button>
-        </form>
-        """
-    else:
-        positions_html = "<p class='no-positions'>No open positions</p>"
-    
-    # Format orders
-    orders_html = ""
-    if account.orders:
-        orders_html = "<h3>Pending Orders</h3>"
-        for order in account.orders:
-            orders_html += f"""
-            <div class="order-card">
-                <div class="order-header">
-                    <h4>{order.symbol}</h4>
-                    <span class="order-status">{order.status}</span>
-                </div>
-                <div class="order-details">
-                    <div class="detail">
-                        <span class="label">Type:</span>
-                        <span class="value">{order.type} {order.side}</span>
-                    </div>
-                    <div class="detail">
-                        <span class="label">Quantity:</span>
-                        <span class="value">{order.qty}</span>
-                    </div>
-                    <div class="detail">
-                        <span class="label">Submitted:</span>
-                        <span class="value">{order.submitted_at}</span>
-                    </div>
-                </div>
-                <form action="/cancel_order/{account.name.lower().replace(' ', '_')}/{order.id}" method="post" style="margin-top: 10px;">
-                    <button type="submit" class="cancel-button">Cancel Order</button>
-                </form>
-            </div>
-            """
-    
+    if section_open:
+        return card
+    return f"""
+    <div class="account-section">
+        <h2>{account.name}</h2>""" + card
+
+@span("render.summary")
+def format_summary_html(account: TradingAccount, record: AccountRecord):
+    """Opens the account section with its status, metrics and the chart container."""
     return f"""
     <div class="account-section">
         <div class="account-header">
             <h2>{account.name}</h2>
-            <span class="status">{account.account.status}</span>
+            <span class="status">{record.status}</span>
         </div>
         
-        {metrics_html}
+        <div class="metrics-grid">
+            <div class="metric-card">
+                <div class="label">Portfolio Value</div>
+                <div class="metric">${record.portfolio_value:,.2f}</div>
+            </div>
+            
+            <div class="metric-card">
+                <div class="label">Cash Balance</div>
+                <div class="metric">${record.cash:,.2f}</div>
+            </div>
+            
+            <div class="metric-card">
+                <div class="label">Buying Power</div>
+                <div class="metric">${record.buying_power:,.2f}</div>
+            </div>
+        </div>
         
         <div class="chart-section">
             <h3>Performance</h3>
-            <div id="{account.name.lower().replace(' ', '_')}_chart"></div>
+            <div id="{account.slug}_chart"></div>
+            {render_equity_zoom(f"{account.slug}_chart", f"/api/{account.slug}/equity")}
+            {render_recorded_chart(f"/api/{account.slug}/recorded")}
+            {render_analytics_panel(f"/api/{account.slug}/analytics")}
         </div>
+    """
 
+@span("render.positions")
+def format_positions_html(account: TradingAccount, book: PositionBook):
+    if book:
+        positions_html = "".join([
+            f"""
+        <p class="book-totals">
+            Gross exposure ${book.gross_exposure:,.2f} &middot;
+            Net exposure ${book.net_exposure:,.2f} &middot;
+            Unrealized P&L ${book.total_unrealized_pl:,.2f}
+        </p>
+        """,
+            render_position_cards(book, sparklines=f"/api/{account.slug}/sparklines") if len(book) <= CARD_LIMIT else render_virtual_table(f"/api/{account.slug}/positions"),
+            render_risk_panel(f"/api/{account.slug}/risk"),
+            render_correlation_panel(f"/api/{account.slug}/correlation"),
+            f"""
+        <form action="/liquidate/{account.slug}" method="post" class="liquidate-form">
+            <button type="submit" class="liquidate-button">🚨 Liquidate All Positions</button>
+        </form>
+        <p class="rebalance-link"><a href="/rebalance/{account.slug}">Rebalance to target weights</a></p>
+        """,
+        ])
+    else:
+        positions_html = f"""<p class='no-positions'>No open positions</p>
+        <p class="rebalance-link"><a href="/rebalance/{account.slug}">Rebalance to target weights</a></p>"""
+    
+    return f"""
         <div class="positions-section">
             <h3>Current Positions</h3>
             {positions_html}
         </div>
+    """
 
+@span("render.orders")
+def format_orders_html(account: TradingAccount, orders):
+    """Renders pending orders and closes the account section."""
+    orders_html = ""
+    if orders:
+        orders_html = render_bulk_cancel_form(f"/cancel_orders/{account.slug}")
+        if len(orders) <= CARD_LIMIT:
+            orders_html = "<h3>Pending Orders</h3>" + orders_html + render_order_cards(orders, f"/cancel_order/{account.slug}")
+        else:
+            orders_html = "<h3>Pending Orders</h3>" + orders_html + render_virtual_table(f"/api/{account.slug}/orders", f"/cancel_order/{account.slug}")
+    
+    return f"""
         <div class="orders-section">
             {orders_html}
         </div>
     </div>
     """
 
-@app.route('/')
-def dashboard():
-    try:
-        # Get data for paper account only
-        get_account_data(paper_account)
-        
-        return f"""
+@span("render.chart")
+def format_chart_script(account: TradingAccount, chart_json):
+    return f"""
+            <script>
+                // Initialize performance chart
+                const {account.slug}_data = {chart_json or 'null'};
+                if ({account.slug}_data) {{
+                    Plotly.newPlot('{account.slug}_chart', {account.slug}_data.data, {account.slug}_data.layout);
+                }}
+            </script>
+    """
+
+PAGE_HEAD = """
         <html>
         <head>
             <title>QuantLogix Dashboard</title>
             <script src="https://cdn.plot.ly/plotly-latest.min.js"></script>
             <style>
-                body {{
+                body {
                     font-family: -apple-system, BlinkMacSystemFont, sans-serif;
                     margin: 0;
                     padding: 40px;
                     background: #f5f5f7;
                     color: #1d1d1f;
-                }}
-                .container {{
+                }
+                .container {
                     max-width: 1200px;
                     margin: 0 auto;
-                }}
-                .header {{
+                }
+                .header {
                     background: #1a1a1a;
                     color: white;
                     padding: 20px;
                     border-radius: 10px;
                     box-shadow: 0 2px 4px rgba(0,0,0,0.1);
                     margin-bottom: 20px;
-                }}
-                .nav-links {{
+                }
+                .nav-links {
                     display: flex;
                     gap: 20px;
                     margin-top: 10px;
-                }}
-                .nav-links a {{
+                }
+                .nav-links a {
                     color: #FFA500;
                     text-decoration: none;
                     padding: 5px 10px;
                     border-radius: 4px;
                     transition: all 0.3s ease;
-                }}
-                .nav-links a:hover {{
+                }
+                .nav-links a:hover {
                     background: rgba(255, 165, 0, 0.2);
-                }}
-                .nav-links a.active {{
+                }
+                .nav-links a.active {
                     color: #FF0000;
                     font-weight: bold;
-                }}
-                h1 {{
+                }
+                h1 {
                     margin: 0;
                     font-size: 24px;
                     color: white;
-                }}
-                .account-section {{
+                }
+                .account-section {
                     background: white;
                     padding: 20px;
                     border-radius: 10px;
                     box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                }}
-                .account-header {{
+                }
+                .account-header {
                     display: flex;
                     justify-content: space-between;
                     align-items: center;
                     margin-bottom: 20px;
-                }}
-                .metrics-grid {{
+                }
+                .metrics-grid {
                     display: grid;
                     grid-template-columns: repeat(auto-fit, minmax(150px, 1fr));
                     gap: 20px;
                     margin-bottom: 30px;
-                }}
-                .metric-card {{
+                }
+                .metric-card {
                     background: #f8f8f8;
                     padding: 15px;
                     border-radius: 8px;
-                }}
-                .metric {{
+                }
+                .metric {
                     font-size: 20px;
                     font-weight: bold;
                     color: #333;
-                }}
-                .label {{
+                }
+                .label {
                     color: #666;
                     font-size: 14px;
                     margin-bottom: 5px;
-                }}
-                .chart-section, .positions-section, .orders-section {{
+                }
+                .chart-section, .positions-section, .orders-section {
                     margin-bottom: 20px;
-                }}
-                .position-card, .order-card {{
+                }
+                .position-card, .order-card {
                     border: 1px solid #e5e5e5;
                     border-radius: 8px;
                     padding: 15px;
                     margin-bottom: 15px;
-                }}
-                .position-header, .order-header {{
+                }
+                .position-header, .order-header {
                     display: flex;
                     justify-content: space-between;
                     align-items: center;
                     margin-bottom: 10px;
-                }}
-                .position-header h3, .order-header h4 {{
+                }
+                .position-header h3, .order-header h4 {
                     margin: 0;
                     color: #1d1d1f;
-                }}
-                .quantity {{
+                }
+                .quantity {
                     background: #f5f5f7;
                     padding: 4px 8px;
                     border-radius: 4px;
                     font-size: 14px;
-                }}
-                .position-details, .order-details {{
+                }
+                .position-details, .order-details {
                     display: grid;
                     grid-template-columns: repeat(auto-fit, minmax(150px, 1fr));
                     gap: 10px;
-                }}
-                .detail {{
+                }
+                .detail {
                     display: flex;
                     justify-content: space-between;
                     align-items: center;
-                }}
-                .liquidate-button {{
+                }
+                .liquidate-button {
                     background: #ff3b30;
                     color: white;
                     border: none;
@@ -384,11 +483,11 @@ def dashboard():
                     width: 100%;
                     margin-top: 20px;
                     transition: background-color 0.2s;
-                }}
-                .liquidate-button:hover {{
+                }
+                .liquidate-button:hover {
                     background: #ff2d55;
-                }}
-                .cancel-button {{
+                }
+                .cancel-button {
                     background: #8e8e93;
                     color: white;
                     border: none;
@@ -398,38 +497,43 @@ def dashboard():
                     cursor: pointer;
                     width: 100%;
                     transition: background-color 0.2s;
-                }}
-                .cancel-button:hover {{
+                }
+                .cancel-button:hover {
                     background: #636366;
-                }}
-                .no-positions {{
+                }
+                .no-positions {
                     text-align: center;
                     color: #666;
                     padding: 20px;
-                }}
-                .status {{
+                }
+                .status {
                     display: inline-block;
                     padding: 4px 8px;
                     border-radius: 4px;
                     background: #34c759;
                     color: white;
                     font-size: 14px;
-                }}
-                .order-status {{
+                }
+                .order-status {
                     background: #007aff;
                     color: white;
                     padding: 4px 8px;
                     border-radius: 4px;
                     font-size: 14px;
-                }}
-                .error-card {{
+                }
+                .book-totals {
+                    color: #666;
+                    font-size: 14px;
+                    margin: 0 0 15px;
+                }
+                .error-card {
                     background: #fff2f2;
                     border: 1px solid #ffcfcf;
                     padding: 15px;
                     border-radius: 8px;
                     color: #d70000;
-                }}
-            </style>
+                }
+""" + VIRTUAL_TABLE_CSS + SPARKLINE_CSS + ANALYTICS_CSS + RISK_CSS + BULK_CANCEL_CSS + """            </style>
         </head>
         <body>
             <div class="container">
@@ -440,36 +544,135 @@ def dashboard():
                         <a href="http://localhost:8001">Live Trading</a>
                     </div>
                 </div>
-                
-                {format_account_html(paper_account)}
+"""
+
+PAGE_TAIL = """
             </div>
+""" + VIRTUAL_TABLE_SCRIPT + SPARKLINE_SCRIPT + ANALYTICS_SCRIPT + RISK_SCRIPT + CORRELATION_SCRIPT + EQUITY_ZOOM_SCRIPT + RECORDED_CHART_SCRIPT + """
 
             <script>
-                // Initialize performance chart
-                const paperChartData = {paper_account.chart_json or 'null'};
-                if (paperChartData) {{
-                    Plotly.newPlot('paper_trading_chart', paperChartData.data, paperChartData.layout);
-                }}
-
                 // Auto-refresh every 10 seconds
-                setTimeout(function() {{
+                setTimeout(function() {
                     window.location.reload();
-                }}, 10000);
+                }, 10000);
             </script>
         </body>
         </html>
-        """
-    except Exception as e:
-        return f"""
-        <html>
-            <body style="font-family: system-ui; padding: 20px;">
-                <h1>Error</h1>
-                <p>An error occurred: {str(e)}</p>
-            </body>
-        </html>
-        """, 500
+"""
+
+@app.route('/')
+def dashboard():
+    # Render the published snapshot while it is fresh; otherwise start every call for the paper
+    # account now, stream each part as it lands and publish the result as the new snapshot.
+    # Everything this request renders is local to it, so concurrent requests can't interfere.
+    account = paper_account
+    started_at = time.time()
+    snapshot = account.snapshot.get()
+    fresh = snapshot is not None and snapshot.age <= SNAPSHOT_MAX_AGE
+    cache_result('snapshot', fresh)
+    if fresh:
+        parts = {name: (lambda value=getattr(snapshot, name): value)
+                 for name in ('account', 'positions', 'orders', 'chart_json')}
+    else:
+        futures = start_account_fetch(account)
+        parts = {name: future.result for name, future in futures.items()}
+    
+    def generate():
+        # Header and CSS flush before any upstream call has returned
+        yield PAGE_HEAD
+        # The summary opens the account section and the orders close it
+        section_open = False
+        try:
+            yield format_summary_html(account, parts['account']())
+            section_open = True
+            yield format_positions_html(account, parts['positions']())
+            yield format_orders_html(account, parts['orders']())
+            section_open = False
+            # Portfolio history plus chart serialization is the slowest part, so it goes last
+            yield format_chart_script(account, parts['chart_json']())
+            if not fresh:
+                build_snapshot(account, futures, started_at)
+        except Exception as e:
+            logger.exception("Error rendering dashboard", extra={'account': account.slug})
+            yield format_error_html(account, str(e), section_open)
+        yield PAGE_TAIL
+    
+    return Response(stream_with_context(generate()), mimetype='text/html')
+
+def get_account_by_type(account_type):
+    return paper_account if account_type == 'paper_trading' else live_account
+
+@app.route('/api/<account_type>/positions')
+@json_errors
+def api_positions(account_type):
+    """Sorted, filtered page of positions; numbers stay numeric and are formatted client-side."""
+    snapshot = current_snapshot(get_account_by_type(account_type))
+    args = parse_table_args(request.args, POSITION_COLUMNS)
+    return jsonify(query_records(snapshot.positions, POSITION_COLUMNS, book=snapshot.positions, **args))
+
+@app.route('/api/<account_type>/orders')
+@json_errors
+def api_orders(account_type):
+    snapshot = current_snapshot(get_account_by_type(account_type))
+    args = parse_table_args(request.args, ORDER_COLUMNS)
+    return jsonify(query_records(snapshot.orders, ORDER_COLUMNS, **args))
+
+@app.route('/api/<account_type>/equity')
+@json_errors
+def api_equity(account_type):
+    """Equity OHLC for ``?start=&end=&width=`` from the coarsest rollup level dense enough for the width."""
+    account = get_account_by_type(account_type)
+    if not len(account.equity):
+        account.equity.refresh(account.api, force=True)
+    return jsonify(equity_json(account.equity, **parse_range_args(request.args)))
+
+@app.route('/api/<account_type>/recorded')
+@json_errors
+def api_recorded(account_type):
+    """Recorded snapshots for ``?start=&end=`` (epoch seconds), thinned to ``max_points``."""
+    account = get_account_by_type(account_type)
+    return jsonify(recorded_json(account.recorder, **parse_recorded_args(request.args)))
+
+@app.route('/api/<account_type>/analytics')
+@json_errors
+def api_analytics(account_type):
+    """Precomputed return and drawdown statistics plus the per-point series behind the charts."""
+    account = get_account_by_type(account_type)
+    if not len(account.analytics):
+        current_snapshot(account)
+    return jsonify({
+        'summary': account.analytics.summary(),
+        'series': account.analytics.series(since=request.args.get('since', type=float)),
+    })
+
+@app.route('/api/<account_type>/risk')
+@json_errors
+def api_risk(account_type):
+    """One-day VaR/ES and shock scenarios for the account's book, e.g. ``?scenario=-10%25 tech``."""
+    try:
+        account = get_account_by_type(account_type)
+        snapshot = current_snapshot(account)
+        return jsonify(risk_report(snapshot.positions, bar_cache, key=account.slug, **parse_risk_args(request.args)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/<account_type>/correlation')
+@json_errors
+def api_correlation(account_type):
+    """Clustered rolling correlation matrix and concentration of the account's book, e.g. ``?window=60``."""
+    account = get_account_by_type(account_type)
+    snapshot = current_snapshot(account)
+    return jsonify(correlations.report(account.slug, snapshot.positions, **parse_correlation_args(request.args)))
+
+@app.route('/api/<account_type>/sparklines')
+@json_errors
+def api_sparklines(account_type):
+    """30-day daily closes and return stats for every symbol the account holds."""
+    snapshot = current_snapshot(get_account_by_type(account_type))
+    return jsonify(sparkline_stats(bar_cache, [p.symbol for p in snapshot.positions]))
 
 @app.route('/liquidate/<account_type>', methods=['POST'])
+@priority(RISK)
 def liquidate(account_type):
     account = paper_account if account_type == 'paper_trading' else live_account
     try:
@@ -481,6 +684,7 @@ def liquidate(account_type):
             account.api.cancel_all_orders()
             results.append("Successfully cancelled all existing orders")
         except Exception as e:
+            logger.exception("Error cancelling orders", extra={'account': account.slug})
             results.append(f"Error cancelling orders: {str(e)}")
         
         # Wait a moment for orders to be cancelled
@@ -511,6 +715,7 @@ def liquidate(account_type):
                     )
                     results.append(f"  Order submitted: {order.id}")
             except Exception as e:
+                logger.exception("Error liquidating position", extra={'account': account.slug, 'symbol': position.symbol})
                 results.append(f"  Error: {str(e)}")
         
         return f"""
@@ -564,6 +769,7 @@ def liquidate(account_type):
         </html>
         """
     except Exception as e:
+        logger.exception("Error liquidating positions", extra={'account': account.slug})
         return f"""
         <html>
             <body style="font-family: system-ui; padding: 20px;">
@@ -574,6 +780,54 @@ def liquidate(account_type):
         </html>
         """, 500
 
+@app.route('/rebalance/<account_type>', methods=['GET', 'POST'])
+def rebalance(account_type):
+    """Preview orders moving one account to target weights; POST with ``dry_run=0`` submits them."""
+    account = paper_account if account_type == 'paper_trading' else live_account
+    run = rebalance_request(account.api, request.get_json(silent=True) or request.values,
+                            submit=request.method == 'POST')
+    if request.is_json:
+        return jsonify(run.to_dict()), run.status_code
+    return render_rebalance_page(f"{account.name} Rebalance", f"/rebalance/{account.slug}", run), run.status_code
+
+@app.route('/cancel_orders/<account_type>', methods=['POST'])
+def cancel_orders(account_type):
+    """Cancel one account's open orders by symbol, side, type or age; JSON in, JSON out, or the form's result page.
+
+    Previews answer at once. Real cancels run in the background: the form
+    is redirected to the job's page and JSON callers get 202 with its URL.
+    """
+    account = paper_account if account_type == 'paper_trading' else live_account
+    values = request.get_json(silent=True) or request.values
+    try:
+        selector, dry_run = parse_cancel_args(values)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not dry_run:
+        status_url = f"/cancel_orders/{account.slug}/{start_bulk_cancel(account.api, selector)}"
+        if request.is_json or request.args.get('format') == 'json':
+            return jsonify({'status_url': status_url}), 202, {'Location': status_url}
+        return redirect(status_url, code=303)
+    try:
+        run = bulk_cancel(account.api, selector, dry_run=True)
+    except Exception as e:
+        logger.exception("Error cancelling orders", extra={'account': account.slug, 'selector': selector.describe()})
+        return jsonify({'error': str(e)}), 500
+    if request.is_json or request.args.get('format') == 'json':
+        return jsonify(run.to_dict())
+    return render_bulk_cancel_page(f"{account.name} Bulk Cancel", run)
+
+@app.route('/cancel_orders/<account_type>/<job_id>')
+def cancel_orders_job(account_type, job_id):
+    """Progress of a background bulk cancel; ``?format=json`` for the same data as JSON."""
+    account = paper_account if account_type == 'paper_trading' else live_account
+    run = bulk_cancel_job(job_id)
+    if run is None:
+        return jsonify({'error': f"No bulk cancel {job_id}"}), 404
+    if request.args.get('format') == 'json':
+        return jsonify(run.to_dict())
+    return render_bulk_cancel_page(f"{account.name} Bulk Cancel", run)
+
 @app.route('/cancel_order/<account_type>/<order_id>', methods=['POST'])
 def cancel_order(account_type, order_id):
     account = paper_account if account_type == 'paper_trading' else live_account
@@ -581,6 +835,7 @@ def cancel_order(account_type, order_id):
         account.api.cancel_order(order_id)
         return redirect('/')
     except Exception as e:
+        logger.exception("Error cancelling order", extra={'account': account.slug, 'order_id': order_id})
         return f"""
         <html>
             <body style="font-family: system-ui; padding: 20px;">
@@ -0,0 +1,212 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Fractional shares go to 9 decimal places
+QTY_DECIMALS = 9
+
+FILL_COLUMNS = ['id', 'symbol', 'side', 'qty', 'price', 'time']
+
+REALIZED_COLUMNS = ['symbol', 'time', 'qty', 'price', 'fifo_pnl', 'avg_cost_pnl', 'holding_seconds']
+LOT_COLUMNS = ['symbol', 'qty', 'price', 'time', 'avg_cost']
+
+
+def _signed_qty(side, qty):
+    # Alpaca reports short sales as ``sell_short``; anything starting with "sell" reduces the position
+    return np.where(side.str.startswith('sell'), -qty, qty)
+
+
+def _running_position(qty, symbol_codes):
+    # Rounded so fractional fills that net out land exactly on flat
+    return np.round(qty.groupby(symbol_codes, sort=False).cumsum().to_numpy(), QTY_DECIMALS)
+
+
+def match_fills(fills: pd.DataFrame, carry: pd.DataFrame = None):
+    """Match fills into realized P&L with FIFO and average-cost accounting.
+
+    ``fills`` has FILL_COLUMNS; ``carry`` is the open-lot state (LOT_COLUMNS)
+    left by a previous call, so only new fills ever need processing. Returns
+    ``(realized, open_lots, traded)`` frames; ``traded`` is the notional per
+    symbol and day for turnover.
+
+    Everything is vectorized across symbols. Fills that flip a position are
+    split into a closing and an opening part; the rows between two flat
+    points form an episode in which all opens share one direction. FIFO cost
+    of a close is then the integral of open prices over the slice of
+    cumulative open quantity it consumes, read off a piecewise-linear
+    interpolation of cumulative open cost. Average cost follows the linear
+    recurrence ``basis = basis * (1 - closed / held) + opened * price``,
+    solved with grouped cumulative products.
+    """
+    fills = fills.reindex(columns=FILL_COLUMNS)
+    new = pd.DataFrame({
+        'symbol': fills['symbol'].to_numpy(dtype=object),
+        'time': fills['time'].to_numpy(dtype=np.float64),
+        'qty': _signed_qty(fills['side'].astype(str), fills['qty'].to_numpy(dtype=np.float64)),
+        'price': fills['price'].to_numpy(dtype=np.float64),
+        'avg_price': fills['price'].to_numpy(dtype=np.float64),
+        'carried': False,
+    })
+    traded = pd.DataFrame({
+        'symbol': new['symbol'],
+        'date': pd.to_datetime(new['time'], unit='s', utc=True).dt.date,
+        'notional': np.abs(new['qty']) * new['price'],
+    }).groupby(['symbol', 'date'], as_index=False)['notional'].sum()
+
+    if carry is not None and len(carry):
+        # Carried lots replay as opening fills ahead of the new ones; the
+        # average-cost recurrence sees them at the carried average instead
+        carried = pd.DataFrame({
+            'symbol': carry['symbol'].to_numpy(dtype=object),
+            'time': carry['time'].to_numpy(dtype=np.float64),
+            'qty': carry['qty'].to_numpy(dtype=np.float64),
+            'price': carry['price'].to_numpy(dtype=np.float64),
+            'avg_price': carry['avg_cost'].to_numpy(dtype=np.float64),
+            'carried': True,
+        })
+        new = pd.concat([carried, new], ignore_index=True)
+
+    # Carried lots keep their place ahead of new fills even if a fill shares their timestamp
+    order = np.lexsort((np.arange(len(new)), ~new['carried'].to_numpy(), new['time'].to_numpy(), new['symbol'].to_numpy()))
+    df = new.iloc[order].reset_index(drop=True)
+    symbol_codes = pd.factorize(df['symbol'])[0]
+
+    # Split fills that take a position through zero into a close and an open
+    pos_after = _running_position(df['qty'], symbol_codes)
+    pos_before = pos_after - df['qty'].to_numpy()
+    crosses = pos_before * pos_after < 0
+    rows = np.repeat(np.arange(len(df)), np.where(crosses, 2, 1))
+    df = df.iloc[rows].reset_index(drop=True)
+    symbol_codes = symbol_codes[rows]
+    first_part = np.r_[True, rows[1:] != rows[:-1]]
+    crossed = crosses[rows]
+    qty = df['qty'].to_numpy().copy()
+    qty[crossed & first_part] = -pos_before[rows][crossed & first_part]
+    qty[crossed & ~first_part] = pos_after[rows][crossed & ~first_part]
+    df['qty'] = qty
+
+    pos_after = _running_position(df['qty'], symbol_codes)
+    pos_before = pos_after - qty
+    is_close = (pos_before != 0) & (np.sign(qty) == -np.sign(pos_before))
+    opened = np.where(is_close, 0.0, np.abs(qty))
+    closed = np.where(is_close, np.abs(qty), 0.0)
+    episode = np.cumsum(pos_before == 0)
+
+    price = df['price'].to_numpy()
+    times = df['time'].to_numpy()
+
+    # FIFO: map each close onto the slice of cumulative open quantity it consumes
+    cum_open = np.cumsum(opened)
+    episode_start = pd.Series(cum_open - opened).groupby(episode).transform('first').to_numpy()
+    cum_closed = pd.Series(closed).groupby(episode).cumsum().to_numpy()
+    hi = episode_start + cum_closed
+    lo = hi - closed
+    is_open = opened > 0
+    curve_x = np.r_[0.0, cum_open[is_open]]
+    cost_curve = np.r_[0.0, np.cumsum(opened * price)[is_open]]
+    time_curve = np.r_[0.0, np.cumsum(opened * times)[is_open]]
+    fifo_cost = np.interp(hi, curve_x, cost_curve) - np.interp(lo, curve_x, cost_curve)
+    open_time = np.interp(hi, curve_x, time_curve) - np.interp(lo, curve_x, time_curve)
+    direction = np.sign(pos_before)
+
+    # Average cost: basis shrinks proportionally on closes and grows on opens
+    held_before = np.abs(pos_before)
+    full_close = is_close & (closed >= held_before)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        keep = np.where(is_close & ~full_close, 1.0 - closed / held_before, 1.0)
+    scale = pd.Series(keep).groupby(episode).cumprod().to_numpy()
+    basis_sum = pd.Series(opened * df['avg_price'].to_numpy() / scale).groupby(episode).cumsum().to_numpy()
+    scale_before = pd.Series(scale).groupby(episode).shift(1, fill_value=1.0).to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_cost = np.where(held_before > 0, scale_before * basis_sum / held_before, 0.0)
+
+    close_rows = np.flatnonzero(is_close)
+    realized = pd.DataFrame({
+        'symbol': df['symbol'].to_numpy()[close_rows],
+        'time': times[close_rows],
+        'qty': closed[close_rows],
+        'price': price[close_rows],
+        'fifo_pnl': direction[close_rows] * (closed[close_rows] * price[close_rows] - fifo_cost[close_rows]),
+        'avg_cost_pnl': direction[close_rows] * closed[close_rows] * (price[close_rows] - avg_cost[close_rows]),
+        'holding_seconds': times[close_rows] - open_time[close_rows] / closed[close_rows],
+    }, columns=REALIZED_COLUMNS)
+
+    # Open lots left over: opens in each symbol's last episode past what its closes consumed
+    last_row = np.r_[symbol_codes[1:] != symbol_codes[:-1], True]
+    final_position = pos_after[last_row]
+    last_episode = np.zeros(episode.max() + 1 if len(episode) else 0, dtype=bool)
+    last_episode[episode[last_row][final_position != 0]] = True
+    consumed = pd.Series(hi).groupby(episode).transform('max').to_numpy()
+    remaining = np.clip(cum_open - np.maximum(cum_open - opened, consumed), 0.0, opened)
+    lot_rows = np.flatnonzero(is_open & last_episode[episode] & (remaining > 0))
+    held_after = np.where(pos_after != 0, np.abs(pos_after), 1.0)
+    final_avg = pd.Series(scale * basis_sum / held_after).groupby(episode).transform('last').to_numpy()
+    open_lots = pd.DataFrame({
+        'symbol': df['symbol'].to_numpy()[lot_rows],
+        'qty': np.sign(qty[lot_rows]) * remaining[lot_rows],
+        'price': price[lot_rows],
+        'time': times[lot_rows],
+        'avg_cost': final_avg[lot_rows],
+    }, columns=LOT_COLUMNS)
+    return realized, open_lots, traded
+
+
+class RealizedPnL:
+    """Incremental realized P&L over a growing stream of FILL activities.
+
+    Each ``update`` matches only fills not seen before against the open lots
+    carried from the previous call. A fill older than the newest one already
+    processed would change earlier matches, so that case replays everything.
+    """
+
+    def __init__(self):
+        self.realized = pd.DataFrame(columns=REALIZED_COLUMNS)
+        self.open_lots = pd.DataFrame(columns=LOT_COLUMNS)
+        self.traded = pd.DataFrame(columns=['symbol', 'date', 'notional'])
+        self._batches = []
+        self._seen = set()
+        self._last_time = float('-inf')
+        self._lock = threading.Lock()
+
+    @property
+    def last_time(self):
+        """Time of the newest fill processed, for fetching only later ones."""
+        return None if self._last_time == float('-inf') else self._last_time
+
+    def update(self, fills) -> int:
+        """Process new fills (dicts or a DataFrame with FILL_COLUMNS); returns how many were new."""
+        fills = pd.DataFrame(fills, columns=FILL_COLUMNS) if not isinstance(fills, pd.DataFrame) else fills
+        with self._lock:
+            fresh = fills[[fill_id not in self._seen for fill_id in fills['id']]]
+            if fresh.empty:
+                return 0
+            self._seen.update(fresh['id'])
+            self._batches.append(fresh)
+            if fresh['time'].min() < self._last_time:
+                self.realized, self.open_lots, self.traded = match_fills(pd.concat(self._batches, ignore_index=True))
+            else:
+                realized, self.open_lots, traded = match_fills(fresh, self.open_lots)
+                self.realized = pd.concat([self.realized, realized], ignore_index=True)
+                self.traded = (pd.concat([self.traded, traded], ignore_index=True)
+                               .groupby(['symbol', 'date'], as_index=False)['notional'].sum())
+            self._last_time = max(self._last_time, float(fresh['time'].max()))
+            return len(fresh)
+
+    def by_symbol(self) -> pd.DataFrame:
+        realized = self.realized.assign(weighted_hold=self.realized['holding_seconds'] * self.realized['qty'])
+        summary = realized.groupby('symbol').agg(
+            fifo_pnl=('fifo_pnl', 'sum'),
+            avg_cost_pnl=('avg_cost_pnl', 'sum'),
+            closed_qty=('qty', 'sum'),
+            weighted_hold=('weighted_hold', 'sum'),
+        )
+        summary['avg_holding_days'] = summary.pop('weighted_hold') / summary['closed_qty'] / 86400
+        summary['turnover'] = self.traded.groupby('symbol')['notional'].sum()
+        return summary.reset_index()
+
+    def by_day(self) -> pd.DataFrame:
+        days = pd.to_datetime(self.realized['time'], unit='s', utc=True).dt.date
+        summary = self.realized.groupby(days)[['fifo_pnl', 'avg_cost_pnl']].sum()
+        summary['turnover'] = self.traded.groupby('date')['notional'].sum()
+        return summary.fillna(0.0).rename_axis('date').reset_index()
@@ -0,0 +1,323 @@
+import contextvars
+import hmac
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from web import flask_globals
+
+# Where on-demand and continuous profiles are written
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# On-demand sampling interval; fine enough to resolve a 300ms page deadline
+PROFILE_INTERVAL_S = 0.002
+
+# Continuous mode (PROFILE_CONTINUOUS=1) samples far less often and writes one profile per window
+PROFILE_CONTINUOUS_INTERVAL_S = float(os.getenv("PROFILE_CONTINUOUS_INTERVAL_S", "0.05"))
+PROFILE_WINDOW_S = int(os.getenv("PROFILE_WINDOW_S", "60"))
+
+# Continuous profiles kept on disk; older ones are deleted as new windows are written
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "60"))
+
+# Samples are only kept for threads currently running code from this directory,
+# which drops idle pool workers and server threads waiting for connections
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger(__name__)
+
+_continuous = None
+_continuous_lock = threading.Lock()
+
+# Profiler of the request or script run being profiled; tasks it hands to pools
+# through tracing.in_current_context see it and get their threads sampled
+_task_profiler = contextvars.ContextVar('task_profiler', default=None)
+
+
+def profile_requested(token) -> bool:
+    """True if ``token`` matches the PROFILE_TOKEN env var; always False when it is unset.
+
+    Read per call because the apps load .env after importing this module.
+    """
+    expected = os.getenv("PROFILE_TOKEN")
+    return bool(expected and token) and hmac.compare_digest(str(token), expected)
+
+
+class SamplingProfiler:
+    """Periodically samples every thread's Python stack from a background thread.
+
+    The profiled code is never traced, so overhead is one stack walk per
+    thread per interval. Pass ``threads`` (thread idents) to sample only
+    those; ``add_thread``/``remove_thread`` change the set while running. Stacks are counted per thread name and exported as a speedscope
+    profile (one lane per thread) or collapsed stacks for flamegraph.pl.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_S, name: str = "profile", threads=None):
+        self.interval = interval
+        self.name = name
+        # Thread ident -> how many callers asked for it, so nested registrations nest
+        self.threads = None if threads is None else Counter(threads)
+        self._samples = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.started_at = None
+        self.duration = 0.0
+
+    def start(self):
+        self.started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.duration = time.time() - self.started_at
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def add_thread(self, ident):
+        """Start sampling thread ``ident`` too; a no-op for a profiler of every thread."""
+        if self.threads is not None:
+            with self._lock:
+                self.threads[ident] += 1
+
+    def remove_thread(self, ident):
+        """Undo one ``add_thread``."""
+        if self.threads is not None:
+            with self._lock:
+                self.threads[ident] -= 1
+                if self.threads[ident] <= 0:
+                    del self.threads[ident]
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        own = threading.get_ident()
+        with self._lock:
+            threads = None if self.threads is None else set(self.threads)
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own or (threads is not None and ident not in threads):
+                continue
+            stack = []
+            in_app = False
+            while frame is not None:
+                code = frame.f_code
+                stack.append((getattr(code, 'co_qualname', code.co_name), code.co_filename, code.co_firstlineno))
+                in_app = in_app or code.co_filename.startswith(APP_ROOT)
+                frame = frame.f_back
+            if in_app:
+                stacks.append((names.get(ident, str(ident)), tuple(reversed(stack))))
+        with self._lock:
+            for thread, stack in stacks:
+                self._samples.setdefault(thread, Counter())[stack] += 1
+
+    def reset(self):
+        """Samples so far, cleared for the next window."""
+        with self._lock:
+            samples, self._samples = self._samples, {}
+        return samples
+
+    def speedscope(self, samples=None) -> dict:
+        """Profile in speedscope's sampled format; weights are seconds."""
+        with self._lock:
+            samples = dict(self._samples) if samples is None else samples
+        frames, index = [], {}
+        profiles = []
+        for thread, stacks in sorted(samples.items()):
+            rows, weights = [], []
+            for stack, count in stacks.items():
+                row = []
+                for frame in stack:
+                    if frame not in index:
+                        index[frame] = len(frames)
+                        frames.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+                    row.append(index[frame])
+                rows.append(row)
+                weights.append(count * self.interval)
+            profiles.append({
+                'type': 'sampled',
+                'name': thread,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': rows,
+                'weights': weights,
+            })
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': self.name,
+            'exporter': 'profiling.SamplingProfiler',
+            'shared': {'frames': frames},
+            'profiles': profiles,
+        }
+
+    def collapsed(self, samples=None) -> str:
+        """``thread;frame;frame count`` lines, the input format of flamegraph.pl."""
+        with self._lock:
+            samples = dict(self._samples) if samples is None else samples
+        lines = []
+        for thread, stacks in sorted(samples.items()):
+            for stack, count in stacks.items():
+                lines.append(";".join([thread] + [frame[0] for frame in stack]) + f" {count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, fmt: str = 'speedscope', samples=None):
+        """``(body, mimetype, extension)`` for ``fmt`` of 'speedscope' or 'collapsed'."""
+        if fmt == 'collapsed':
+            return self.collapsed(samples), 'text/plain', 'folded'
+        return json.dumps(self.speedscope(samples)), 'application/json', 'speedscope.json'
+
+    def path(self, fmt: str = 'speedscope', directory: str = PROFILE_DIR) -> str:
+        """Where ``save`` writes this profile; known as soon as sampling starts."""
+        extension = 'folded' if fmt == 'collapsed' else 'speedscope.json'
+        stamp = datetime.fromtimestamp(self.started_at).strftime('%Y%m%d-%H%M%S-%f')
+        return os.path.join(directory, f"{stamp}-{self.name}.{extension}")
+
+    def save(self, fmt: str = 'speedscope', samples=None, directory: str = PROFILE_DIR) -> str:
+        """Write the profile under ``directory`` and return its path."""
+        os.makedirs(directory, exist_ok=True)
+        body, _, _ = self.export(fmt, samples)
+        path = self.path(fmt, directory)
+        with open(path, 'w') as f:
+            f.write(body)
+        return path
+
+
+class ContinuousProfiler(SamplingProfiler):
+    """Low-rate sampler that writes one profile per PROFILE_WINDOW_S and keeps the newest PROFILE_KEEP."""
+
+    def __init__(self, interval: float = PROFILE_CONTINUOUS_INTERVAL_S, window: int = PROFILE_WINDOW_S,
+                 keep: int = PROFILE_KEEP, directory: str = os.path.join(PROFILE_DIR, "continuous")):
+        super().__init__(interval, name="continuous")
+        self.window = window
+        self.keep = keep
+        self.directory = directory
+
+    def _run(self):
+        self.started_at = time.time()
+        while not self._stop.wait(self.interval):
+            self._sample()
+            if time.time() - self.started_at >= self.window:
+                self._rotate()
+
+    def _rotate(self):
+        samples = self.reset()
+        try:
+            if samples:
+                self.save(samples=samples, directory=self.directory)
+                names = sorted(n for n in os.listdir(self.directory) if n.endswith('.speedscope.json'))
+                for name in names[:-self.keep]:
+                    os.remove(os.path.join(self.directory, name))
+        except OSError:
+            logger.exception("Error writing continuous profile")
+        self.started_at = time.time()
+
+
+def start_continuous_profiling(force: bool = False):
+    """Start the process-wide ContinuousProfiler if PROFILE_CONTINUOUS is set (or ``force``); idempotent."""
+    global _continuous
+    if _continuous is not None:
+        return _continuous
+    if not (force or os.getenv("PROFILE_CONTINUOUS", "").lower() in ("1", "true", "yes")):
+        return None
+    with _continuous_lock:
+        if _continuous is None:
+            _continuous = ContinuousProfiler().start()
+        return _continuous
+
+
+@contextmanager
+def profile_tasks(profiler):
+    """Within the block, threads running tasks handed off through ``in_current_context`` are sampled too."""
+    token = _task_profiler.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _task_profiler.reset(token)
+
+
+@contextmanager
+def sampled_thread():
+    """Sample the calling thread with the profiler of the context it runs in, if any."""
+    profiler = _task_profiler.get()
+    if profiler is None:
+        yield
+        return
+    ident = threading.get_ident()
+    profiler.add_thread(ident)
+    try:
+        yield
+    finally:
+        profiler.remove_thread(ident)
+
+
+def install_profiling(app):
+    """Let admins profile one request of a Flask ``app``, and start continuous mode if configured.
+
+    ``?profile=<PROFILE_TOKEN>`` (or the ``X-Profile-Token`` header) samples
+    the request until its last streamed byte and saves the profile, named in
+    the ``X-Profile-Path`` response header. Add ``profile_return=1`` to get
+    the profile back instead of the page, and ``profile_format=collapsed``
+    for flamegraph.pl input.
+    """
+    request, g = flask_globals()
+
+    @app.before_request
+    def start_profile():
+        # Started from the first request rather than at import, once .env is loaded
+        start_continuous_profiling()
+        # Cleared first, so a server thread reused across requests never carries the last profile
+        _task_profiler.set(None)
+        if not profile_requested(request.headers.get('X-Profile-Token') or request.args.get('profile')):
+            return
+        route = request.url_rule.rule if request.url_rule else request.path
+        name = route.strip('/').replace('/', '_').replace('<', '').replace('>', '') or 'index'
+        # The thread serving this request plus pool threads while they run its tasks;
+        # other requests in flight would blur its profile
+        g.profiler = SamplingProfiler(name=name, threads={threading.get_ident()}).start()
+        _task_profiler.set(g.profiler)
+
+    @app.after_request
+    def finish_profile(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        fmt = request.args.get('profile_format', 'speedscope')
+        if request.args.get('profile_return') or request.headers.get('X-Profile-Return'):
+            # Drain streamed pages here so the profile covers the whole render
+            response.get_data()
+            body, mimetype, extension = profiler.stop().export(fmt)
+            return app.response_class(body, mimetype=mimetype, headers={
+                'Content-Disposition': f'attachment; filename="{profiler.name}.{extension}"',
+            })
+
+        def save():
+            try:
+                profiler.stop().save(fmt)
+            except OSError:
+                logger.exception("Error saving profile")
+
+        response.headers['X-Profile-Path'] = profiler.path(fmt)
+        response.call_on_close(save)
+        return response
+
+    return app
@@ -0,0 +1,541 @@
+import html
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from bulk_cancel import wait_for_terminal
+from models import AccountRecord, PositionBook, format_qty
+from order_sync import TERMINAL_STATUSES
+from scheduler import ORDER, RISK, priority
+from tracing import in_current_context, span
+
+# {"AAPL": 0.25, "MSFT": 0.25, ...}; weights are fractions of equity, the remainder stays in cash
+REBALANCE_TARGETS_PATH = os.getenv("REBALANCE_TARGETS_PATH", "targets.json")
+
+# Orders are rounded toward zero to whole lots; e.g. 0.001 for fractional shares
+REBALANCE_LOT_SIZE = float(os.getenv("REBALANCE_LOT_SIZE", "1"))
+
+# Alpaca rejects orders under $1; smaller trims aren't worth the commission-free churn either
+REBALANCE_MIN_NOTIONAL = float(os.getenv("REBALANCE_MIN_NOTIONAL", "1"))
+
+# Share of buying power (plus expected sale proceeds) left unspent for slippage on market buys
+REBALANCE_CASH_BUFFER = 0.01
+
+# Submissions in flight at once; the account's scheduler paces them against the broker budget
+REBALANCE_WORKERS = 8
+
+# How long risk-reducing orders get to fill before buys are sent regardless
+REBALANCE_FILL_TIMEOUT_S = 60
+
+logger = logging.getLogger(__name__)
+
+_TARGET_LINE = re.compile(r'^\s*([A-Za-z][\w.\-/]*)\s*[:=,]?\s*([+-]?\d+(?:\.\d+)?)\s*(%?)\s*$')
+
+
+def parse_targets(value) -> dict:
+    """Target weights from a dict, a JSON object, or lines like ``AAPL 25%`` / ``MSFT: 0.25``."""
+    if isinstance(value, str):
+        text = value.strip()
+        if text.startswith('{'):
+            value = json.loads(text)
+        else:
+            value = {}
+            for line in re.split(r'[\n;]+', text):
+                if not line.strip():
+                    continue
+                match = _TARGET_LINE.match(line)
+                if not match:
+                    raise ValueError(f"Unrecognized target '{line.strip()}'; use e.g. AAPL 25% or AAPL 0.25")
+                weight = float(match.group(2))
+                value[match.group(1)] = weight / 100 if match.group(3) else weight
+    targets = {}
+    for symbol, weight in (value or {}).items():
+        weight = float(weight)
+        if weight < 0:
+            raise ValueError(f"Negative target for {symbol}; the rebalancer only builds long books")
+        targets[symbol.strip().upper()] = targets.get(symbol.strip().upper(), 0.0) + weight
+    if sum(targets.values()) > 1 + 1e-9:
+        raise ValueError(f"Target weights sum to {sum(targets.values()):.2%}; they must not exceed 100%")
+    return targets
+
+
+def load_targets(path: str = REBALANCE_TARGETS_PATH) -> dict:
+    """Saved targets, or an empty dict if the file doesn't exist."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return parse_targets(json.load(f))
+
+
+def format_targets(targets: dict) -> str:
+    return "\n".join(f"{symbol} {weight * 100:g}%" for symbol, weight in sorted(targets.items()))
+
+
+@dataclass
+class PlannedOrder:
+    symbol: str
+    side: str
+    qty: float
+    price: float
+    current_qty: float
+    target_qty: float
+    current_weight: float
+    target_weight: float
+    note: str = ''
+
+    @property
+    def notional(self) -> float:
+        return self.qty * self.price
+
+    @property
+    def reduces_risk(self) -> bool:
+        """Sales of longs and covers of shorts; they go out first and free buying power."""
+        return self.current_qty != 0 and (self.side == 'sell') == (self.current_qty > 0)
+
+    def to_dict(self):
+        return {
+            'symbol': self.symbol,
+            'side': self.side,
+            'qty': self.qty,
+            'price': self.price,
+            'notional': self.notional,
+            'current_qty': self.current_qty,
+            'target_qty': self.target_qty,
+            'current_weight': self.current_weight,
+            'target_weight': self.target_weight,
+            'note': self.note,
+        }
+
+
+@dataclass
+class RebalancePlan:
+    targets: dict
+    equity: float
+    buying_power: float
+    # Orders to send, then symbols left alone with the reason (no price, under minimum notional, ...)
+    orders: list = field(default_factory=list)
+    skipped: list = field(default_factory=list)
+    # Factor applied to buys so they fit in buying power plus expected sale proceeds
+    buy_scale: float = 1.0
+
+    def totals(self) -> dict:
+        sells = sum(o.notional for o in self.orders if o.side == 'sell')
+        buys = sum(o.notional for o in self.orders if o.side == 'buy')
+        return {'orders': len(self.orders), 'sell_notional': sells, 'buy_notional': buys}
+
+    def to_dict(self):
+        return {
+            'targets': self.targets,
+            'equity': self.equity,
+            'buying_power': self.buying_power,
+            'buy_scale': self.buy_scale,
+            **self.totals(),
+            'orders': [o.to_dict() for o in self.orders],
+            'skipped': [o.to_dict() for o in self.skipped],
+        }
+
+
+def _to_lots(qty, lot_size):
+    # The epsilon keeps 2.9999999 from rounding down a whole lot
+    return np.trunc(qty / lot_size + np.sign(qty) * 1e-9) * lot_size
+
+
+def plan_rebalance(book: PositionBook, account: AccountRecord, targets: dict, prices: dict = None,
+                   lot_size: float = REBALANCE_LOT_SIZE, min_notional: float = REBALANCE_MIN_NOTIONAL,
+                   cash_buffer: float = REBALANCE_CASH_BUFFER) -> RebalancePlan:
+    """Orders that move ``book`` to ``targets`` in one vectorized pass over the symbol universe.
+
+    Held symbols missing from ``targets`` are closed. Sizes round toward zero
+    to ``lot_size``, except full exits which use the exact position. Orders
+    under ``min_notional`` are skipped. A short with a positive target is
+    covered and then bought as a separate new long. Buys are scaled down
+    together when they exceed buying power plus the proceeds of the planned
+    sales. ``prices`` fills in symbols the book doesn't hold.
+    """
+    prices = prices or {}
+    held = {r.symbol: i for i, r in enumerate(book.records)}
+    symbols = sorted(set(held) | set(targets))
+    n = len(symbols)
+    current_qty = np.zeros(n)
+    price = np.full(n, np.nan)
+    current_value = np.zeros(n)
+    for j, symbol in enumerate(symbols):
+        i = held.get(symbol)
+        if i is not None:
+            record = book.records[i]
+            current_qty[j] = book.qty[i]
+            current_value[j] = book.market_value[i]
+            price[j] = record.current_price or (book.market_value[i] / book.qty[i] if book.qty[i] else np.nan)
+        if symbol in prices:
+            price[j] = prices[symbol]
+    weight = np.array([targets.get(s, 0.0) for s in symbols])
+    equity = account.equity if account.equity is not None else account.portfolio_value
+
+    priced = np.isfinite(price) & (price > 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        target_qty = np.where(priced, weight * equity / price, 0.0)
+    delta = _to_lots(target_qty - current_qty, lot_size)
+    # Closing a position sells exactly what is held, fractional remainder included
+    exit_ = weight == 0
+    delta = np.where(exit_, -current_qty, delta)
+    delta = np.where(priced, delta, 0.0)
+    # A short going long is two orders: the cover reduces risk and goes out first,
+    # the new long after it like any other buy
+    crossing = (current_qty < 0) & (delta > -current_qty)
+    opening = np.where(crossing, delta + current_qty, 0.0)
+    delta = np.where(crossing, -current_qty, delta)
+
+    # Buys that add exposure share what's left of buying power after covers, plus sale proceeds
+    adds = (delta > 0) & (current_qty >= 0)
+    sale_proceeds = float((-delta * price)[(delta < 0) & (current_qty > 0)].sum())
+    cover_cost = float((delta * price)[(delta > 0) & (current_qty < 0)].sum())
+    available = max(0.0, (account.buying_power or 0.0) + sale_proceeds - cover_cost) * (1 - cash_buffer)
+    buy_notional = float((delta * price)[adds].sum() + (opening * price)[crossing].sum())
+    buy_scale = 1.0
+    if buy_notional > available:
+        buy_scale = available / buy_notional
+        delta = np.where(adds, _to_lots(delta * buy_scale, lot_size), delta)
+        opening = np.where(crossing, _to_lots(opening * buy_scale, lot_size), 0.0)
+
+    notional = np.abs(delta) * np.where(priced, price, 0.0)
+    tiny = (delta != 0) & (notional < min_notional)
+    opening_tiny = (opening != 0) & (opening * np.where(priced, price, 0.0) < min_notional)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        current_weight = np.where(equity, current_value / equity, 0.0)
+
+    plan = RebalancePlan(targets=dict(targets), equity=equity, buying_power=account.buying_power or 0.0,
+                         buy_scale=buy_scale)
+    for j, symbol in enumerate(symbols):
+        order = PlannedOrder(
+            symbol=symbol, side='buy' if delta[j] > 0 else 'sell', qty=float(abs(delta[j])),
+            price=float(price[j]) if priced[j] else 0.0, current_qty=float(current_qty[j]),
+            target_qty=float(target_qty[j]), current_weight=float(current_weight[j]),
+            target_weight=float(weight[j]),
+        )
+        skip = None
+        if not priced[j]:
+            skip = 'no price'
+        elif tiny[j]:
+            skip = f'under ${min_notional:g} minimum'
+        elif delta[j] == 0:
+            skip = 'within one lot of target'
+        elif exit_[j]:
+            order.note = 'close position'
+        elif crossing[j]:
+            order.note = 'cover short'
+        elif adds[j] and buy_scale < 1:
+            order.note = f'scaled to {buy_scale:.0%} for buying power'
+        if skip is None:
+            plan.orders.append(order)
+        else:
+            order.note, order.qty = skip, 0.0
+            plan.skipped.append(order)
+        if crossing[j]:
+            _plan_opening(plan, order, opening[j], opening_tiny[j], buy_scale, min_notional)
+    # Risk-reducing orders first, largest first within each phase
+    plan.orders.sort(key=lambda o: (not o.reduces_risk, -o.notional))
+    return plan
+
+
+def _plan_opening(plan, cover: PlannedOrder, qty, tiny, buy_scale, min_notional):
+    """The new long bought once ``cover`` has closed the short; it is sent flat, so holds nothing."""
+    order = PlannedOrder(
+        symbol=cover.symbol, side='buy', qty=float(qty), price=cover.price, current_qty=0.0,
+        target_qty=cover.target_qty, current_weight=0.0, target_weight=cover.target_weight,
+        note='new long after cover',
+    )
+    if tiny:
+        order.note, order.qty = f'under ${min_notional:g} minimum', 0.0
+        plan.skipped.append(order)
+    elif qty == 0:
+        order.note = 'scaled to nothing for buying power'
+        plan.skipped.append(order)
+    else:
+        if buy_scale < 1:
+            order.note = f'new long after cover, scaled to {buy_scale:.0%} for buying power'
+        plan.orders.append(order)
+
+
+def fetch_plan(api, targets: dict, **kwargs) -> RebalancePlan:
+    """Read account and positions concurrently, price any new symbols, and plan the rebalance."""
+    with span("rebalance.plan", **{'rebalance.targets': len(targets)}):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            account = executor.submit(in_current_context(api.get_account))
+            positions = executor.submit(in_current_context(api.list_positions))
+            account = AccountRecord.from_entity(account.result())
+            book = PositionBook.from_entities(positions.result())
+        missing = sorted(set(targets) - set(book.symbols))
+        prices = {}
+        if missing:
+            trades = api.get_latest_trades(missing)
+            prices = {symbol: float(trade.price) for symbol, trade in trades.items()}
+        return plan_rebalance(book, account, targets, prices, **kwargs)
+
+
+@dataclass
+class OrderOutcome:
+    planned: PlannedOrder
+    id: Optional[str] = None
+    submitted_at: Optional[float] = None
+    status: str = 'not sent'
+    filled_qty: Optional[float] = None
+    filled_avg_price: Optional[float] = None
+    error: Optional[str] = None
+    # Milliseconds from the start of the run until the order was accepted / reached a terminal status
+    submit_ms: Optional[float] = None
+    confirmed_ms: Optional[float] = None
+
+    @property
+    def confirmed(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def observe(self, order, elapsed_ms: float):
+        self.status = order.status
+        self.filled_qty = _number(getattr(order, 'filled_qty', None))
+        self.filled_avg_price = _number(getattr(order, 'filled_avg_price', None))
+        if self.confirmed:
+            self.confirmed_ms = elapsed_ms
+
+    def to_dict(self):
+        return {
+            **self.planned.to_dict(),
+            'id': self.id,
+            'status': self.status,
+            'filled_qty': self.filled_qty,
+            'filled_avg_price': self.filled_avg_price,
+            'error': self.error,
+            'submit_ms': self.submit_ms,
+            'confirmed_ms': self.confirmed_ms,
+        }
+
+
+def _number(value):
+    return None if value in (None, '') else float(value)
+
+
+def execute_plan(api, plan: RebalancePlan, workers: int = REBALANCE_WORKERS,
+                 fill_timeout: float = REBALANCE_FILL_TIMEOUT_S) -> list:
+    """Submit ``plan`` as market orders: risk-reducing orders first, then buys once they've filled.
+
+    Each phase goes out concurrently, paced by the account's scheduler. Buys wait up to
+    ``fill_timeout`` for the sales that fund them and are sent regardless
+    after that, leaving the broker's buying power check to reject any that
+    still don't fit.
+    """
+    run_id = uuid.uuid4().hex[:8]
+    started = time.monotonic()
+    outcomes = [OrderOutcome(order) for order in plan.orders]
+    phases = ([o for o in outcomes if o.planned.reduces_risk], [o for o in outcomes if not o.planned.reduces_risk])
+
+    def submit(outcome, phase):
+        order = outcome.planned
+        try:
+            with priority(RISK if order.reduces_risk else ORDER):
+                placed = api.submit_order(
+                    symbol=order.symbol, qty=order.qty, side=order.side, type='market', time_in_force='day',
+                    # A short going long has a cover and a new long in the same symbol, one per phase
+                    client_order_id=f"rebalance-{run_id}-{phase}-{order.symbol}",
+                )
+            outcome.id = placed.id
+            outcome.status = placed.status
+            outcome.submitted_at = pd.Timestamp(placed.submitted_at).timestamp()
+        except Exception as e:
+            outcome.status = 'rejected'
+            outcome.error = str(e)
+        outcome.submit_ms = round((time.monotonic() - started) * 1000, 1)
+
+    with span("rebalance.execute", **{'rebalance.orders': len(outcomes)}), \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rebalance") as executor:
+        for number, phase in enumerate(phases, 1):
+            futures = [executor.submit(in_current_context(submit), outcome, number) for outcome in phase]
+            for future in futures:
+                future.result()
+            wait_for_terminal(api, phase, started, timeout=fill_timeout)
+    return outcomes
+
+
+@dataclass
+class RebalanceRequest:
+    """What a rebalance route renders: the targets as typed, and a plan, its outcomes or an error."""
+    targets_text: str = ''
+    plan: Optional[RebalancePlan] = None
+    outcomes: Optional[list] = None
+    error: Optional[str] = None
+    status_code: int = 200
+
+    def to_dict(self):
+        if self.error:
+            return {'error': self.error}
+        return {**self.plan.to_dict(),
+                'results': None if self.outcomes is None else [o.to_dict() for o in self.outcomes]}
+
+
+def rebalance_request(api, args, submit: bool = False) -> RebalanceRequest:
+    """Plan from form/query values or a JSON body, and execute when ``submit`` and not ``dry_run``.
+
+    ``targets`` falls back to the saved targets; ``dry_run`` defaults to on,
+    so only an explicit ``dry_run=0`` sends orders.
+    """
+    text = args.get('targets')
+    run = RebalanceRequest(targets_text=text if isinstance(text, str) else '')
+    try:
+        targets = parse_targets(text) if text else load_targets()
+        run.targets_text = run.targets_text or format_targets(targets)
+        if not targets:
+            # A first visit with nothing saved just shows the form
+            if text is not None or submit:
+                run.error, run.status_code = "No target weights given", 400
+            return run
+        run.plan = fetch_plan(api, targets)
+        if submit and str(args.get('dry_run', '1')).lower() in ('0', 'false', 'no', 'off'):
+            run.outcomes = execute_plan(api, run.plan)
+    except ValueError as e:
+        run.error, run.status_code = str(e), 400
+    except Exception as e:
+        logger.exception("Error rebalancing")
+        run.error, run.status_code = str(e), 500
+    return run
+
+
+def _weight(value):
+    return f"{value * 100:.1f}%"
+
+
+def _money(value):
+    return f"${value:,.2f}"
+
+
+def render_rebalance_page(title, action, run: RebalanceRequest, back: str = "/"):
+    """Target form plus the planned orders (dry run) or their outcomes, styled like the liquidation page."""
+    plan, outcomes = run.plan, run.outcomes
+    if run.error:
+        body = f"<p class='error'>{html.escape(run.error)}</p>"
+    elif plan is None:
+        body = ""
+    else:
+        totals = plan.totals()
+        sent = {id(o.planned): o for o in outcomes or ()}
+        skipped = {id(o) for o in plan.skipped}
+        rows = []
+        for order in plan.orders + plan.skipped:
+            outcome = sent.get(id(order))
+            status = ""
+            if outcome is not None:
+                status = html.escape(outcome.error or outcome.status)
+                if outcome.filled_qty:
+                    status += f" ({format_qty(outcome.filled_qty)} @ {_money(outcome.filled_avg_price or 0)})"
+            rows.append(f"""
+                    <tr class="{'skipped' if id(order) in skipped else order.side}">
+                        <td>{html.escape(order.symbol)}</td>
+                        <td class="num">{format_qty(order.current_qty)}</td>
+                        <td class="num">{_weight(order.current_weight)}</td>
+                        <td class="num">{_weight(order.target_weight)}</td>
+                        <td class="num">{_money(order.price) if order.price else '-'}</td>
+                        <td>{order.side if order.qty else ''}</td>
+                        <td class="num">{format_qty(order.qty) if order.qty else ''}</td>
+                        <td class="num">{_money(order.notional) if order.qty else ''}</td>
+                        <td>{html.escape(order.note)}</td>
+                        {f'<td>{status}</td>' if outcomes is not None else ''}
+                    </tr>""")
+        confirm = "" if outcomes is not None or not plan.orders else f"""
+                <form action="{action}" method="post">
+                    <input type="hidden" name="targets" value="{html.escape(format_targets(plan.targets).replace(chr(10), '; '))}">
+                    <input type="hidden" name="dry_run" value="0">
+                    <button type="submit" class="submit-button">Submit {totals['orders']} Orders</button>
+                </form>"""
+        body = f"""
+                <p>Equity {_money(plan.equity)}, buying power {_money(plan.buying_power)}.
+                   Sells {_money(totals['sell_notional'])}, buys {_money(totals['buy_notional'])}
+                   {f"(scaled to {plan.buy_scale:.0%} for buying power)" if plan.buy_scale < 1 else ""}.
+                   Held symbols without a target are closed.</p>
+                <table>
+                    <tr>
+                        <th>Symbol</th><th class="num">Held</th><th class="num">Weight</th><th class="num">Target</th>
+                        <th class="num">Price</th><th>Side</th><th class="num">Qty</th><th class="num">Notional</th>
+                        <th>Note</th>{'<th>Result</th>' if outcomes is not None else ''}
+                    </tr>{"".join(rows)}
+                </table>{confirm}"""
+    return f"""
+        <html>
+        <head>
+            <title>{title}</title>
+            <style>
+                body {{
+                    font-family: -apple-system, BlinkMacSystemFont, sans-serif;
+                    margin: 40px;
+                    background: #f5f5f7;
+                }}
+                .card {{
+                    background: white;
+                    padding: 20px;
+                    border-radius: 10px;
+                    box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+                    margin-bottom: 20px;
+                }}
+                table {{
+                    width: 100%;
+                    border-collapse: collapse;
+                    font-size: 14px;
+                    margin: 10px 0;
+                }}
+                th, td {{
+                    text-align: left;
+                    padding: 6px 8px;
+                    border-bottom: 1px solid #eee;
+                }}
+                .num {{
+                    text-align: right;
+                }}
+                tr.sell td {{
+                    color: #FF5000;
+                }}
+                tr.buy td {{
+                    color: #00C805;
+                }}
+                tr.skipped td {{
+                    color: #999;
+                }}
+                textarea {{
+                    width: 100%;
+                    height: 120px;
+                    font-family: monospace;
+                }}
+                .error {{
+                    color: #FF5000;
+                }}
+                .submit-button, .back-button {{
+                    display: inline-block;
+                    padding: 10px 20px;
+                    background: #007AFF;
+                    color: white;
+                    border: none;
+                    text-decoration: none;
+                    border-radius: 5px;
+                    margin-top: 20px;
+                    font-size: 14px;
+                    cursor: pointer;
+                }}
+            </style>
+        </head>
+        <body>
+            <div class="card">
+                <h1>{title}</h1>
+                <form action="{action}" method="get">
+                    <textarea name="targets" placeholder="AAPL 25%&#10;MSFT 25%">{html.escape(run.targets_text)}</textarea>
+                    <button type="submit" class="submit-button">Preview</button>
+                </form>
+                {body}
+                <a href="{back}" class="back-button">Back to Dashboard</a>
+            </div>
+        </body>
+        </html>
+        """
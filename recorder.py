@@ -0,0 +1,176 @@
+import os
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytz
+
+from web import render_placeholder
+
+# One directory per account, one file per UTC day: <root>/<account>/<YYYY-MM-DD>.bin
+EQUITY_LOG_DIR = os.getenv("EQUITY_LOG_DIR", "equity_log")
+
+# Day files older than this are deleted when a new day starts
+EQUITY_LOG_RETENTION_DAYS = int(os.getenv("EQUITY_LOG_RETENTION_DAYS", "30"))
+
+# Fixed 40-byte little-endian records, so a file is just an array on disk
+RECORD_DTYPE = np.dtype([
+    ('t', '<f8'),
+    ('equity', '<f8'),
+    ('cash', '<f8'),
+    ('buying_power', '<f8'),
+    ('gross_exposure', '<f8'),
+])
+
+# Default number of points an intraday chart asks for
+MAX_CHART_POINTS = 2000
+
+
+def _day(t):
+    return datetime.fromtimestamp(t, pytz.UTC).date()
+
+
+class EquityRecorder:
+    """Append-only log of every account snapshot the dashboard polls.
+
+    Each sample is one fixed-size record appended to the current day's file;
+    reads memory-map the day files a range touches and binary-search the
+    time column. A record cut short by a crash is ignored on read and
+    truncated away before the next append.
+    """
+
+    def __init__(self, name: str, root: str = EQUITY_LOG_DIR, retention_days: int = EQUITY_LOG_RETENTION_DAYS):
+        self.root = os.path.join(root, name.lower().replace(' ', '_'))
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self._open_day = None
+        self._last_t = None
+
+    def _path(self, day):
+        return os.path.join(self.root, f"{day.isoformat()}.bin")
+
+    def record(self, account, positions, t: float) -> bool:
+        """Append one sample from an AccountRecord and PositionBook; False if ``t`` isn't newer."""
+        row = np.array([(t, account.equity, account.cash, account.buying_power, positions.gross_exposure)],
+                       dtype=RECORD_DTYPE)
+        day = _day(t)
+        with self._lock:
+            if self._last_t is not None and t <= self._last_t:
+                return False
+            if self._open_day != day:
+                self._start_day(day)
+                if self._last_t is not None and t <= self._last_t:
+                    return False
+            with open(self._path(day), 'ab') as f:
+                f.write(row.tobytes())
+            self._last_t = t
+        return True
+
+    def _start_day(self, day):
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(day)
+        if os.path.exists(path):
+            size = os.path.getsize(path)
+            whole = size - size % RECORD_DTYPE.itemsize
+            if whole != size:
+                os.truncate(path, whole)
+            if whole:
+                last = float(np.memmap(path, dtype=RECORD_DTYPE, mode='r')[-1]['t'])
+                self._last_t = last if self._last_t is None else max(self._last_t, last)
+        self._open_day = day
+        self.prune(day)
+
+    def prune(self, today=None):
+        """Delete day files past the retention window."""
+        cutoff = (today or datetime.now(pytz.UTC).date()) - timedelta(days=self.retention_days)
+        for name in os.listdir(self.root):
+            if name.endswith('.bin') and name[:-4] < cutoff.isoformat():
+                os.remove(os.path.join(self.root, name))
+
+    def read(self, start: float = None, end: float = None) -> np.ndarray:
+        """Records with ``start <= t <= end``; a view into the file when one day covers the range."""
+        if not os.path.isdir(self.root):
+            return np.empty(0, dtype=RECORD_DTYPE)
+        first = None if start is None else _day(start).isoformat()
+        last = None if end is None else _day(end).isoformat()
+        parts = []
+        for name in sorted(os.listdir(self.root)):
+            day = name[:-4]
+            if not name.endswith('.bin') or (first and day < first) or (last and day > last):
+                continue
+            path = os.path.join(self.root, name)
+            count = os.path.getsize(path) // RECORD_DTYPE.itemsize
+            if not count:
+                continue
+            rows = np.memmap(path, dtype=RECORD_DTYPE, mode='r', shape=(count,))
+            lo = 0 if start is None else np.searchsorted(rows['t'], start)
+            hi = count if end is None else np.searchsorted(rows['t'], end, side='right')
+            if hi > lo:
+                parts.append(rows[lo:hi])
+        if not parts:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+
+def downsample(rows, max_points: int = MAX_CHART_POINTS):
+    """At most ``max_points`` records, keeping each time bucket's lowest and highest equity."""
+    if len(rows) <= max_points:
+        return rows
+    buckets = max_points // 2
+    edges = np.linspace(rows['t'][0], rows['t'][-1], buckets + 1)
+    starts = np.unique(np.searchsorted(rows['t'], edges[:-1]))
+    equity = np.asarray(rows['equity'])
+    # Per-bucket argmin/argmax via a stable sort within bucket labels
+    labels = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(rows)]))
+    order = np.lexsort((equity, labels))
+    bucket_first = np.r_[0, np.flatnonzero(np.diff(labels[order])) + 1]
+    bucket_last = np.r_[bucket_first[1:], len(order)] - 1
+    keep = np.unique(np.concatenate([order[bucket_first], order[bucket_last]]))
+    return rows[keep]
+
+
+def recorded_json(recorder: EquityRecorder, start=None, end=None, max_points: int = MAX_CHART_POINTS):
+    rows = downsample(recorder.read(start, end), max_points)
+    return {name: np.asarray(rows[name]).tolist() for name in RECORD_DTYPE.names}
+
+
+def parse_recorded_args(args):
+    return {
+        'start': args.get('start', type=float),
+        'end': args.get('end', type=float),
+        'max_points': min(20000, max(10, args.get('max_points', MAX_CHART_POINTS, type=int))),
+    }
+
+
+RECORDED_CHART_SCRIPT = """
+            <script>
+                document.querySelectorAll('[data-recorded]').forEach(function(el) {
+                    const since = Date.now() / 1000 - 86400;
+                    fetch(el.dataset.recorded + '?start=' + since).then(r => r.json()).then(function(data) {
+                        if (!data.t || data.t.length < 2) { el.remove(); return; }
+                        const x = data.t.map(t => new Date(t * 1000));
+                        Plotly.newPlot(el, [
+                            {x: x, y: data.equity, name: 'Equity', line: {color: '#007AFF', width: 1.5},
+                             hovertemplate: '$%{y:,.2f}<extra>Equity</extra>'},
+                            {x: x, y: data.gross_exposure, name: 'Gross Exposure', yaxis: 'y2',
+                             line: {color: '#8E8E93', width: 1}, hovertemplate: '$%{y:,.0f}<extra>Gross</extra>'}
+                        ], {
+                            title: 'Intraday (recorded, last 24h)',
+                            height: 300,
+                            margin: {l: 60, r: 60, t: 30, b: 30},
+                            paper_bgcolor: 'rgba(0,0,0,0)',
+                            plot_bgcolor: 'rgba(0,0,0,0)',
+                            hovermode: 'x unified',
+                            showlegend: false,
+                            yaxis: {tickprefix: '$', tickformat: ',.0f'},
+                            yaxis2: {overlaying: 'y', side: 'right', tickprefix: '$', tickformat: ',.0f', showgrid: false}
+                        });
+                    });
+                });
+            </script>
+"""
+
+
+def render_recorded_chart(endpoint):
+    """Placeholder element picked up by ``RECORDED_CHART_SCRIPT``."""
+    return render_placeholder('recorded-chart', 'recorded', endpoint)
@@ -0,0 +1,455 @@
+"""Record the broker responses a process sees to a tape, and replay them through the same clients.
+
+    BROKER_RECORD=incident.tape.gz python live_dashboard.py        # record
+    BROKER_REPLAY=incident.tape.gz BROKER_REPLAY_SPEED=10 EQUITY_LOG_DIR=/tmp/replay python live_dashboard.py
+    python replay.py info incident.tape.gz
+    python replay.py bench incident.tape.gz --speed 0                # snapshot, render and analytics timings
+
+Both hook the Alpaca client's ``_request``, below ``instrument_api`` and
+``schedule_api``, so a replayed dashboard runs the same SDK parsing,
+records, metrics and spans as it did live. Replay answers each request
+with the latest response recorded for it at or before the replay clock,
+which starts at the tape's first entry and runs at ``speed`` x real time,
+after the recorded broker latency scaled the same way. Nothing reaches the
+broker in replay, writes included.
+"""
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+from typing import Callable, Optional
+
+import numpy as np
+import requests
+from alpaca_trade_api.rest import APIError
+
+logger = logging.getLogger(__name__)
+
+# Recorded entries are buffered and written as one gzip member per batch
+TAPE_FLUSH_ENTRIES = 500
+TAPE_FLUSH_INTERVAL_S = 1.0
+
+# Entries waiting for the writer beyond this are dropped rather than slowing requests
+TAPE_QUEUE_SIZE = 10_000
+
+# Parameters the client derives from the clock (history and bar windows, order
+# cursors); replay ignores them, plus any ``date_*``, when the exact request
+# isn't on the tape
+TIME_PARAMS = frozenset({'start', 'end', 'until', 'after'})
+
+_writers = {}
+_tapes = {}
+_registry_lock = threading.Lock()
+
+
+class TapeMiss(LookupError):
+    """Raised in replay for a request the tape never recorded."""
+
+
+def _key(account, method, path, params):
+    return (account, method, path, json.dumps(params, sort_keys=True, default=str) if params else '')
+
+
+def _timeless(params):
+    if not isinstance(params, dict):
+        return params
+    return {name: value for name, value in params.items()
+            if name not in TIME_PARAMS and not name.startswith('date_')} or None
+
+
+class TapeWriter:
+    """Appends recorded responses to a gzip JSON-lines tape from a background thread.
+
+    Each line is one response: wall time ``t``, latency ``ms``, account
+    ``a``, ``m``ethod, full URL ``p``ath, ``q``uery or JSON body, ``s``tatus
+    and the decoded ``b``ody or ``e``rror. A body equal to the previous one
+    for the same account, method and path is left out, so a dashboard
+    polling an unchanged book adds a few dozen bytes per poll; only one body
+    per endpoint is held for the comparison, whatever the parameters. Encoding happens on the writer
+    thread; a crash loses at most the batch being written, and a member cut
+    short is skipped on read.
+    """
+
+    def __init__(self, path: str, flush_entries: int = TAPE_FLUSH_ENTRIES,
+                 flush_interval: float = TAPE_FLUSH_INTERVAL_S, queue_size: int = TAPE_QUEUE_SIZE):
+        self.path = path
+        self.flush_entries = flush_entries
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._last = {}
+        self._thread = threading.Thread(target=self._run, name="tape-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, entry: dict):
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _encode(self, entry):
+        key = (entry['a'], entry['m'], entry['p'])
+        if 'b' in entry:
+            body = json.dumps(entry['b'], separators=(',', ':'), default=str)
+            if self._last.get(key) == body:
+                del entry['b']
+            else:
+                self._last[key] = body
+        return json.dumps(entry, separators=(',', ':'), default=str)
+
+    def _flush(self, lines):
+        if not lines:
+            return
+        data = ('\n'.join(lines) + '\n').encode()
+        with open(self.path, 'ab') as f:
+            f.write(gzip.compress(data))
+        self.written += len(lines)
+        lines.clear()
+
+    def _run(self):
+        lines = []
+        flush_at = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                entry = self._queue.get(timeout=max(0.0, flush_at - time.monotonic()))
+            except queue.Empty:
+                entry = False
+            if entry is None:
+                self._flush(lines)
+                return
+            if entry:
+                lines.append(self._encode(entry))
+            if len(lines) >= self.flush_entries or time.monotonic() >= flush_at:
+                try:
+                    self._flush(lines)
+                except OSError:
+                    logger.exception("Error writing broker tape", extra={'path': self.path})
+                    lines.clear()
+                flush_at = time.monotonic() + self.flush_interval
+
+
+def read_tape(path: str) -> list:
+    """Every entry on the tape in order, with left-out repeated bodies filled back in."""
+    entries = []
+    last = {}
+    with open(path, 'rb') as f:
+        data = f.read()
+    while data:
+        decompressor = zlib.decompressobj(wbits=31)
+        try:
+            chunk = decompressor.decompress(data)
+        except zlib.error:
+            logger.warning("Skipping corrupt tail of broker tape", extra={'path': path})
+            break
+        if not decompressor.eof:
+            # Member cut short by a crash mid-write
+            break
+        data = decompressor.unused_data
+        for line in chunk.decode().splitlines():
+            entry = json.loads(line)
+            key = (entry['a'], entry['m'], entry['p'])
+            if 'b' in entry:
+                last[key] = entry['b']
+            elif 'e' not in entry:
+                entry['b'] = last.get(key)
+            entries.append(entry)
+    entries.sort(key=lambda e: e['t'])
+    return entries
+
+
+class Tape:
+    """A recorded tape indexed for replay: per request, the times and responses in order."""
+
+    def __init__(self, entries: list):
+        self.entries = entries
+        self.start = entries[0]['t'] if entries else 0.0
+        self.end = entries[-1]['t'] if entries else 0.0
+        exact, timeless = {}, {}
+        for entry in entries:
+            exact.setdefault(_key(entry['a'], entry['m'], entry['p'], entry.get('q')), []).append(entry)
+            timeless.setdefault(_key(entry['a'], entry['m'], entry['p'], _timeless(entry.get('q'))), []).append(entry)
+        self._exact = {key: (np.array([e['t'] for e in rows]), rows) for key, rows in exact.items()}
+        self._timeless = {key: (np.array([e['t'] for e in rows]), rows) for key, rows in timeless.items()}
+
+    @classmethod
+    def load(cls, path: str) -> 'Tape':
+        return cls(read_tape(path))
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    @property
+    def accounts(self) -> list:
+        return sorted({entry['a'] for entry in self.entries})
+
+    def lookup(self, account: str, method: str, path: str, params, at: float) -> dict:
+        """The entry recorded for this request at or before tape time ``at``, else its first.
+
+        Requests whose parameters embed the time they were made (history end
+        dates, order cursors) fall back to the same request with the
+        TIME_PARAMS left out; every other parameter, symbols included, must
+        still match.
+        """
+        series = (self._exact.get(_key(account, method, path, params))
+                  or self._timeless.get(_key(account, method, path, _timeless(params))))
+        if series is None:
+            raise TapeMiss(f"{account}: no {method} {path} on the tape")
+        times, rows = series
+        return rows[max(0, int(np.searchsorted(times, at, side='right')) - 1)]
+
+
+class ReplayClock:
+    """Tape time that starts at the tape's first entry and runs ``speed`` x faster than the wall clock."""
+
+    def __init__(self, tape: Tape, speed: float = 1.0):
+        self.tape = tape
+        self.speed = speed
+        self._started = time.monotonic()
+        self._ended = False
+
+    def __call__(self) -> float:
+        at = self.tape.start + (time.monotonic() - self._started) * self.speed
+        if at > self.tape.end and not self._ended:
+            self._ended = True
+            logger.info("Broker replay reached the end of the tape; responses stay at their last values")
+        return at
+
+
+def _request_path(api, path, base_url, api_version):
+    # The client only passes a base URL for market data
+    host = 'data' if base_url else 'trading'
+    return f"{host}:/{api_version or api._api_version}{path}"
+
+
+def record_api(api, writer: TapeWriter, account: str = 'default'):
+    """Record every response ``api`` receives to ``writer``, in place; returns the same client."""
+    request = api._request
+
+    def recording(method, path, data=None, base_url=None, api_version=None):
+        started = time.time()
+        timer = time.perf_counter()
+        entry = {'t': round(started, 6), 'a': account, 'm': method.upper(),
+                 'p': _request_path(api, path, base_url, api_version)}
+        if data:
+            entry['q'] = data
+        try:
+            body = request(method, path, data, base_url, api_version)
+        except Exception as e:
+            # APIError keeps the HTTPError; either way the response (falsy when failed) carries the status
+            response = getattr(e, 'response', None)
+            if response is None:
+                response = getattr(getattr(e, '_http_error', None), 'response', None)
+            entry.update(ms=round((time.perf_counter() - timer) * 1000, 2),
+                         s=getattr(response, 'status_code', None), e=getattr(e, '_error', None) or str(e))
+            writer.write(entry)
+            raise
+        entry.update(ms=round((time.perf_counter() - timer) * 1000, 2), s=200, b=body)
+        writer.write(entry)
+        return body
+
+    api._request = recording
+    return api
+
+
+def _replayed_error(entry):
+    response = requests.Response()
+    response.status_code = entry.get('s') or 500
+    error = entry['e']
+    http_error = requests.HTTPError(f"{response.status_code} replayed from tape", response=response)
+    if isinstance(error, dict) and 'code' in error:
+        return APIError(error, http_error)
+    return http_error
+
+
+def replay_api(api, tape: Tape, account: str = 'default', clock: Callable[[], float] = None,
+               speed: float = 1.0, latency: bool = True):
+    """Answer ``api``'s requests for ``account`` from ``tape`` instead of the broker, in place.
+
+    ``clock`` gives the tape time to answer at and defaults to a
+    ``ReplayClock`` at ``speed``. With ``latency`` each response waits its
+    recorded latency divided by ``speed``. Returns the same client.
+    """
+    clock = clock or ReplayClock(tape, speed)
+
+    def replaying(method, path, data=None, base_url=None, api_version=None):
+        entry = tape.lookup(account, method.upper(), _request_path(api, path, base_url, api_version),
+                            data or None, clock())
+        if latency and entry.get('ms') and speed > 0:
+            time.sleep(entry['ms'] / 1000.0 / speed)
+        if 'e' in entry:
+            raise _replayed_error(entry)
+        return entry.get('b')
+
+    api._request = replaying
+    return api
+
+
+def tape_writer(path: str) -> TapeWriter:
+    """The process-wide writer for ``path``; clients of every account share it."""
+    import atexit
+
+    with _registry_lock:
+        if path not in _writers:
+            _writers[path] = TapeWriter(path)
+            atexit.register(_writers[path].close)
+        return _writers[path]
+
+
+def load_tape(path: str, speed: float = 1.0):
+    """The tape at ``path`` and its clock, loaded once per process so every account replays in step."""
+    with _registry_lock:
+        if path not in _tapes:
+            tape = Tape.load(path)
+            _tapes[path] = (tape, ReplayClock(tape, speed))
+            logger.info("Replaying broker tape", extra={'path': path, 'entries': len(tape.entries),
+                                                        'duration_s': round(tape.duration, 1), 'speed': speed})
+        return _tapes[path]
+
+
+def tape_api(api, account: str = 'default'):
+    """Record or replay ``api``'s broker traffic as BROKER_RECORD or BROKER_REPLAY say; otherwise a no-op.
+
+    The variables are read here rather than at import, so a .env loaded
+    before the client is built applies. Apply it inside ``instrument_api``.
+    """
+    replay_path = os.getenv("BROKER_REPLAY")
+    if replay_path:
+        speed = float(os.getenv("BROKER_REPLAY_SPEED", "1"))
+        tape, clock = load_tape(replay_path, speed)
+        return replay_api(api, tape, account, clock=clock, speed=speed)
+    record_path = os.getenv("BROKER_RECORD")
+    if record_path:
+        return record_api(api, tape_writer(record_path), account)
+    return api
+
+
+def tape_info(path: str) -> dict:
+    """Size, span and request counts of a tape."""
+    tape = Tape.load(path)
+    calls = {}
+    for entry in tape.entries:
+        name = f"{entry['a']} {entry['m']} {entry['p']}"
+        calls[name] = calls.get(name, 0) + 1
+    return {
+        'path': path,
+        'bytes': os.path.getsize(path),
+        'entries': len(tape.entries),
+        'errors': sum(1 for e in tape.entries if 'e' in e),
+        'start': tape.start,
+        'duration_s': round(tape.duration, 3),
+        'accounts': tape.accounts,
+        'calls': dict(sorted(calls.items(), key=lambda item: -item[1])),
+    }
+
+
+def _percentiles(values):
+    if not values:
+        return {}
+    values = np.asarray(values) * 1000
+    return {'p50_ms': round(float(np.percentile(values, 50)), 2), 'p95_ms': round(float(np.percentile(values, 95)), 2),
+            'max_ms': round(float(values.max()), 2)}
+
+
+def bench(path: str, account: Optional[str] = None, speed: float = 0.0, latency: bool = False) -> dict:
+    """Rebuild, render and analyze every account snapshot on the tape as the dashboards do.
+
+    Each recorded account poll becomes one snapshot fetched through a
+    replaying client pinned to that poll's time, then its position and order
+    cards are rendered and any history is fed to the equity analytics. With
+    ``speed`` above 0 polls are paced at that multiple of the recorded
+    timing and ``lag`` shows how far behind the benchmark fell; at 0 they
+    run back to back.
+    """
+    import alpaca_trade_api as tradeapi
+
+    from analytics import EquityAnalytics
+    from fragments import render_order_cards, render_position_cards
+    from models import AccountRecord, OrderRecord, PortfolioSnapshot, PositionBook
+    from order_sync import list_all_orders
+
+    tape = Tape.load(path)
+    account = account or (tape.accounts[0] if tape.accounts else 'default')
+    polls = [e['t'] for e in tape.entries if e['a'] == account and e['m'] == 'GET' and e['p'].endswith('/account')]
+    has_history = any(e['a'] == account and e['p'].endswith('/account/portfolio/history') for e in tape.entries)
+    at = [tape.start]
+    api = replay_api(tradeapi.REST(key_id='replay', secret_key='replay', base_url='http://replay.invalid'),
+                     tape, account, clock=lambda: at[0], speed=speed or 1.0, latency=latency)
+    analytics = EquityAnalytics()
+    timings = {'fetch': [], 'render': [], 'analytics': []}
+    lag = []
+    errors = 0
+    started = time.monotonic()
+    for t in polls:
+        if speed > 0:
+            due = started + (t - tape.start) / speed
+            wait = due - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            else:
+                lag.append(-wait)
+        at[0] = t
+        timer = time.perf_counter()
+        try:
+            snapshot = PortfolioSnapshot(
+                name=account,
+                account=AccountRecord.from_entity(api.get_account()),
+                positions=PositionBook.from_entities(api.list_positions()),
+                orders=[OrderRecord.from_entity(o) for o in list_all_orders(api)],
+                fetched_at=t,
+            )
+        except Exception:
+            errors += 1
+            continue
+        timings['fetch'].append(time.perf_counter() - timer)
+        timer = time.perf_counter()
+        render_position_cards(snapshot.positions)
+        render_order_cards(snapshot.orders, "/cancel_order")
+        timings['render'].append(time.perf_counter() - timer)
+        if has_history:
+            timer = time.perf_counter()
+            history = api.get_portfolio_history()
+            analytics.update(history.timestamp, history.equity)
+            timings['analytics'].append(time.perf_counter() - timer)
+    elapsed = time.monotonic() - started
+    return {
+        'account': account,
+        'snapshots': len(timings['fetch']),
+        'errors': errors,
+        'tape_s': round(tape.duration, 3),
+        'elapsed_s': round(elapsed, 3),
+        'effective_speed': round(tape.duration / elapsed, 1) if elapsed else None,
+        **{name: _percentiles(values) for name, values in timings.items() if values},
+        'lag': _percentiles(lag) if lag else None,
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or benchmark a recorded broker tape.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    info_parser = commands.add_parser('info', help="summarize a tape")
+    info_parser.add_argument('tape')
+    bench_parser = commands.add_parser('bench', help="replay a tape's snapshots through parsing, rendering and analytics")
+    bench_parser.add_argument('tape')
+    bench_parser.add_argument('-a', '--account', help="account as recorded (default: the first on the tape)")
+    bench_parser.add_argument('-s', '--speed', type=float, default=0.0,
+                              help="multiple of recorded timing to pace polls at; 0 runs them back to back")
+    bench_parser.add_argument('--latency', action='store_true', help="also wait out the recorded broker latency")
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        result = tape_info(args.tape)
+    else:
+        result = bench(args.tape, account=args.account, speed=args.speed, latency=args.latency)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from metrics import cache_result
+from tracing import in_current_context, span
+
+# Page-level latency budget; panels that miss it render from cache or a placeholder
+DEFAULT_DEADLINE_MS = int(os.getenv("DASHBOARD_DEADLINE_MS", "300"))
+
+# How long a background panel request may wait for its data before giving up
+PANEL_TIMEOUT_S = float(os.getenv("DASHBOARD_PANEL_TIMEOUT_S", "10"))
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream endpoint whose breaker is open."""
+
+
+class CircuitBreaker:
+    """Per-endpoint breaker: opens after repeated failures, half-opens after a cool-down."""
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                # Let exactly one trial call through to probe the upstream
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.last_error = None
+            self._trial_in_flight = False
+
+    def record_failure(self, error: Exception):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            self._trial_in_flight = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+@dataclass
+class PanelResult:
+    value: Any = None
+    source: str = "pending"  # live, cache, pending or error
+    error: Optional[str] = None
+    fetched_at: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.source in ("live", "cache")
+
+    @property
+    def age(self) -> Optional[float]:
+        if self.fetched_at is None:
+            return None
+        return time.time() - self.fetched_at
+
+
+class PanelFetcher:
+    """Runs upstream calls in the background under a deadline.
+
+    Each key has its own circuit breaker, its last good value and at most one
+    call in flight, so a slow endpoint is never requested twice concurrently
+    and a panel that misses the deadline can be filled in by a later request.
+    """
+
+    def __init__(self, max_workers: int = 8, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="panel")
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._cache: Dict[str, PanelResult] = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, key: str) -> CircuitBreaker:
+        with self._lock:
+            if key not in self._breakers:
+                self._breakers[key] = CircuitBreaker(key, self.failure_threshold, self.reset_timeout)
+            return self._breakers[key]
+
+    def cached(self, key: str) -> Optional[PanelResult]:
+        return self._cache.get(key)
+
+    def submit(self, key: str, fn: Callable, *args, **kwargs):
+        """Start fetching ``key`` unless a call is already in flight; returns a future of its live PanelResult."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None and not future.done():
+                return future
+            # The call runs in the submitting request's trace
+            future = self._executor.submit(in_current_context(self._call), key, fn, args, kwargs)
+            self._in_flight[key] = future
+            return future
+
+    def _call(self, key, fn, args, kwargs):
+        breaker = self.breaker(key)
+        if not breaker.allow():
+            raise CircuitOpenError(f"{key} unavailable: {breaker.last_error}")
+        try:
+            with span("panel.fetch", panel=key):
+                value = fn(*args, **kwargs)
+        except Exception as e:
+            breaker.record_failure(e)
+            raise
+        breaker.record_success()
+        # Stamped when the data arrived, however late a waiting request reads it
+        fetched_at = time.time()
+        self._cache[key] = PanelResult(value=value, source="cache", fetched_at=fetched_at)
+        return PanelResult(value=value, source="live", fetched_at=fetched_at)
+
+    def result(self, key: str, future, deadline: float) -> PanelResult:
+        """Wait for ``future`` until the monotonic ``deadline``, falling back to the cache."""
+        with span("panel.wait", panel=key) as waited:
+            result = self._result(key, future, deadline)
+            waited.set(**{'panel.source': result.source})
+        return result
+
+    def _result(self, key: str, future, deadline: float) -> PanelResult:
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            cached = self._cache.get(key)
+            cache_result('panel', cached is not None)
+            return cached if cached is not None else PanelResult(source="pending")
+        except Exception as e:
+            cached = self._cache.get(key)
+            cache_result('panel', cached is not None)
+            if cached is not None:
+                return PanelResult(value=cached.value, source="cache", error=str(e), fetched_at=cached.fetched_at)
+            return PanelResult(source="error", error=str(e))
+
+    def fetch(self, key: str, fn: Callable, *args, timeout: float = PANEL_TIMEOUT_S, **kwargs) -> PanelResult:
+        """Submit and wait up to ``timeout`` seconds; used by the deferred panel routes."""
+        future = self.submit(key, fn, *args, **kwargs)
+        return self.result(key, future, time.monotonic() + timeout)
+
+
+def deadline_from_now(deadline_ms: Optional[int] = None) -> float:
+    """Monotonic deadline for a page render, ``DASHBOARD_DEADLINE_MS`` by default."""
+    if deadline_ms is None:
+        deadline_ms = DEFAULT_DEADLINE_MS
+    return time.monotonic() + deadline_ms / 1000.0
@@ -0,0 +1,342 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+import pytz
+
+from metrics import cache_result
+from tracing import span
+from web import render_placeholder
+
+# Daily return history behind historical VaR and the Monte Carlo covariance
+HISTORY_DAYS = 365
+
+CONFIDENCE = 0.99
+MC_SCENARIOS = 100_000
+
+# Request bounds; together they cap the tail at 5% of a million scenarios
+MIN_CONFIDENCE = 0.95
+MAX_CONFIDENCE = 0.9999
+MIN_SCENARIOS = 1_000
+MAX_SCENARIOS = 1_000_000
+
+# Student-t degrees of freedom for Monte Carlo draws; fat tails matter for VaR
+MC_DEGREES_OF_FREEDOM = 5
+
+# Scenarios are simulated in chunks of this many rows to bound memory
+MC_CHUNK = 20_000
+
+# Runs with at least this many scenarios spread their chunks over processes
+MC_PROCESS_THRESHOLD = 200_000
+
+# {"tech": ["AAPL", "MSFT", ...], ...} used by shock scenarios such as "-10% tech"
+RISK_GROUPS_PATH = os.getenv("RISK_GROUPS_PATH", "risk_groups.json")
+
+DEFAULT_SCENARIOS = ('-5% all', '-10% all', '-20% all')
+
+# Reports are reused for this long; dashboards reload far more often than the tail moves
+RISK_TTL_S = 60
+
+# Cached reports kept, least recently used evicted first
+MAX_RISK_REPORTS = 8
+
+# Significant figures of market value in a cached report's book fingerprint: a
+# trade or a large move gets a fresh report, tick-by-tick drift reuses the old one
+RISK_KEY_SIGNIFICANT_FIGURES = 3
+
+_SHOCK = re.compile(r'([+-]?\d+(?:\.\d+)?)%\s*([\w.\-/]+)')
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+_reports = OrderedDict()
+_reports_lock = threading.Lock()
+
+
+@dataclass
+class RiskResult:
+    method: str
+    confidence: float
+    scenarios: int
+    # None when there is no return history to measure the tail from
+    var: Optional[float]
+    es: Optional[float]
+    # Each symbol's share of expected shortfall; sums to ``es``
+    contributions: dict = field(default_factory=dict)
+
+    def to_dict(self):
+        return {
+            'method': self.method,
+            'confidence': self.confidence,
+            'scenarios': self.scenarios,
+            'var': self.var,
+            'es': self.es,
+            'contributions': self.contributions,
+        }
+
+
+def returns_matrix(bar_cache, symbols, days: int = HISTORY_DAYS):
+    """Daily simple returns (T x N) for ``symbols`` from the bar cache.
+
+    Symbols without bars get a zero column and are listed in ``missing``.
+    """
+    end = datetime.now(pytz.UTC)
+    start = end - timedelta(days=days)
+    bar_cache.ensure(symbols, start.date(), end.date())
+    closes = bar_cache.closes(symbols, start, end).reindex(columns=list(symbols))
+    missing = [symbol for symbol in symbols if closes[symbol].count() < 2]
+    returns = closes.sort_index().pct_change(fill_method=None).iloc[1:].fillna(0.0)
+    return returns.to_numpy(dtype=np.float64), missing
+
+
+def _tail(pnl, exposures_returns, confidence):
+    """VaR, ES and per-symbol ES contributions from scenario P&L and the matching asset P&L rows."""
+    n_tail = max(1, int(np.ceil(len(pnl) * (1 - confidence))))
+    worst = np.argpartition(pnl, n_tail - 1)[:n_tail]
+    var = -float(np.max(pnl[worst]))
+    es = -float(np.mean(pnl[worst]))
+    contributions = -exposures_returns[worst].mean(axis=0)
+    return var, es, contributions
+
+
+def historical_var(returns, exposures, symbols, confidence: float = CONFIDENCE) -> RiskResult:
+    """One-day VaR/ES replaying each historical day's returns on today's book."""
+    if not len(returns):
+        return RiskResult('historical', confidence, 0, None, None)
+    asset_pnl = returns * exposures
+    var, es, contributions = _tail(asset_pnl.sum(axis=1), asset_pnl, confidence)
+    return RiskResult('historical', confidence, len(returns), var, es, _by_symbol(symbols, contributions))
+
+
+def _draw(factor, rows, dof, seed):
+    rng = np.random.default_rng(seed)
+    z = rng.standard_normal((rows, factor.shape[0]))
+    if dof:
+        # Multivariate t with the same covariance: scale rows by a shared chi-square draw
+        z *= np.sqrt((dof - 2) / rng.chisquare(dof, size=(rows, 1)))
+    return z
+
+
+def _simulate_chunk(args):
+    """Worst rows of one Monte Carlo chunk: their portfolio P&L and row indices."""
+    factor, exposures, rows, n_tail, dof, seed = args
+    # factor.T @ factor is the sample covariance, so Z @ factor has it too;
+    # portfolio P&L only needs Z against the factor's exposure-weighted sum
+    pnl = _draw(factor, rows, dof, seed) @ (factor @ exposures)
+    worst = np.argpartition(pnl, min(n_tail, rows) - 1)[:n_tail]
+    return pnl[worst], worst
+
+
+def _tail_draws(args):
+    """Sum of one chunk's draws over the given rows, redrawn from the chunk's seed."""
+    factor, rows, dof, seed, tail_rows = args
+    return _draw(factor, rows, dof, seed)[tail_rows].sum(axis=0)
+
+
+def _get_process_pool():
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor()
+        return _process_pool
+
+
+def monte_carlo_var(returns, exposures, symbols, scenarios: int = MC_SCENARIOS, confidence: float = CONFIDENCE,
+                    dof: float = MC_DEGREES_OF_FREEDOM, seed=None) -> RiskResult:
+    """One-day VaR/ES from simulated returns with the history's covariance.
+
+    Scenarios are drawn in chunks as ``Z @ F`` where ``F`` is the demeaned
+    return history scaled so ``F.T @ F`` is the covariance; no N x N matrix
+    is ever factored. Each chunk keeps only the P&L and indices of its worst
+    rows, which always contain the overall tail; the chunks holding the
+    final tail then redraw just those rows from their seeds for the
+    per-symbol contributions. Large runs spread chunks over processes.
+    Without return history there is no covariance, so nothing is simulated.
+    """
+    if not len(returns):
+        return RiskResult('monte_carlo', confidence, 0, None, None)
+    factor = (returns - returns.mean(axis=0)) / np.sqrt(max(len(returns) - 1, 1))
+    n_tail = max(1, int(np.ceil(scenarios * (1 - confidence))))
+    sizes = [min(MC_CHUNK, scenarios - start) for start in range(0, scenarios, MC_CHUNK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(factor, exposures, rows, n_tail, dof, s) for rows, s in zip(sizes, seeds)]
+    run = _get_process_pool().map if scenarios >= MC_PROCESS_THRESHOLD else map
+    chunks = list(run(_simulate_chunk, jobs))
+    pnl = np.concatenate([c[0] for c in chunks])
+    chunk_of = np.concatenate([np.full(len(c[1]), i) for i, c in enumerate(chunks)])
+    rows = np.concatenate([c[1] for c in chunks])
+    # Tail size is fixed by the full scenario count, not by the rows kept
+    worst = np.argpartition(pnl, n_tail - 1)[:n_tail]
+    var = -float(np.max(pnl[worst]))
+    es = -float(np.mean(pnl[worst]))
+    redraws = [
+        (factor, sizes[i], dof, seeds[i], rows[worst[chunk_of[worst] == i]])
+        for i in np.unique(chunk_of[worst])
+    ]
+    draws = sum(run(_tail_draws, redraws))
+    contributions = -(draws @ factor) * exposures / n_tail
+    return RiskResult('monte_carlo', confidence, scenarios, var, es, _by_symbol(symbols, contributions))
+
+
+def _by_symbol(symbols, values):
+    return {symbol: float(value) for symbol, value in zip(symbols, values)}
+
+
+def load_groups(path: str = RISK_GROUPS_PATH):
+    """Symbol groups for shock scenarios, keyed by lower-case name; empty if the file is missing."""
+    try:
+        with open(path) as f:
+            return {name.lower(): {s.upper() for s in members} for name, members in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+
+
+def parse_scenario(spec: str, symbols, groups) -> np.ndarray:
+    """Shock vector for ``spec`` such as "-10% tech, +5% XOM"; ``all`` shocks the whole book.
+
+    Later terms override earlier ones for symbols they share.
+    """
+    shocks = np.zeros(len(symbols))
+    terms = _SHOCK.findall(spec)
+    if not terms:
+        raise ValueError(f"Unrecognized scenario: {spec!r}")
+    for pct, target in terms:
+        name = target.lower()
+        if name == 'all':
+            members = np.ones(len(symbols), dtype=bool)
+        elif name in groups:
+            members = np.array([symbol in groups[name] for symbol in symbols], dtype=bool)
+        else:
+            members = np.array([symbol == target.upper() for symbol in symbols], dtype=bool)
+            if not members.any():
+                raise ValueError(f"Unknown group or symbol {target!r} in scenario {spec!r}")
+        shocks[members] = float(pct) / 100
+    return shocks
+
+
+def stress_test(symbols, exposures, specs, groups=None, top: int = 5):
+    """P&L of each shock scenario, evaluated together as one (scenarios x symbols) shock matrix."""
+    groups = load_groups() if groups is None else groups
+    if not len(specs):
+        return []
+    shocks = np.vstack([parse_scenario(spec, symbols, groups) for spec in specs])
+    asset_pnl = shocks * exposures
+    results = []
+    for spec, row in zip(specs, asset_pnl):
+        worst = np.argsort(row)[:top]
+        results.append({
+            'scenario': spec,
+            'pnl': float(row.sum()),
+            'worst': [{'symbol': symbols[i], 'pnl': float(row[i])} for i in worst if row[i] < 0],
+        })
+    return results
+
+
+@span("risk.report")
+def risk_report(book, bar_cache, specs=DEFAULT_SCENARIOS, confidence: float = CONFIDENCE,
+                scenarios: int = MC_SCENARIOS, key=None):
+    """Historical and Monte Carlo VaR/ES plus shock scenarios for a PositionBook.
+
+    Pass ``key`` (e.g. the account name) to reuse a report for RISK_TTL_S.
+    """
+    symbols = [p.symbol for p in book]
+    if key is not None:
+        # The book is part of the key: a trade under the same account must not get the old report
+        values = tuple(float(f'{v:.{RISK_KEY_SIGNIFICANT_FIGURES}g}') for v in book.market_value)
+        cache_key = (key, tuple(specs), confidence, scenarios, tuple(symbols), tuple(book.qty), values)
+        with _reports_lock:
+            cached = _reports.get(cache_key)
+            if cached is not None:
+                _reports.move_to_end(cache_key)
+        hit = cached is not None and time.time() - cached[0] < RISK_TTL_S
+        cache_result('risk', hit)
+        if hit:
+            return cached[1]
+
+    if not symbols:
+        report = {'historical': None, 'monte_carlo': None, 'stress': [], 'missing': []}
+    else:
+        exposures = np.asarray(book.market_value, dtype=np.float64)
+        returns, missing = returns_matrix(bar_cache, symbols)
+        report = {
+            'historical': historical_var(returns, exposures, symbols, confidence).to_dict(),
+            'monte_carlo': monte_carlo_var(returns, exposures, symbols, scenarios, confidence).to_dict(),
+            'stress': stress_test(symbols, exposures, specs),
+            'missing': missing,
+        }
+    if key is not None:
+        with _reports_lock:
+            _reports[cache_key] = (time.time(), report)
+            _reports.move_to_end(cache_key)
+            while len(_reports) > MAX_RISK_REPORTS:
+                _reports.popitem(last=False)
+    return report
+
+
+def parse_risk_args(args):
+    """Scenario specs, confidence and Monte Carlo size from a request's query string."""
+    return {
+        'specs': tuple(args.getlist('scenario')) or DEFAULT_SCENARIOS,
+        'confidence': min(MAX_CONFIDENCE, max(MIN_CONFIDENCE, args.get('confidence', CONFIDENCE, type=float))),
+        'scenarios': min(MAX_SCENARIOS, max(MIN_SCENARIOS, args.get('scenarios', MC_SCENARIOS, type=int))),
+    }
+
+
+RISK_CSS = """
+                .risk-panel {
+                    margin: 20px 0;
+                    padding: 15px;
+                    border: 1px solid #e5e5e5;
+                    border-radius: 8px;
+                    font-size: 14px;
+                }
+                .risk-panel table {
+                    width: 100%;
+                    border-collapse: collapse;
+                }
+                .risk-panel td {
+                    padding: 4px 0;
+                }
+                .risk-panel .num {
+                    text-align: right;
+                }
+"""
+
+# Marks each panel it fills; the live page calls loadRiskPanels() again once a
+# late positions panel has been swapped in.
+RISK_SCRIPT = """
+            <script>
+                function loadRiskPanels() {
+                    document.querySelectorAll('[data-risk]:not([data-risk-loaded])').forEach(function(el) {
+                        el.dataset.riskLoaded = '1';
+                        const money = new Intl.NumberFormat(undefined, {style: 'currency', currency: 'USD'});
+                        fetch(el.dataset.risk).then(r => r.json()).then(function(data) {
+                            if (data.error) { el.textContent = 'Risk unavailable: ' + data.error; return; }
+                            if (!data.historical) { el.remove(); return; }
+                            const pct = (data.historical.confidence * 100).toFixed(0) + '%';
+                            const rows = [
+                                ['Historical VaR ' + pct, data.historical.var], ['Historical ES ' + pct, data.historical.es],
+                                ['Monte Carlo VaR ' + pct, data.monte_carlo.var], ['Monte Carlo ES ' + pct, data.monte_carlo.es]
+                            ].concat(data.stress.map(s => ['Scenario ' + s.scenario, -s.pnl]));
+                            el.innerHTML = '<h3>One-day tail risk</h3><table>' + rows.map(r => '<tr><td>' + r[0] +
+                                '</td><td class="num">' + (r[1] === null ? '-' : money.format(-r[1])) + '</td></tr>').join('') + '</table>' +
+                                (data.missing.length ? '<p>No price history for ' + data.missing.join(', ') + '</p>' : '');
+                        });
+                    });
+                }
+                loadRiskPanels();
+            </script>
+"""
+
+
+def render_risk_panel(endpoint):
+    """Placeholder element picked up by ``RISK_SCRIPT``."""
+    return render_placeholder('risk-panel', 'risk', endpoint)
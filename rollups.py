@@ -0,0 +1,226 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+MARKET_TZ = 'America/New_York'
+
+# (name, bucket seconds, retention seconds or None to keep everything)
+LEVELS = (
+    ('1Min', 60, 7 * 86400),
+    ('5Min', 300, 60 * 86400),
+    ('1H', 3600, 2 * 365 * 86400),
+    ('1D', 86400, None),
+)
+
+# Intraday portfolio history only changes once a minute
+REFRESH_INTERVAL_S = 60
+
+_COLUMNS = ('t', 'open', 'high', 'low', 'close')
+
+
+def _empty():
+    return {name: np.empty(0) for name in _COLUMNS}
+
+
+def _bucket(t, seconds):
+    """Bucket start for each timestamp; daily buckets start at midnight New York time."""
+    if seconds < 86400:
+        return t // seconds * seconds
+    days = pd.DatetimeIndex(pd.to_datetime(t, unit='s', utc=True)).tz_convert(MARKET_TZ).normalize()
+    return days.asi8 / 1e9
+
+
+def _rollup(rows, seconds):
+    """Aggregate OHLC rows (sorted by t) into buckets of ``seconds``."""
+    if not len(rows['t']):
+        return _empty()
+    keys = _bucket(rows['t'], seconds)
+    starts = np.r_[0, np.flatnonzero(np.diff(keys)) + 1]
+    ends = np.r_[starts[1:], len(keys)] - 1
+    return {
+        't': keys[starts],
+        'open': rows['open'][starts],
+        'high': np.maximum.reduceat(rows['high'], starts),
+        'low': np.minimum.reduceat(rows['low'], starts),
+        'close': rows['close'][ends],
+    }
+
+
+def _slice(rows, lo, hi=None):
+    return {name: values[lo:hi] for name, values in rows.items()}
+
+
+def _concat(a, b):
+    return {name: np.concatenate([a[name], b[name]]) for name in _COLUMNS}
+
+
+class EquityPyramid:
+    """Equity OHLC kept at 1Min, 5Min, 1H and 1D resolution.
+
+    New 1-minute points are appended to the base level and each coarser
+    level recomputes only the buckets from the first one they touch, so a
+    refresh costs the size of the change. ``seed`` loads history straight
+    into a coarse level for ranges the finer levels never saw (e.g. a year
+    of daily equity). Readers get a consistent set of levels without locking.
+    """
+
+    def __init__(self, levels=LEVELS):
+        self.levels = levels
+        self._state = {name: _empty() for name, _, _ in levels}
+        self._lock = threading.Lock()
+        self._refreshed_at = 0.0
+
+    def __len__(self):
+        return sum(len(rows['t']) for rows in self._state.values())
+
+    def _points(self, timestamps, equity):
+        t = np.asarray(timestamps, dtype=np.float64)
+        eq = np.array([np.nan if e is None else e for e in equity], dtype=np.float64)
+        valid = np.isfinite(eq) & (eq > 0)
+        order = np.argsort(t[valid], kind='stable')
+        t, eq = t[valid][order], eq[valid][order]
+        return {'t': t, 'open': eq, 'high': eq, 'low': eq, 'close': eq}
+
+    def _merge(self, rows, new):
+        """Replace everything from ``new``'s first timestamp on with ``new`` (plus any later rows kept)."""
+        cut = np.searchsorted(rows['t'], new['t'][0])
+        after = np.searchsorted(rows['t'], new['t'][-1], side='right')
+        return _concat(_concat(_slice(rows, 0, cut), new), _slice(rows, after))
+
+    def update(self, timestamps, equity) -> int:
+        """Merge 1-minute equity points and roll them up; returns how many were merged."""
+        new = self._points(timestamps, equity)
+        if not len(new['t']):
+            return 0
+        with self._lock:
+            state = dict(self._state)
+            name, _, retention = self.levels[0]
+            base = self._merge(state[name], new)
+            if retention is not None:
+                base = _slice(base, np.searchsorted(base['t'], base['t'][-1] - retention))
+            state[name] = base
+            changed_from = new['t'][0]
+            for (lower, _, _), (name, seconds, retention) in zip(self.levels, self.levels[1:]):
+                start = _bucket(np.array([changed_from]), seconds)[0]
+                source = _slice(state[lower], np.searchsorted(state[lower]['t'], start))
+                rolled = _rollup(source, seconds)
+                rows = state[name]
+                rows = _concat(_slice(rows, 0, np.searchsorted(rows['t'], start)), rolled)
+                if retention is not None:
+                    rows = _slice(rows, np.searchsorted(rows['t'], rows['t'][-1] - retention))
+                state[name] = rows
+                changed_from = start
+            self._state = state
+        return len(new['t'])
+
+    def seed(self, level: str, timestamps, equity) -> int:
+        """Load points directly into ``level`` without touching finer levels."""
+        new = self._points(timestamps, equity)
+        if not len(new['t']):
+            return 0
+        seconds = dict((name, s) for name, s, _ in self.levels)[level]
+        new['t'] = _bucket(new['t'], seconds)
+        with self._lock:
+            state = dict(self._state)
+            state[level] = self._merge(state[level], new)
+            self._state = state
+        return len(new['t'])
+
+    def refresh(self, api, force: bool = False) -> int:
+        """Pull today's 1-minute portfolio history at most once per REFRESH_INTERVAL_S."""
+        if not force and time.time() - self._refreshed_at < REFRESH_INTERVAL_S:
+            return 0
+        self._refreshed_at = time.time()
+        if not len(self._state[self.levels[-1][0]]['t']):
+            year = api.get_portfolio_history(period='1A', timeframe='1D')
+            self.seed(self.levels[-1][0], year.timestamp, year.equity)
+        history = api.get_portfolio_history(period='1D', timeframe='1Min', extended_hours=True)
+        return self.update(history.timestamp, history.equity)
+
+    def select(self, start: float = None, end: float = None, width: int = 1000):
+        """Coarsest level with at least ``width`` buckets across [start, end] that covers ``start``.
+
+        Falls back to the finest covering level when no level is that dense.
+        Returns ``(level, rows)`` with rows sliced from the level's arrays.
+        """
+        state = self._state
+        levels = [(name, seconds) for name, seconds, _ in self.levels if len(state[name]['t'])]
+        if not levels:
+            return None, _empty()
+        end = max(state[name]['t'][-1] for name, _ in levels) if end is None else end
+        start = min(state[name]['t'][0] for name, _ in levels) if start is None else start
+        covering = [(name, seconds) for name, seconds in levels if state[name]['t'][0] <= start] or levels[-1:]
+        dense = [(name, seconds) for name, seconds in covering if (end - start) / seconds >= width]
+        name = (dense[-1] if dense else covering[0])[0]
+        rows = state[name]
+        # Include the bucket containing ``start`` so the line doesn't begin mid-screen
+        lo = max(np.searchsorted(rows['t'], start, side='right') - 1, 0)
+        hi = np.searchsorted(rows['t'], end, side='right')
+        return name, _slice(rows, lo, hi)
+
+
+def _timestamp(value):
+    """Epoch seconds from a number or an ISO date string (UTC unless it says otherwise)."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        ts = pd.Timestamp(value)
+        return (ts if ts.tzinfo else ts.tz_localize('UTC')).timestamp()
+
+
+def parse_range_args(args):
+    """``start``/``end`` and the chart ``width`` in pixels from a request's query string."""
+    return {
+        'start': _timestamp(args.get('start')),
+        'end': _timestamp(args.get('end')),
+        'width': min(5000, max(10, args.get('width', 1000, type=int))),
+    }
+
+
+def equity_json(pyramid: EquityPyramid, start=None, end=None, width=1000):
+    level, rows = pyramid.select(start, end, width)
+    return {'level': level, **{name: values.tolist() for name, values in rows.items()}}
+
+
+# Re-reads the portfolio line from the pyramid whenever the user zooms or pans
+EQUITY_ZOOM_SCRIPT = """
+            <script>
+                function attachEquityZoom(chart, endpoint) {
+                    let pending = null;
+                    chart.on('plotly_relayout', function(e) {
+                        const auto = e['xaxis.autorange'];
+                        const lo = e['xaxis.range[0]'] || (e['xaxis.range'] && e['xaxis.range'][0]);
+                        const hi = e['xaxis.range[1]'] || (e['xaxis.range'] && e['xaxis.range'][1]);
+                        if (!auto && !(lo && hi)) return;
+                        const params = new URLSearchParams({width: chart.clientWidth});
+                        if (!auto) {
+                            params.set('start', new Date(lo).getTime() / 1000);
+                            params.set('end', new Date(hi).getTime() / 1000);
+                        }
+                        const request = pending = fetch(endpoint + '?' + params).then(r => r.json()).then(function(data) {
+                            if (request !== pending || !data.t || !data.t.length) return;
+                            Plotly.restyle(chart, {x: [data.t.map(t => new Date(t * 1000))], y: [data.close],
+                                name: 'Portfolio Value (' + data.level + ')'}, [0]);
+                        });
+                    });
+                }
+                document.querySelectorAll('[data-equity]').forEach(function(el) {
+                    const chart = document.getElementById(el.dataset.chart);
+                    // The chart may be drawn after this runs; wait for Plotly to attach its handlers
+                    const wait = setInterval(function() {
+                        if (chart && chart.on) { clearInterval(wait); attachEquityZoom(chart, el.dataset.equity); }
+                    }, 200);
+                });
+            </script>
+"""
+
+
+def render_equity_zoom(chart_id, endpoint):
+    """Marker tying a Plotly chart to the pyramid endpoint for ``EQUITY_ZOOM_SCRIPT``."""
+    return f"""
+            <div data-equity="{endpoint}" data-chart="{chart_id}" hidden></div>
+    """
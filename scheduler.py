@@ -0,0 +1,220 @@
+import contextvars
+import functools
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+from urllib.parse import urlparse
+
+from metrics import BROKER_BUDGET, SCHEDULER_SHED, SCHEDULER_WAIT
+from tracing import current_span
+
+# Priorities, most urgent first; a call runs at the more urgent of its own and its context's
+RISK = 0
+ORDER = 1
+READ = 2
+BACKGROUND = 3
+PRIORITY_NAMES = {RISK: 'risk', ORDER: 'order', READ: 'read', BACKGROUND: 'background'}
+
+# Alpaca's trading API allows 200 requests a minute per account; responses refine the estimate
+BROKER_RATE_LIMIT = int(os.getenv("BROKER_RATE_LIMIT", "200"))
+
+# Share of the per-minute budget a priority must leave untouched, so reads and
+# refreshes run dry long before cancels and risk-reducing orders do
+PRIORITY_RESERVE = {RISK: 0.0, ORDER: 0.05, READ: 0.25, BACKGROUND: 0.5}
+
+# Longest a call queues for budget before it is shed with BudgetExhausted
+PRIORITY_MAX_WAIT_S = {RISK: 60.0, ORDER: 30.0, READ: 5.0, BACKGROUND: 0.0}
+
+# Calls already queued per priority beyond which new ones are shed at once
+PRIORITY_MAX_QUEUE = {RISK: None, ORDER: None, READ: 32, BACKGROUND: 8}
+
+# Trading API calls and their own priority. Market data (bars, latest trades)
+# has a separate limit on another host and isn't scheduled.
+SCHEDULED_CALLS = {
+    'cancel_order': RISK,
+    'cancel_all_orders': RISK,
+    'close_position': RISK,
+    'close_all_positions': RISK,
+    'submit_order': ORDER,
+    'replace_order': ORDER,
+    'get_account': READ,
+    'list_positions': READ,
+    'list_orders': READ,
+    'get_order': READ,
+    'get_portfolio_history': BACKGROUND,
+    'get_activities': BACKGROUND,
+}
+
+_priority = contextvars.ContextVar('broker_priority', default=None)
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+class BudgetExhausted(Exception):
+    """Raised instead of calling the broker when a call's priority has no budget left in time."""
+
+
+@contextmanager
+def priority(level: int):
+    """Run the broker calls inside at ``level`` or more urgent, e.g. ``with priority(RISK):`` when liquidating."""
+    token = _priority.set(level if _priority.get() is None else min(level, _priority.get()))
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class RequestScheduler:
+    """Admits broker calls in priority order against one account's per-minute budget.
+
+    The budget is a token bucket refilled at ``limit`` per minute and
+    corrected from the broker's X-RateLimit headers. Each priority may only
+    spend down to its PRIORITY_RESERVE share; waiting calls are served most
+    urgent first, and a call that can't be admitted within its priority's
+    wait is shed rather than left to eat into what orders need.
+    """
+
+    def __init__(self, account: str, limit: int = BROKER_RATE_LIMIT):
+        self.account = account
+        self.limit = limit
+        self.tokens = float(limit)
+        self._updated = time.monotonic()
+        # Wall-clock time before which the broker said the budget is spent
+        self._blocked_until = 0.0
+        self._waiting = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self, now: float):
+        if time.time() >= self._blocked_until:
+            self.tokens = min(self.limit, self.tokens + (now - self._updated) * self.limit / 60.0)
+        self._updated = now
+
+    def _floor(self, level: int) -> float:
+        return 1 + PRIORITY_RESERVE[level] * self.limit
+
+    def _wait_hint(self, level: int) -> float:
+        blocked = self._blocked_until - time.time()
+        if blocked > 0:
+            return blocked
+        return max(0.001, (self._floor(level) - self.tokens) * 60.0 / self.limit)
+
+    def _take(self):
+        self.tokens -= 1
+        BROKER_BUDGET.set(self.tokens, account=self.account)
+
+    def _shed(self, level: int):
+        SCHEDULER_SHED.inc(account=self.account, priority=PRIORITY_NAMES[level])
+        raise BudgetExhausted(f"{self.account}: no broker budget left for {PRIORITY_NAMES[level]} calls")
+
+    def acquire(self, level: int = READ, max_wait: Optional[float] = None) -> float:
+        """Block until a call at ``level`` may go out; returns seconds waited or raises BudgetExhausted."""
+        max_wait = PRIORITY_MAX_WAIT_S[level] if max_wait is None else max_wait
+        started = time.monotonic()
+        with self._cond:
+            self._refill(started)
+            ahead = self._waiting and self._waiting[0][0] <= level
+            if not ahead and self.tokens >= self._floor(level):
+                self._take()
+                SCHEDULER_WAIT.observe(0.0, account=self.account, priority=PRIORITY_NAMES[level])
+                return 0.0
+            queued = sum(1 for entry in self._waiting if entry[0] == level)
+            limit = PRIORITY_MAX_QUEUE[level]
+            if max_wait <= 0 or (limit is not None and queued >= limit):
+                self._shed(level)
+            entry = (level, next(self._seq))
+            heapq.heappush(self._waiting, entry)
+            deadline = started + max_wait
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._waiting[0] == entry and self.tokens >= self._floor(level):
+                        heapq.heappop(self._waiting)
+                        self._take()
+                        waited = now - started
+                        SCHEDULER_WAIT.observe(waited, account=self.account, priority=PRIORITY_NAMES[level])
+                        return waited
+                    if now >= deadline:
+                        self._waiting.remove(entry)
+                        heapq.heapify(self._waiting)
+                        self._shed(level)
+                    self._cond.wait(min(deadline - now, self._wait_hint(level)))
+            finally:
+                # Whoever is now at the head may be admissible
+                self._cond.notify_all()
+
+    def observe(self, response):
+        """Correct the estimate from a trading API response's rate-limit headers."""
+        headers = response.headers
+        remaining = headers.get('X-RateLimit-Remaining')
+        if remaining is None and response.status_code != 429:
+            return
+        with self._cond:
+            self._refill(time.monotonic())
+            remaining = 0 if response.status_code == 429 else int(remaining)
+            limit = int(headers.get('X-RateLimit-Limit') or self.limit)
+            if limit != self.limit:
+                # The local estimate was made against the wrong limit; the broker's count replaces it
+                self.limit = limit
+                self.tokens = float(remaining)
+            else:
+                self.tokens = min(self.tokens, float(remaining))
+            if remaining == 0:
+                reset = headers.get('X-RateLimit-Reset')
+                self._blocked_until = float(reset) if reset else time.time() + 60.0 / self.limit
+            BROKER_BUDGET.set(self.tokens, account=self.account)
+            self._cond.notify_all()
+
+
+def scheduler_for(account: str) -> RequestScheduler:
+    """The process-wide scheduler of ``account``; every client of one account shares its budget."""
+    with _schedulers_lock:
+        if account not in _schedulers:
+            _schedulers[account] = RequestScheduler(account)
+        return _schedulers[account]
+
+
+def _scheduled(scheduler, call, method):
+    own = SCHEDULED_CALLS[call]
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        context = _priority.get()
+        waited = scheduler.acquire(own if context is None else min(own, context))
+        if waited:
+            active = current_span()
+            if active is not None:
+                active.set(**{'scheduler.wait_ms': round(waited * 1000, 1)})
+        return method(*args, **kwargs)
+    return wrapper
+
+
+def schedule_api(api, account: str = 'default'):
+    """Route an Alpaca REST client's trading calls through ``account``'s scheduler, in place.
+
+    Apply it outside ``instrument_api`` so broker latency excludes time
+    spent queued. Returns the same client.
+    """
+    scheduler = scheduler_for(account)
+    for call in SCHEDULED_CALLS:
+        method = getattr(api, call, None)
+        if method is not None:
+            setattr(api, call, _scheduled(scheduler, call, method))
+
+    # The session also carries market data requests, which have their own limit
+    host = urlparse(str(getattr(api, '_base_url', ''))).netloc
+
+    def observe_budget(response, *args, **kwargs):
+        if not host or urlparse(response.url).netloc == host:
+            scheduler.observe(response)
+
+    session = getattr(api, '_session', None)
+    if session is not None:
+        session.hooks['response'].append(observe_budget)
+    return api
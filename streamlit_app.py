@@ -8,6 +8,15 @@ import pytz
 import pandas as pd
 import hmac
 import hashlib
+import threading
+
+from bar_cache import BarCache
+from benchmarks import add_benchmark_traces, benchmark_overlays
+from models import PositionBook
+from order_sync import SYNC_OVERLAP_S, OrderStore
+from pnl import RealizedPnL
+from profiling import SamplingProfiler, profile_requested, profile_tasks, start_continuous_profiling
+from replay import tape_api
 
 # Security functions
 def check_password():
@@ -63,6 +72,18 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def get_order_store():
+    return OrderStore()
+
+@st.cache_resource
+def get_pnl_engine():
+    return RealizedPnL()
+
+@st.cache_resource
+def get_bar_cache(_api):
+    return BarCache(_api)
+
 # Main app logic
 def main():
     # Check password
@@ -78,11 +99,12 @@ def main():
         api_secret = st.secrets["APCA_API_SECRET_KEY"]
         base_url = st.secrets["APCA_API_BASE_URL"]
 
-        api = tradeapi.REST(
+        # Same credentials as basic_dashboard.py, so their tapes share the default account
+        api = tape_api(tradeapi.REST(
             key_id=api_key,
             secret_key=api_secret,
             base_url=base_url
-        )
+        ))
         
         # Get account info
         account = api.get_account()
@@ -118,46 +140,116 @@ def main():
         # Positions Section
         st.markdown('<div class="metric-card">', unsafe_allow_html=True)
         st.subheader("Current Positions")
-        positions = api.list_positions()
+        positions = PositionBook.from_entities(api.list_positions())
         
         if positions:
-            position_data = []
-            for position in positions:
-                position_data.append({
-                    "Symbol": position.symbol,
-                    "Quantity": float(position.qty),
-                    "Market Value": f"${float(position.market_value):,.2f}",
-                    "Avg Entry": f"${float(position.avg_entry_price):,.2f}",
-                    "Current Price": f"${float(position.current_price):,.2f}",
-                    "Unrealized P&L": f"${float(position.unrealized_pl):,.2f}",
-                    "Unrealized P&L %": f"{float(position.unrealized_plpc) * 100:.2f}%"
-                })
+            # Keep numbers numeric so columns sort correctly; formatting is display-only
+            position_data = pd.DataFrame({
+                "Symbol": [p.symbol for p in positions],
+                "Quantity": positions.qty,
+                "Market Value": positions.market_value,
+                "Avg Entry": [p.avg_entry_price for p in positions],
+                "Current Price": [p.current_price for p in positions],
+                "Unrealized P&L": positions.unrealized_pl,
+                "Unrealized P&L %": [(p.unrealized_plpc or 0.0) * 100 for p in positions],
+            })
             
-            st.dataframe(pd.DataFrame(position_data), use_container_width=True)
+            st.dataframe(
+                position_data,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "Market Value": st.column_config.NumberColumn(format="$%.2f"),
+                    "Avg Entry": st.column_config.NumberColumn(format="$%.2f"),
+                    "Current Price": st.column_config.NumberColumn(format="$%.2f"),
+                    "Unrealized P&L": st.column_config.NumberColumn(format="$%.2f"),
+                    "Unrealized P&L %": st.column_config.NumberColumn(format="%.2f%%"),
+                }
+            )
         else:
             st.info("No open positions")
         st.markdown('</div>', unsafe_allow_html=True)
 
         # Orders Section
         st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-        st.subheader("Recent Orders")
-        orders = api.list_orders(status='all', limit=5)
+        st.subheader("Order History")
+        # Full history lives in a local store, kept current by a throttled background delta sync
+        store = get_order_store()
+        if store.sync_in_background(api):
+            st.caption("Syncing order history in the background; refresh to see newer orders.")
+        
+        filter_col1, filter_col2 = st.columns(2)
+        with filter_col1:
+            symbol = st.text_input("Symbol", key="order_symbol").strip()
+        with filter_col2:
+            status = st.selectbox("Status", ["all", "new", "partially_filled", "filled", "canceled", "expired", "rejected"])
+        orders = store.query_orders(symbol=symbol or None, status=None if status == "all" else status, limit=500)
         
         if orders:
-            order_data = []
-            for order in orders:
-                order_data.append({
-                    "Symbol": order.symbol,
-                    "Side": order.side,
-                    "Type": order.type,
-                    "Qty": float(order.qty),
-                    "Status": order.status,
-                    "Submitted At": order.submitted_at.strftime('%Y-%m-%d %H:%M:%S')
-                })
+            order_data = pd.DataFrame(orders)
+            order_data = pd.DataFrame({
+                "Symbol": order_data["symbol"],
+                "Side": order_data["side"],
+                "Type": order_data["type"],
+                "Qty": order_data["qty"],
+                "Filled": order_data["filled_qty"],
+                "Avg Fill": order_data["filled_avg_price"],
+                "Status": order_data["status"],
+                "Submitted At": pd.to_datetime(order_data["submitted_at"], unit="s", utc=True),
+            })
             
-            st.dataframe(pd.DataFrame(order_data), use_container_width=True)
+            st.dataframe(
+                order_data,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "Avg Fill": st.column_config.NumberColumn(format="$%.2f"),
+                    "Submitted At": st.column_config.DatetimeColumn(format="YYYY-MM-DD HH:mm:ss"),
+                }
+            )
         else:
-            st.info("No recent orders")
+            st.info("No matching orders")
+        st.markdown('</div>', unsafe_allow_html=True)
+
+        # Realized P&L Section
+        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
+        st.subheader("Realized P&L")
+        # Re-read the sync's overlap window: a fill stored late can carry an earlier time than
+        # the newest one processed. The engine drops ids it has seen and replays on late fills.
+        engine = get_pnl_engine()
+        since = None if engine.last_time is None else engine.last_time - SYNC_OVERLAP_S
+        engine.update(store.query_activities('FILL', since=since))
+        
+        if len(engine.realized):
+            by_symbol = engine.by_symbol()
+            pnl_col1, pnl_col2 = st.columns(2)
+            with pnl_col1:
+                st.metric("Realized P&L (FIFO)", f"${by_symbol['fifo_pnl'].sum():,.2f}")
+            with pnl_col2:
+                st.metric("Realized P&L (Average Cost)", f"${by_symbol['avg_cost_pnl'].sum():,.2f}")
+            
+            by_day = engine.by_day()
+            st.bar_chart(by_day, x="date", y="fifo_pnl")
+            st.dataframe(
+                by_symbol.rename(columns={
+                    "symbol": "Symbol",
+                    "fifo_pnl": "FIFO P&L",
+                    "avg_cost_pnl": "Avg Cost P&L",
+                    "closed_qty": "Closed Qty",
+                    "avg_holding_days": "Avg Holding (days)",
+                    "turnover": "Turnover",
+                }),
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "FIFO P&L": st.column_config.NumberColumn(format="$%.2f"),
+                    "Avg Cost P&L": st.column_config.NumberColumn(format="$%.2f"),
+                    "Avg Holding (days)": st.column_config.NumberColumn(format="%.1f"),
+                    "Turnover": st.column_config.NumberColumn(format="$%.0f"),
+                }
+            )
+        else:
+            st.info("No closed trades yet")
         st.markdown('</div>', unsafe_allow_html=True)
 
     except Exception as e:
@@ -206,6 +298,13 @@ def get_performance_chart(api):
             line=dict(color='#00C805', width=2)
         ))
         
+        # Benchmarks start at the same equity; a failed bar fetch only drops the overlay
+        try:
+            overlays = benchmark_overlays(get_bar_cache(api), activities.timestamp, activities.equity)
+            add_benchmark_traces(fig, df['timestamp'], overlays)
+        except Exception as e:
+            st.warning(f"Benchmarks unavailable: {str(e)}")
+        
         fig.update_layout(
             title='Portfolio Performance (30 Days)',
             xaxis_title='Date',
@@ -220,5 +319,21 @@ def get_performance_chart(api):
         st.error(f"Error generating performance chart: {str(e)}")
         return None
 
+def profiled_main():
+    """Run ``main``, under the sampling profiler when ``?profile=<PROFILE_TOKEN>`` is in the URL."""
+    start_continuous_profiling()
+    if not profile_requested(st.query_params.get("profile")):
+        main()
+        return
+    fmt = st.query_params.get("profile_format", "speedscope")
+    # The script thread and anything it hands off through in_current_context, as the Flask apps profile a request
+    with SamplingProfiler(name="streamlit_main", threads={threading.get_ident()}) as profiler, profile_tasks(profiler):
+        main()
+    body, mimetype, extension = profiler.export(fmt)
+    path = profiler.save(fmt)
+    st.download_button(f"Download profile ({profiler.duration:.2f}s)", body,
+                       file_name=f"streamlit_main.{extension}", mime=mimetype)
+    st.caption(f"Profile saved to {path}")
+
 if __name__ == "__main__":
-    main()
+    profiled_main()
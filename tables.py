@@ -0,0 +1,301 @@
+from datetime import datetime
+
+import numpy as np
+
+from web import render_placeholder
+
+# Books larger than this render as a virtualized table instead of cards
+CARD_LIMIT = 50
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# (field, label, client-side format); numbers go over the wire unformatted
+POSITION_COLUMNS = (
+    ('symbol', 'Symbol', 'text'),
+    ('side', 'Side', 'text'),
+    ('qty', 'Quantity', 'number'),
+    ('market_value', 'Market Value', 'currency'),
+    ('avg_entry_price', 'Avg Entry', 'currency'),
+    ('current_price', 'Current Price', 'currency'),
+    ('unrealized_pl', 'Unrealized P&L', 'currency'),
+    ('unrealized_plpc', 'Unrealized P&L %', 'percent'),
+)
+
+ORDER_COLUMNS = (
+    ('symbol', 'Symbol', 'text'),
+    ('side', 'Side', 'text'),
+    ('type', 'Type', 'text'),
+    ('qty', 'Qty', 'number'),
+    ('filled_qty', 'Filled', 'number'),
+    ('limit_price', 'Limit', 'currency'),
+    ('status', 'Status', 'text'),
+    ('submitted_at', 'Submitted At', 'datetime'),
+    ('id', 'ID', 'text'),
+)
+
+# PositionBook keeps these as float64 columns, so sorting on them is an argsort
+_BOOK_COLUMNS = ('qty', 'market_value', 'cost_basis', 'unrealized_pl')
+
+
+def parse_table_args(args, columns):
+    """Read sort/filter/page parameters from a request's query string."""
+    fields = {field for field, _, _ in columns}
+    sort = args.get('sort')
+    return {
+        'sort': sort if sort in fields else None,
+        'descending': args.get('order', 'asc') == 'desc',
+        'search': (args.get('q') or '').strip().upper(),
+        'filters': {field: args[field] for field in fields if field in args},
+        'offset': max(0, args.get('offset', 0, type=int)),
+        'limit': min(MAX_PAGE_SIZE, max(1, args.get('limit', DEFAULT_PAGE_SIZE, type=int))),
+    }
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def _sorted_indices(records, book, sort, descending):
+    if sort is None:
+        return list(range(len(records)))
+    if book is not None and sort in _BOOK_COLUMNS:
+        # argsort puts NaN last; negating for descending keeps it there
+        values = getattr(book, sort)
+        return np.argsort(-values if descending else values, kind='stable').tolist()
+    # Missing values always sort last, whichever the direction
+    present = [i for i, r in enumerate(records) if getattr(r, sort) is not None]
+    missing = [i for i, r in enumerate(records) if getattr(r, sort) is None]
+    present.sort(key=lambda i: getattr(records[i], sort), reverse=descending)
+    return present + missing
+
+
+def _filter_matcher(wanted: str):
+    """Predicate comparing a record value to a query string value by the record value's type."""
+    try:
+        number = float(wanted)
+    except ValueError:
+        number = None
+    try:
+        moment = datetime.fromisoformat(wanted.replace('Z', '+00:00'))
+    except ValueError:
+        moment = None
+
+    def matches(value):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return number is not None and value == number
+        if isinstance(value, datetime):
+            return moment is not None and value == moment
+        return str(value) == wanted
+    return matches
+
+
+def query_records(records, columns, sort=None, descending=False, search='', filters=None,
+                  offset=0, limit=DEFAULT_PAGE_SIZE, book=None):
+    """Sort, filter and page records for the JSON table endpoints.
+
+    ``search`` is a symbol prefix, ``filters`` are exact field matches
+    (``qty=10`` matches 10.0; timestamps compare as datetimes). Pass
+    the PositionBook as ``book`` to sort numeric position columns vectorized.
+    Rows come back as arrays in column order to keep pages compact.
+    """
+    records = tuple(records)
+    indices = _sorted_indices(records, book, sort, descending)
+    if search or filters:
+        matchers = [(field, _filter_matcher(value)) for field, value in (filters or {}).items()]
+        indices = [
+            i for i in indices
+            if records[i].symbol.startswith(search)
+            and all(matches(getattr(records[i], field)) for field, matches in matchers)
+        ]
+    fields = [field for field, _, _ in columns]
+    page = indices[offset:offset + limit]
+    return {
+        'columns': [{'field': field, 'label': label, 'format': fmt} for field, label, fmt in columns],
+        'total': len(indices),
+        'offset': offset,
+        'limit': limit,
+        'rows': [[_json_value(getattr(records[i], field)) for field in fields] for i in page],
+    }
+
+
+VIRTUAL_TABLE_CSS = """
+                .vtable {
+                    border: 1px solid #e5e5e5;
+                    border-radius: 8px;
+                    font-size: 14px;
+                }
+                .vtable-toolbar {
+                    display: flex;
+                    justify-content: space-between;
+                    padding: 10px;
+                    border-bottom: 1px solid #e5e5e5;
+                }
+                .vtable-head, .vtable-row {
+                    display: grid;
+                    align-items: center;
+                    padding: 0 10px;
+                }
+                .vtable-head {
+                    height: 36px;
+                    font-weight: bold;
+                    border-bottom: 1px solid #e5e5e5;
+                    cursor: pointer;
+                    user-select: none;
+                }
+                .vtable-body {
+                    position: relative;
+                    height: 480px;
+                    overflow-y: auto;
+                }
+                .vtable-row {
+                    position: absolute;
+                    left: 0;
+                    right: 0;
+                    height: 32px;
+                    border-bottom: 1px solid #f5f5f7;
+                }
+                .vtable .num {
+                    text-align: right;
+                }
+"""
+
+# Renders only the rows in view and fetches pages from the JSON endpoint as
+# the user scrolls; sorting and filtering happen server-side. loadVirtualTables()
+# skips tables already set up, so it can run again after a deferred panel swap.
+VIRTUAL_TABLE_SCRIPT = """
+            <script>
+                function VirtualTable(el, endpoint, cancel) {
+                    const ROW = 32, PAGE = 200;
+                    const money = new Intl.NumberFormat(undefined, {style: 'currency', currency: 'USD'});
+                    const number = new Intl.NumberFormat(undefined, {maximumFractionDigits: 9});
+                    const formats = {
+                        currency: v => money.format(v),
+                        number: v => number.format(v),
+                        percent: v => (v * 100).toFixed(2) + '%',
+                        datetime: v => new Date(v).toLocaleString(),
+                        text: v => String(v)
+                    };
+                    let columns = [], idColumn = -1, total = 0, pages = {}, sort = null, order = 'asc', search = '', generation = 0;
+                    el.innerHTML = '<div class="vtable-toolbar"><input type="search" placeholder="Filter by symbol">' +
+                        '<span class="vtable-count"></span></div><div class="vtable-head"></div>' +
+                        '<div class="vtable-body"><div class="vtable-spacer"></div></div>';
+                    const head = el.querySelector('.vtable-head'), body = el.querySelector('.vtable-body');
+                    const spacer = el.querySelector('.vtable-spacer'), count = el.querySelector('.vtable-count');
+
+                    function load(page) {
+                        if (pages[page]) return;
+                        pages[page] = 'loading';
+                        const current = generation;
+                        const params = new URLSearchParams({offset: page * PAGE, limit: PAGE, q: search, order: order});
+                        if (sort) params.set('sort', sort);
+                        fetch(endpoint + '?' + params).then(r => {
+                            if (!r.ok) throw new Error(r.status);
+                            return r.json();
+                        }).then(data => {
+                            // Drop pages requested before the sort or filter changed
+                            if (current !== generation) return;
+                            if (!columns.length) renderHead(data.columns);
+                            total = data.total;
+                            pages[page] = data.rows;
+                            render();
+                        }).catch(() => {
+                            // Forget the page so the next scroll or refresh asks again
+                            if (current !== generation) return;
+                            delete pages[page];
+                            count.textContent = 'Failed to load rows; scroll to retry';
+                        });
+                    }
+                    function cell(text, format) {
+                        const div = document.createElement('div');
+                        div.className = format === 'text' ? '' : 'num';
+                        div.textContent = text;
+                        return div;
+                    }
+                    function cancelCell(id) {
+                        // Same form as the order cards' Cancel button
+                        const form = document.createElement('form');
+                        form.method = 'post';
+                        form.action = cancel + '/' + encodeURIComponent(id);
+                        const button = document.createElement('button');
+                        button.type = 'submit';
+                        button.className = 'cancel-button';
+                        button.textContent = 'Cancel';
+                        form.appendChild(button);
+                        return form;
+                    }
+                    function renderHead(cols) {
+                        columns = cols;
+                        idColumn = cols.findIndex(c => c.field === 'id');
+                        const grid = 'repeat(' + (cols.length + (cancel ? 1 : 0)) + ', minmax(80px, 1fr))';
+                        head.style.gridTemplateColumns = grid;
+                        el.dataset.grid = grid;
+                        head.replaceChildren(...cols.map(c => {
+                            const h = cell(c.label, c.format);
+                            h.onclick = () => {
+                                order = (sort === c.field && order === 'asc') ? 'desc' : 'asc';
+                                sort = c.field;
+                                reset();
+                            };
+                            return h;
+                        }));
+                        if (cancel) head.appendChild(cell('', 'text'));
+                    }
+                    function render() {
+                        count.textContent = total + ' rows';
+                        spacer.style.height = (total * ROW) + 'px';
+                        const first = Math.floor(body.scrollTop / ROW);
+                        const last = Math.min(total, first + Math.ceil(body.clientHeight / ROW) + 5);
+                        const fragment = document.createDocumentFragment();
+                        for (let i = first; i < last; i++) {
+                            const rows = pages[Math.floor(i / PAGE)];
+                            if (!Array.isArray(rows)) { load(Math.floor(i / PAGE)); continue; }
+                            const row = rows[i % PAGE];
+                            if (!row) continue;
+                            const line = document.createElement('div');
+                            line.className = 'vtable-row';
+                            line.style.top = (i * ROW) + 'px';
+                            line.style.gridTemplateColumns = el.dataset.grid;
+                            row.forEach((v, j) => line.appendChild(
+                                cell(v === null ? '-' : formats[columns[j].format](v), columns[j].format)));
+                            if (cancel && idColumn >= 0) line.appendChild(cancelCell(row[idColumn]));
+                            fragment.appendChild(line);
+                        }
+                        body.querySelectorAll('.vtable-row').forEach(r => r.remove());
+                        body.appendChild(fragment);
+                    }
+                    function reset() {
+                        generation++;
+                        pages = {};
+                        body.scrollTop = 0;
+                        load(0);
+                    }
+                    body.addEventListener('scroll', render);
+                    el.querySelector('input').addEventListener('input', e => {
+                        search = e.target.value.trim().toUpperCase();
+                        reset();
+                    });
+                    load(0);
+                }
+                function loadVirtualTables() {
+                    document.querySelectorAll('[data-vtable]:not([data-vtable-loaded])').forEach(function(el) {
+                        el.dataset.vtableLoaded = '1';
+                        VirtualTable(el, el.dataset.vtable, el.dataset.cancel);
+                    });
+                }
+                loadVirtualTables();
+            </script>
+"""
+
+
+def render_virtual_table(endpoint, cancel_prefix: str = None):
+    """Placeholder element picked up by ``VIRTUAL_TABLE_SCRIPT``.
+
+    With ``cancel_prefix`` (the cancel route without the order ID) each row
+    gets a Cancel button like the order cards.
+    """
+    return render_placeholder('vtable', 'vtable', endpoint, cancel=cancel_prefix or None)
@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+from correlation import CorrelationCache
+from models import PositionBook, PositionRecord
+
+
+class SharedBarCache:
+    """Bars some other panel already fetched: ``ensure`` never has anything to do."""
+
+    def __init__(self, closes):
+        self.frame = closes
+
+    def ensure(self, symbols, start, end):
+        return 0
+
+    def closes(self, symbols, start, end):
+        return self.frame
+
+
+def book(*symbols):
+    return PositionBook(PositionRecord(symbol, 'long', 10.0, 1_000.0, 100.0, 100.0, 1_000.0, 0.0, 0.0)
+                        for symbol in symbols)
+
+
+def test_report_picks_up_bars_another_panel_refreshed():
+    days = pd.date_range(end=pd.Timestamp.now(tz='UTC').normalize(), periods=5, freq='D')
+    bars = SharedBarCache(pd.DataFrame({'AAPL': [100, 101, 102, 103, 104.0],
+                                        'MSFT': [200, 202, 204, 206, 208.0]}, index=days))
+    cache = CorrelationCache(bars)
+    first = cache.report('acct', book('AAPL', 'MSFT'), window=10)
+    assert first['matrix'][0][1] == pytest.approx(1.0, abs=1e-3)
+
+    # Today's bar is revised and a new one lands, both without this report fetching anything
+    bars.frame = pd.DataFrame({'AAPL': [100, 101, 102, 103, 104, 90.0],
+                               'MSFT': [200, 202, 204, 206, 210, 212.0]},
+                              index=days.append(pd.DatetimeIndex([days[-1] + pd.Timedelta(days=1)])))
+    second = cache.report('acct', book('AAPL', 'MSFT'), window=10)
+    assert second['as_of'] > first['as_of']
+    assert second['matrix'][0][1] < 0.5
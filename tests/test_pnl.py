@@ -0,0 +1,85 @@
+import pandas as pd
+import pytest
+
+from pnl import RealizedPnL, match_fills
+
+
+def fills(*rows):
+    """Fills from ``(symbol, side, qty, price, time)`` tuples, numbered in order."""
+    return pd.DataFrame([{'id': str(i), 'symbol': symbol, 'side': side, 'qty': qty, 'price': price, 'time': time}
+                         for i, (symbol, side, qty, price, time) in enumerate(rows)])
+
+
+def test_fifo_and_average_cost_differ_on_a_partial_close():
+    realized, lots, _ = match_fills(fills(
+        ('AAPL', 'buy', 10, 100.0, 1.0),
+        ('AAPL', 'buy', 10, 110.0, 2.0),
+        ('AAPL', 'sell', 15, 120.0, 3.0),
+    ))
+    close = realized.iloc[0]
+    # FIFO sells the 10 @ 100 and 5 of the 10 @ 110; average cost sells 15 @ 105
+    assert close['fifo_pnl'] == pytest.approx(15 * 120 - (10 * 100 + 5 * 110))
+    assert close['avg_cost_pnl'] == pytest.approx(15 * (120 - 105))
+    assert close['holding_seconds'] == pytest.approx(3.0 - (10 * 1.0 + 5 * 2.0) / 15)
+    assert lots[['qty', 'price', 'avg_cost']].values.tolist() == [[5, 110.0, 105.0]]
+
+
+def test_short_sales_realize_on_the_cover():
+    realized, lots, _ = match_fills(fills(
+        ('TSLA', 'sell_short', 10, 50.0, 1.0),
+        ('TSLA', 'buy', 10, 40.0, 2.0),
+    ))
+    assert realized['fifo_pnl'].tolist() == pytest.approx([100.0])
+    assert realized['avg_cost_pnl'].tolist() == pytest.approx([100.0])
+    assert lots.empty
+
+
+def test_fill_through_zero_closes_then_opens_the_other_side():
+    realized, lots, _ = match_fills(fills(
+        ('MSFT', 'buy', 10, 100.0, 1.0),
+        ('MSFT', 'sell', 15, 90.0, 2.0),
+    ))
+    assert realized[['qty', 'fifo_pnl']].values.tolist() == [[10, pytest.approx(-100.0)]]
+    assert lots[['qty', 'price']].values.tolist() == [[-5, 90.0]]
+
+
+def test_symbols_are_matched_independently():
+    realized, _, traded = match_fills(fills(
+        ('AAPL', 'buy', 1, 100.0, 1.0),
+        ('MSFT', 'buy', 1, 200.0, 2.0),
+        ('AAPL', 'sell', 1, 110.0, 3.0),
+        ('MSFT', 'sell', 1, 190.0, 4.0),
+    ))
+    assert dict(zip(realized['symbol'], realized['fifo_pnl'])) == pytest.approx({'AAPL': 10.0, 'MSFT': -10.0})
+    assert traded.groupby('symbol')['notional'].sum().to_dict() == pytest.approx({'AAPL': 210.0, 'MSFT': 390.0})
+
+
+def test_incremental_updates_match_one_pass():
+    rows = fills(
+        ('AAPL', 'buy', 10, 100.0, 1.0),
+        ('AAPL', 'buy', 5, 104.0, 2.0),
+        ('AAPL', 'sell', 12, 110.0, 3.0),
+        ('AAPL', 'sell', 6, 95.0, 4.0),
+        ('AAPL', 'buy', 4, 90.0, 5.0),
+    )
+    whole, whole_lots, _ = match_fills(rows)
+    pnl = RealizedPnL()
+    assert pnl.update(rows.iloc[:2]) == 2
+    assert pnl.update(rows.iloc[2:4]) == 2
+    assert pnl.update(rows) == 1
+    pd.testing.assert_frame_equal(pnl.realized.reset_index(drop=True).astype(whole.dtypes), whole)
+    pd.testing.assert_frame_equal(pnl.open_lots.reset_index(drop=True), whole_lots)
+
+
+def test_late_fill_replays_everything():
+    rows = fills(
+        ('AAPL', 'buy', 10, 100.0, 1.0),
+        ('AAPL', 'sell', 10, 110.0, 3.0),
+        ('AAPL', 'buy', 10, 90.0, 2.0),
+    )
+    pnl = RealizedPnL()
+    pnl.update(rows.iloc[[0, 1]])
+    pnl.update(rows.iloc[[2]])
+    # The late buy sits ahead of the sell, so FIFO still sells the 10 @ 100
+    assert pnl.realized['fifo_pnl'].tolist() == pytest.approx([100.0])
+    assert pnl.open_lots[['qty', 'price']].values.tolist() == [[10, 90.0]]
@@ -0,0 +1,41 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask
+
+from profiling import install_profiling
+from tracing import in_current_context
+
+
+def spin(seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+
+def test_request_profile_includes_its_pool_tasks_only(monkeypatch):
+    monkeypatch.setenv('PROFILE_TOKEN', 'secret')
+    app = install_profiling(Flask(__name__))
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="panel")
+
+    @app.route('/')
+    def index():
+        executor.submit(in_current_context(spin), 0.2).result()
+        return 'ok'
+
+    # Busy in app code the whole time, but not on this request's behalf
+    stop = threading.Event()
+    bystander = threading.Thread(target=lambda: [spin(0.01) for _ in iter(stop.is_set, True)], name="bystander")
+    bystander.start()
+    try:
+        response = app.test_client().get('/?profile=secret&profile_return=1')
+    finally:
+        stop.set()
+        bystander.join()
+        executor.shutdown()
+
+    lanes = {profile['name'] for profile in json.loads(response.get_data())['profiles']}
+    assert any(lane.startswith('panel') for lane in lanes)
+    assert 'bystander' not in lanes
@@ -0,0 +1,111 @@
+import html
+import threading
+import time
+
+import alpaca_trade_api as tradeapi
+import pytest
+from werkzeug.serving import make_server
+
+from broker_sim import SimBroker, SimConfig, create_app
+from models import AccountRecord, PositionBook, PositionRecord
+from rebalance import RebalanceRequest, execute_plan, fetch_plan, parse_targets, plan_rebalance, render_rebalance_page
+
+
+def position(symbol, qty, price):
+    return PositionRecord(symbol=symbol, side='long' if qty > 0 else 'short', qty=qty, market_value=qty * price,
+                          avg_entry_price=price, current_price=price, cost_basis=qty * price,
+                          unrealized_pl=0.0, unrealized_plpc=0.0)
+
+
+def account(equity, buying_power):
+    return AccountRecord(id='test', status='ACTIVE', portfolio_value=equity, equity=equity, cash=buying_power,
+                         buying_power=buying_power)
+
+
+def orders_by_symbol(plan):
+    return {(o.symbol, o.side): o for o in plan.orders}
+
+
+def test_sells_go_out_before_buys():
+    book = PositionBook([position('AAPL', 50, 100.0), position('MSFT', 10, 100.0)])
+    plan = plan_rebalance(book, account(10_000, 1_000), {'AAPL': 0.2, 'MSFT': 0.5}, cash_buffer=0.0)
+    orders = orders_by_symbol(plan)
+    assert orders[('AAPL', 'sell')].qty == 30
+    assert orders[('MSFT', 'buy')].qty == 40
+    assert [o.side for o in plan.orders] == ['sell', 'buy']
+
+
+def test_unlisted_holdings_are_closed_exactly():
+    book = PositionBook([position('AAPL', 2.5, 100.0)])
+    plan = plan_rebalance(book, account(1_000, 1_000), {})
+    assert len(plan.orders) == 1
+    assert plan.orders[0].qty == 2.5
+    assert plan.orders[0].note == 'close position'
+
+
+def test_buys_are_scaled_to_buying_power_plus_proceeds():
+    book = PositionBook([position('AAPL', 10, 100.0)])
+    plan = plan_rebalance(book, account(10_000, 1_000), {'MSFT': 0.5}, prices={'MSFT': 100.0}, cash_buffer=0.0)
+    # $1,000 buying power plus the $1,000 AAPL sale funds 20 of the 50 MSFT shares
+    assert plan.buy_scale == pytest.approx(0.4)
+    assert orders_by_symbol(plan)[('MSFT', 'buy')].qty == 20
+
+
+def test_short_going_long_is_covered_then_bought():
+    book = PositionBook([position('TSLA', -5, 100.0)])
+    plan = plan_rebalance(book, account(10_000, 10_000), {'TSLA': 0.2}, cash_buffer=0.0)
+    cover, opening = plan.orders
+    assert (cover.side, cover.qty, cover.reduces_risk) == ('buy', 5, True)
+    assert (opening.side, opening.qty, opening.reduces_risk) == ('buy', 20, False)
+
+
+def test_new_long_after_cover_is_scaled_but_cover_is_not():
+    book = PositionBook([position('TSLA', -5, 100.0)])
+    plan = plan_rebalance(book, account(10_000, 1_500), {'TSLA': 0.2}, cash_buffer=0.0)
+    cover, opening = plan.orders
+    # The $500 cover comes out of buying power first, leaving $1,000 for the long
+    assert cover.qty == 5
+    assert opening.qty == 10
+    assert plan.buy_scale == pytest.approx(0.5)
+
+
+def test_orders_under_minimum_notional_are_skipped():
+    book = PositionBook([position('AAPL', 10, 100.0)])
+    plan = plan_rebalance(book, account(1_000, 0), {'AAPL': 0.9995}, min_notional=1)
+    assert not plan.orders
+    assert plan.skipped[0].qty == 0
+
+
+def test_targets_must_not_exceed_full_weight():
+    with pytest.raises(ValueError):
+        parse_targets("AAPL 60%\nMSFT 50%")
+
+
+def test_page_escapes_user_input():
+    text = '<script>alert(1)</script>'
+    page = render_rebalance_page("Rebalance", "/rebalance", RebalanceRequest(targets_text=text, error=text))
+    assert text not in page
+    assert html.escape(text) in page
+
+
+@pytest.fixture
+def sim_api():
+    """A REST client talking to a simulated broker on a local port."""
+    broker = SimBroker(config=SimConfig(rate_limit=None)).start()
+    server = make_server('localhost', 0, create_app(broker), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://localhost:{server.server_port}"
+    yield tradeapi.REST(key_id='test', secret_key='test', base_url=url)
+    server.shutdown()
+    broker.stop()
+
+
+def test_short_going_long_submits_both_orders(sim_api):
+    sim_api.submit_order(symbol='AAPL', qty=10, side='sell', type='market', time_in_force='day')
+    while not sim_api.list_positions():
+        time.sleep(0.05)
+    plan = fetch_plan(sim_api, {'AAPL': 0.5})
+    assert [o.note for o in plan.orders] == ['cover short', 'new long after cover']
+    outcomes = execute_plan(sim_api, plan, fill_timeout=5)
+    assert [(o.status, o.error) for o in outcomes] == [('filled', None), ('filled', None)]
+    assert float(sim_api.get_position('AAPL').qty) == plan.orders[1].qty
@@ -0,0 +1,52 @@
+import pytest
+
+from replay import Tape, TapeMiss, TapeWriter, read_tape
+
+
+def entry(t, path, params=None, body=None, account='paper'):
+    e = {'t': t, 'a': account, 'm': 'GET', 'p': path, 's': 200, 'b': body}
+    if params:
+        e['q'] = params
+    return e
+
+
+BARS = 'data:/v2/stocks/bars'
+
+
+def test_lookup_returns_latest_at_or_before_time():
+    tape = Tape([entry(1.0, 'trading:/v2/account', body={'equity': 1}),
+                 entry(2.0, 'trading:/v2/account', body={'equity': 2})])
+    assert tape.lookup('paper', 'GET', 'trading:/v2/account', None, 1.5)['b'] == {'equity': 1}
+    assert tape.lookup('paper', 'GET', 'trading:/v2/account', None, 5.0)['b'] == {'equity': 2}
+    # Before the tape starts, the first response stands in
+    assert tape.lookup('paper', 'GET', 'trading:/v2/account', None, 0.0)['b'] == {'equity': 1}
+
+
+def test_lookup_ignores_time_params_when_exact_request_is_missing():
+    tape = Tape([entry(1.0, BARS, {'symbols': 'AAPL', 'start': '2024-01-01', 'end': '2024-02-01'}, body='aapl')])
+    found = tape.lookup('paper', 'GET', BARS, {'symbols': 'AAPL', 'start': '2024-01-02', 'end': '2024-02-02'}, 1.0)
+    assert found['b'] == 'aapl'
+
+
+def test_lookup_never_crosses_symbols():
+    tape = Tape([entry(1.0, BARS, {'symbols': 'AAPL', 'start': '2024-01-01'}, body='aapl')])
+    with pytest.raises(TapeMiss):
+        tape.lookup('paper', 'GET', BARS, {'symbols': 'MSFT', 'start': '2024-01-01'}, 1.0)
+
+
+def test_lookup_keeps_accounts_apart():
+    tape = Tape([entry(1.0, 'trading:/v2/account', body={'equity': 1}, account='paper')])
+    with pytest.raises(TapeMiss):
+        tape.lookup('live', 'GET', 'trading:/v2/account', None, 1.0)
+
+
+def test_writer_leaves_out_repeated_bodies_and_reader_restores_them(tmp_path):
+    path = str(tmp_path / 'tape.gz')
+    writer = TapeWriter(path, flush_interval=0.01)
+    writer.write(entry(1.0, 'trading:/v2/orders', {'after': 'a'}, body=[1]))
+    writer.write(entry(2.0, 'trading:/v2/orders', {'after': 'b'}, body=[1]))
+    writer.write(entry(3.0, 'trading:/v2/orders', {'after': 'c'}, body=[2]))
+    writer.close()
+    assert [e['b'] for e in read_tape(path)] == [[1], [1], [2]]
+    # One remembered body per endpoint, not per distinct set of parameters
+    assert len(writer._last) == 1
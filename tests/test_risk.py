@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from models import PositionBook, PositionRecord
+from risk import historical_var, monte_carlo_var, risk_report
+
+
+class StaticBarCache:
+    def __init__(self, closes):
+        self.frame = closes
+
+    def ensure(self, symbols, start, end):
+        return 0
+
+    def closes(self, symbols, start, end):
+        return self.frame
+
+
+def book(qty=10.0, **values):
+    return PositionBook(PositionRecord(symbol, 'long', qty, value, 100.0, 100.0, value, 0.0, 0.0)
+                        for symbol, value in values.items())
+
+
+def test_no_return_history_gives_null_metrics():
+    empty = np.empty((0, 2))
+    for result in (historical_var(empty, np.array([1_000.0, 500.0]), ['AAPL', 'MSFT']),
+                   monte_carlo_var(empty, np.array([1_000.0, 500.0]), ['AAPL', 'MSFT'], scenarios=1_000)):
+        assert (result.var, result.es, result.scenarios) == (None, None, 0)
+
+    report = risk_report(book(AAPL=1_000.0), StaticBarCache(pd.DataFrame()), key='no-history')
+    assert report['historical']['var'] is None
+    assert report['monte_carlo']['es'] is None
+    assert report['missing'] == ['AAPL']
+    assert report['stress'][0]['pnl'] == pytest.approx(-50.0)
+
+
+def test_cached_report_follows_the_book():
+    days = pd.date_range('2024-01-01', periods=30, freq='D', tz='UTC')
+    prices = 100 * np.cumprod(1 + np.random.default_rng(0).normal(0, 0.01, (30, 2)), axis=0)
+    bars = StaticBarCache(pd.DataFrame(prices, index=days, columns=['AAPL', 'MSFT']))
+
+    first = risk_report(book(AAPL=1_000.0), bars, scenarios=1_000, key='fingerprint')
+    # Price drift alone keeps the report; a trade or a big move does not
+    assert risk_report(book(AAPL=1_000.01), bars, scenarios=1_000, key='fingerprint') is first
+    assert risk_report(book(qty=11.0, AAPL=1_000.01), bars, scenarios=1_000, key='fingerprint') is not first
+    assert risk_report(book(AAPL=1_000.0, MSFT=500.0), bars, scenarios=1_000, key='fingerprint') is not first
+    assert risk_report(book(AAPL=2_000.0), bars, scenarios=1_000, key='fingerprint') is not first
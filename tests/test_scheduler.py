@@ -0,0 +1,90 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import scheduler as scheduler_module
+from scheduler import BACKGROUND, ORDER, READ, RISK, BudgetExhausted, RequestScheduler
+
+
+def response(status_code=200, **headers):
+    return SimpleNamespace(status_code=status_code, headers=headers)
+
+
+def test_admits_at_once_while_budget_lasts():
+    scheduler = RequestScheduler('test', limit=60)
+    assert scheduler.acquire(READ) == 0.0
+    assert scheduler.tokens == pytest.approx(59, abs=0.1)
+
+
+def test_reads_leave_the_reserve_to_risk():
+    scheduler = RequestScheduler('test', limit=100)
+    scheduler.tokens = 20
+    with pytest.raises(BudgetExhausted):
+        scheduler.acquire(READ, max_wait=0)
+    assert scheduler.acquire(ORDER) == 0.0
+    assert scheduler.acquire(RISK) == 0.0
+
+
+def test_background_calls_are_shed_rather_than_queued():
+    scheduler = RequestScheduler('test', limit=100)
+    scheduler.tokens = 40
+    with pytest.raises(BudgetExhausted):
+        scheduler.acquire(BACKGROUND)
+
+
+def test_waits_for_the_bucket_to_refill():
+    # 6000 a minute refills a token every 10ms
+    scheduler = RequestScheduler('test', limit=6000)
+    scheduler.tokens = 0
+    waited = scheduler.acquire(RISK, max_wait=2)
+    assert 0 < waited < 1
+
+
+def test_sheds_after_max_wait():
+    scheduler = RequestScheduler('test', limit=60)
+    scheduler.tokens = 0
+    started = time.monotonic()
+    with pytest.raises(BudgetExhausted):
+        scheduler.acquire(RISK, max_wait=0.1)
+    assert time.monotonic() - started < 1
+    assert not scheduler._waiting
+
+
+def test_more_urgent_waiters_go_first(monkeypatch):
+    # Same floor for both, so only queue order decides who gets the next token
+    monkeypatch.setitem(scheduler_module.PRIORITY_RESERVE, ORDER, 0.0)
+    scheduler = RequestScheduler('test', limit=600)
+    scheduler.tokens = 0
+    admitted = []
+
+    def call(level):
+        scheduler.acquire(level, max_wait=5)
+        admitted.append(level)
+
+    order = threading.Thread(target=call, args=(ORDER,))
+    order.start()
+    time.sleep(0.02)
+    risk = threading.Thread(target=call, args=(RISK,))
+    risk.start()
+    order.join()
+    risk.join()
+    assert admitted == [RISK, ORDER]
+
+
+def test_broker_headers_correct_the_estimate():
+    scheduler = RequestScheduler('test', limit=200)
+    scheduler.observe(response(**{'X-RateLimit-Limit': '200', 'X-RateLimit-Remaining': '50'}))
+    assert scheduler.tokens == pytest.approx(50, abs=0.1)
+    # A different limit replaces the estimate outright, even upwards
+    scheduler.observe(response(**{'X-RateLimit-Limit': '1000', 'X-RateLimit-Remaining': '900'}))
+    assert (scheduler.limit, scheduler.tokens) == (1000, 900)
+
+
+def test_rate_limited_response_blocks_until_reset():
+    scheduler = RequestScheduler('test', limit=200)
+    scheduler.observe(response(429, **{'X-RateLimit-Reset': str(time.time() + 60)}))
+    assert scheduler.tokens == 0
+    with pytest.raises(BudgetExhausted):
+        scheduler.acquire(RISK, max_wait=0.05)
@@ -0,0 +1,379 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Optional
+
+from profiling import sampled_thread
+from web import flask_globals
+
+# Finished spans are exported as OTLP/JSON, one ExportTraceServiceRequest per line,
+# to TRACE_FILE and/or POSTed to TRACE_ENDPOINT (e.g. http://localhost:4318/v1/traces).
+# Both are read when the first span ends, after the apps have loaded .env; with
+# neither set spans are still created (for log correlation) but not exported.
+
+# Spans per export batch, and the longest a finished span waits to be written
+TRACE_BATCH_SIZE = 512
+TRACE_FLUSH_S = 1.0
+
+# Spans waiting for export; when the writer falls behind new spans are dropped, never awaited
+TRACE_QUEUE_SIZE = 10_000
+
+# OTLP SpanKind values
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('current_span', default=None)
+
+_exporter = None
+_exporter_lock = threading.Lock()
+_service_name = os.path.splitext(os.path.basename(sys.argv[0] or 'dashboard'))[0]
+
+
+def _new_id(size):
+    return os.urandom(size).hex()
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str = field(default_factory=lambda: _new_id(8))
+    parent_id: Optional[str] = None
+    kind: int = SPAN_KIND_INTERNAL
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: Optional[int] = None
+    attributes: dict = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def count(self, key: str, amount: int = 1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            _export(self)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> dict:
+        otlp = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns or time.time_ns()),
+            'attributes': [_attribute(k, v) for k, v in self.attributes.items()],
+            # STATUS_CODE_OK = 1, STATUS_CODE_ERROR = 2
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1},
+        }
+        if self.parent_id:
+            otlp['parentSpanId'] = self.parent_id
+        return otlp
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def current_ids():
+    """``(trace_id, span_id)`` of the active span, or ``(None, None)``."""
+    active = _current.get()
+    return (active.trace_id, active.span_id) if active else (None, None)
+
+
+def parse_traceparent(header):
+    """``(trace_id, parent_span_id)`` from a W3C ``traceparent`` header, or ``(None, None)``."""
+    parts = (header or '').split('-')
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16 and parts[1] != '0' * 32:
+        return parts[1], parts[2]
+    return None, None
+
+
+def start_span(name: str, kind: int = SPAN_KIND_INTERNAL, parent: Optional[Span] = None,
+               trace_id: str = None, parent_id: str = None, **attributes) -> Span:
+    """New span under ``parent`` (default: the active span), or the root of a new trace; not activated."""
+    parent = _current.get() if parent is None and trace_id is None else parent
+    if parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    attributes.setdefault('thread.name', threading.current_thread().name)
+    return Span(name, trace_id or _new_id(16), parent_id=parent_id, kind=kind, attributes=attributes)
+
+
+@contextmanager
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes):
+    """Run the block as a child span of the active one; also usable as a function decorator."""
+    active = start_span(name, kind, **attributes)
+    token = _current.set(active)
+    try:
+        yield active
+    except BaseException as e:
+        active.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        active.end()
+
+
+def in_current_context(fn):
+    """``fn`` bound to a copy of the caller's context, so pool threads continue the caller's trace.
+
+    A thread running ``fn`` is also sampled by the caller's request profile, if one is being taken.
+    """
+    context = contextvars.copy_context()
+
+    def call(*args, **kwargs):
+        with sampled_thread():
+            return fn(*args, **kwargs)
+
+    def run(*args, **kwargs):
+        return context.run(call, *args, **kwargs)
+    return run
+
+
+class TraceContextFilter(logging.Filter):
+    """Adds ``trace_id`` and ``span_id`` of the active span to every log record."""
+
+    def filter(self, record):
+        record.trace_id, record.span_id = current_ids()
+        return True
+
+
+def otlp_request(spans, service: str) -> dict:
+    """An OTLP/JSON ExportTraceServiceRequest holding ``spans``."""
+    return {'resourceSpans': [{
+        'resource': {'attributes': [_attribute('service.name', service)]},
+        'scopeSpans': [{'scope': {'name': 'tracing'}, 'spans': [s.to_otlp() for s in spans]}],
+    }]}
+
+
+class SpanExporter:
+    """Batches finished spans on a background thread and writes them as OTLP/JSON.
+
+    Request threads only enqueue; serialization and file or network I/O happen
+    on the exporter thread.
+    """
+
+    def __init__(self, path: str = None, endpoint: str = None, service: str = None):
+        self.path = path
+        self.endpoint = endpoint
+        self.service = service or _service_name
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def export(self, finished: Span):
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self, first=None):
+        batch = [] if first is None else [first]
+        while len(batch) < TRACE_BATCH_SIZE:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=TRACE_FLUSH_S)
+            except queue.Empty:
+                continue
+            # Let a page load's spans accumulate into one batch
+            time.sleep(min(TRACE_FLUSH_S, 0.1))
+            self._write(self._drain(first))
+
+    def flush(self):
+        batch = self._drain()
+        while batch:
+            self._write(batch)
+            batch = self._drain()
+
+    def _write(self, batch):
+        line = json.dumps(otlp_request(batch, self.service), separators=(',', ':'))
+        try:
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                with open(self.path, 'a') as f:
+                    f.write(line + '\n')
+            if self.endpoint:
+                request = urllib.request.Request(self.endpoint, data=line.encode(),
+                                                 headers={'Content-Type': 'application/json'})
+                urllib.request.urlopen(request, timeout=5).close()
+        except Exception:
+            logger.exception("Error exporting spans", extra={'spans': len(batch)})
+
+
+def _export(finished: Span):
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                path, endpoint = os.getenv("TRACE_FILE"), os.getenv("TRACE_ENDPOINT")
+                # False marks "checked, nothing configured" so later spans skip the lookup
+                _exporter = SpanExporter(path, endpoint) if path or endpoint else False
+    if _exporter:
+        _exporter.export(finished)
+
+
+def install_tracing(app, service: str = None):
+    """Trace every request of a Flask ``app`` as a server span, continuing an incoming ``traceparent``.
+
+    The span stays active until the last streamed byte, and its trace ID is
+    returned in the ``X-Trace-Id`` header.
+    """
+    global _service_name
+    request, g = flask_globals()
+
+    if service:
+        _service_name = service
+
+    @app.before_request
+    def start_request_span():
+        trace_id, parent_id = parse_traceparent(request.headers.get('traceparent'))
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        g.trace_span = start_span(f"{request.method} {route}", SPAN_KIND_SERVER, trace_id=trace_id,
+                                  parent_id=parent_id, **{'http.method': request.method, 'http.route': route,
+                                                          'http.target': request.full_path.rstrip('?')})
+        _current.set(g.trace_span)
+
+    @app.after_request
+    def finish_request_span(response):
+        request_span = g.get('trace_span')
+        if request_span is None:
+            return response
+        request_span.set(**{'http.status_code': response.status_code})
+        if response.status_code >= 500:
+            request_span.error = f"HTTP {response.status_code}"
+        response.headers['X-Trace-Id'] = request_span.trace_id
+
+        def finish():
+            request_span.end()
+            # Worker threads serve many requests; don't leave this one's span active
+            if _current.get() is request_span:
+                _current.set(None)
+        response.call_on_close(finish)
+        return response
+
+    return app
+
+
+def waterfall(path: str, trace_id: str = None, width: int = 60):
+    """Text waterfall of one trace from an OTLP/JSON lines file (the newest trace by default)."""
+    spans = []
+    with open(path) as f:
+        for line in f:
+            for resource in json.loads(line)['resourceSpans']:
+                for scope in resource['scopeSpans']:
+                    spans.extend(scope['spans'])
+    if trace_id is None and spans:
+        trace_id = max(spans, key=lambda s: int(s['startTimeUnixNano']))['traceId']
+    spans = [s for s in spans if s['traceId'] == trace_id]
+    if not spans:
+        return f"No spans for trace {trace_id}"
+    start = min(int(s['startTimeUnixNano']) for s in spans)
+    end = max(int(s['endTimeUnixNano']) for s in spans)
+    scale = width / max(end - start, 1)
+    children = {}
+    for s in spans:
+        children.setdefault(s.get('parentSpanId'), []).append(s)
+    ids = {s['spanId'] for s in spans}
+    roots = [s for s in spans if s.get('parentSpanId') not in ids]
+    lines = [f"trace {trace_id}  {(end - start) / 1e6:.1f} ms"]
+
+    def walk(s, depth):
+        lo = int((int(s['startTimeUnixNano']) - start) * scale)
+        hi = max(lo + 1, int((int(s['endTimeUnixNano']) - start) * scale))
+        duration = (int(s['endTimeUnixNano']) - int(s['startTimeUnixNano'])) / 1e6
+        thread = next((a['value']['stringValue'] for a in s['attributes'] if a['key'] == 'thread.name'), '')
+        label = ('  ' * depth + s['name'])[:40]
+        bar = ' ' * lo + ('!' if s['status'].get('code') == 2 else '#') * (hi - lo)
+        lines.append(f"{label:<40} {duration:9.1f} ms {thread:<12.12} |{bar:<{width}}|")
+        for child in sorted(children.get(s['spanId'], []), key=lambda c: int(c['startTimeUnixNano'])):
+            walk(child, depth + 1)
+
+    for root in sorted(roots, key=lambda r: int(r['startTimeUnixNano'])):
+        walk(root, 0)
+    return "\n".join(lines)
+
+
+def serve_collector(path: str, port: int = 4318):
+    """Minimal stand-in for an OTLP/HTTP collector: appends each POSTed JSON batch to ``path``."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            try:
+                line = json.dumps(json.loads(body), separators=(',', ':'))
+            except ValueError:
+                self.send_response(400)
+                self.end_headers()
+                return
+            with lock, open(path, 'a') as f:
+                f.write(line + '\n')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+        def log_message(self, *args):
+            pass
+
+    print(f"Collecting spans on http://localhost:{port}/v1/traces into {path}")
+    ThreadingHTTPServer(('localhost', port), Handler).serve_forever()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local trace collector and waterfall viewer")
+    commands = parser.add_subparsers(dest='command', required=True)
+    collect = commands.add_parser('collect', help="accept OTLP/JSON POSTs and append them to a file")
+    collect.add_argument('--port', type=int, default=4318)
+    collect.add_argument('--out', default='traces.jsonl')
+    show = commands.add_parser('show', help="print a trace from an OTLP/JSON lines file as a waterfall")
+    show.add_argument('path')
+    show.add_argument('--trace', help="trace ID (default: the newest trace)")
+    show.add_argument('--width', type=int, default=60)
+    args = parser.parse_args()
+    if args.command == 'collect':
+        serve_collector(args.out, args.port)
+    else:
+        print(waterfall(args.path, args.trace, args.width))
@@ -0,0 +1,42 @@
+import functools
+import html
+import logging
+
+
+def flask_globals():
+    """``(request, g)`` for the ``install_*(app)`` helpers.
+
+    Flask is imported on call, so modules offering such helpers stay
+    importable by non-Flask users (Streamlit, CLIs).
+    """
+    from flask import g, request
+    return request, g
+
+
+def json_errors(view):
+    """Log an exception escaping a JSON route and answer ``{"error": ...}`` with a 500.
+
+    Logged on the view module's logger, like the routes' own handlers.
+    """
+    logger = logging.getLogger(view.__module__)
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            return view(*args, **kwargs)
+        except Exception as e:
+            from flask import jsonify, request
+            logger.exception("Error serving %s", request.path)
+            return jsonify({'error': str(e)}), 500
+    return wrapper
+
+
+def render_placeholder(css_class, attribute, endpoint, **data):
+    """Empty element a page script finds by ``data-<attribute>`` and fills from ``endpoint``.
+
+    Extra ``data`` become further ``data-*`` attributes; ``None`` values are left out.
+    """
+    extra = ''.join(f' data-{name}="{html.escape(str(value))}"' for name, value in data.items() if value is not None)
+    return f"""
+        <div class="{css_class}" data-{attribute}="{html.escape(endpoint)}"{extra}></div>
+    """